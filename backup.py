@@ -0,0 +1,385 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class ErroBackup(Exception):
+    """Falha ao gerar, verificar ou restaurar um backup"""
+
+class BackupCancelado(ErroBackup):
+    """Backup interrompido a pedido do usuário"""
+
+def verificar_integridade(caminho):
+    """Executa PRAGMA integrity_check no arquivo e levanta ErroBackup se houver problemas"""
+    conn = sqlite3.connect(caminho)
+    try:
+        resultado = [linha[0] for linha in conn.execute('PRAGMA integrity_check')]
+    finally:
+        conn.close()
+    if resultado != ['ok']:
+        raise ErroBackup(f"Falha na verificação de integridade de {caminho}: {'; '.join(resultado[:5])}")
+
+def fazer_backup(origem, destino, paginas_por_etapa=256, pausa=0.005, progresso=None, cancelar=None):
+    """Copia um banco em uso para destino pela API de backup do SQLite.
+
+    origem pode ser um caminho ou uma sqlite3.Connection fora de transação.
+    A cópia é feita em etapas de paginas_por_etapa páginas; entre elas o
+    banco fica livre (mais pausa segundos) para que gravações não esperem.
+    progresso(copiadas, total) é chamado a cada etapa e cancelar é um
+    threading.Event opcional. O arquivo só substitui destino depois de
+    passar pelo integrity_check. Retorna o caminho do backup.
+    """
+    temporario = destino + '.tmp'
+    if os.path.exists(temporario):
+        os.remove(temporario)
+
+    conn_origem = sqlite3.connect(origem) if isinstance(origem, (str, os.PathLike)) else origem
+    conn_destino = sqlite3.connect(temporario)
+    inicio = time.perf_counter()
+    try:
+        def _etapa(status, restantes, total):
+            if cancelar is not None and cancelar.is_set():
+                raise BackupCancelado("Backup cancelado")
+            if progresso:
+                progresso(total - restantes, total)
+            if pausa:
+                time.sleep(pausa)
+
+        conn_origem.backup(conn_destino, pages=paginas_por_etapa, progress=_etapa)
+        # O backup herda o modo WAL da origem; volta a um arquivo único e autossuficiente
+        conn_destino.execute('PRAGMA journal_mode = DELETE')
+    except BaseException:
+        conn_destino.close()
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    finally:
+        if conn_origem is not origem:
+            conn_origem.close()
+    conn_destino.close()
+
+    try:
+        verificar_integridade(temporario)
+    except ErroBackup:
+        os.remove(temporario)
+        raise
+    os.replace(temporario, destino)
+
+    logger.info("Backup gerado em %s (%.2fs)", destino, time.perf_counter() - inicio)
+    return destino
+
+def _tamanho_pagina(cabecalho):
+    # Bytes 16-17 do cabeçalho do SQLite; o valor 1 representa 65536
+    valor = int.from_bytes(cabecalho[16:18], 'big')
+    return 65536 if valor == 1 else valor
+
+class RepositorioBackup:
+    """Repositório de backups incrementais, deduplicados e comprimidos.
+
+    Cada backup é um snapshot consistente (fazer_backup) dividido nas
+    páginas do SQLite. As páginas são guardadas uma única vez, comprimidas
+    e endereçadas pelo SHA-256 do conteúdo, em objetos.db; um novo backup
+    grava apenas as páginas que mudaram. manifesto.json lista os backups e
+    aponta, para cada um, o objeto com a sequência de hashes das páginas.
+    """
+
+    VERSAO_MANIFESTO = 1
+
+    def __init__(self, raiz, compressao='zlib', ultimos=5, horarios=24, diarios=7, semanais=4,
+                 espera_trava=300):
+        if compressao not in ('zlib', 'lzma'):
+            raise ValueError(f"Compressão desconhecida: {compressao}")
+        self.raiz = raiz
+        self.compressao = compressao
+        # Retenção: os N backups mais recentes e o mais recente de cada uma
+        # das últimas N horas, dias e semanas
+        self.ultimos = ultimos
+        self.horarios = horarios
+        self.diarios = diarios
+        self.semanais = semanais
+        # Segundos à espera de outro processo (programa ou linha de comando) liberar a pasta
+        self.espera_trava = espera_trava
+        os.makedirs(raiz, exist_ok=True)
+        self.caminho_manifesto = os.path.join(raiz, 'manifesto.json')
+        self.caminho_objetos = os.path.join(raiz, 'objetos.db')
+        self.caminho_trava = os.path.join(raiz, 'trava.db')
+
+    @contextmanager
+    def _travado(self):
+        """Exclusão mútua entre processos que usam a mesma pasta de backups"""
+        # Trava de arquivo do próprio SQLite: funciona igual no Windows e no Linux
+        # e é liberada pelo sistema se o processo morrer no meio
+        conn = sqlite3.connect(self.caminho_trava, timeout=self.espera_trava, isolation_level=None)
+        try:
+            try:
+                conn.execute('BEGIN EXCLUSIVE')
+            except sqlite3.OperationalError as e:
+                raise ErroBackup(f"Repositório de backups em uso por outro processo: {e}") from e
+            yield
+        finally:
+            conn.close()
+
+    # --- armazenamento de objetos
+
+    def _abrir_objetos(self):
+        conn = sqlite3.connect(self.caminho_objetos)
+        # auto_vacuum só vale se definido antes da criação das tabelas
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS objetos (
+                hash BLOB PRIMARY KEY,
+                metodo TEXT NOT NULL,
+                dados BLOB NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        return conn
+
+    def _comprimir(self, dados):
+        if self.compressao == 'lzma':
+            import lzma
+            return lzma.compress(dados, preset=6)
+        return zlib.compress(dados, 6)
+
+    @staticmethod
+    def _descomprimir(metodo, dados):
+        if metodo == 'lzma':
+            import lzma
+            return lzma.decompress(dados)
+        return zlib.decompress(dados)
+
+    def _gravar_objeto(self, conn, dados):
+        """Grava o objeto se ainda não existir; retorna (hash, bytes gravados)"""
+        digest = hashlib.sha256(dados).digest()
+        if conn.execute('SELECT 1 FROM objetos WHERE hash = ?', (digest,)).fetchone():
+            return digest, 0
+        comprimido = self._comprimir(dados)
+        conn.execute(
+            'INSERT INTO objetos (hash, metodo, dados) VALUES (?, ?, ?)',
+            (digest, self.compressao, comprimido)
+        )
+        return digest, len(comprimido)
+
+    def _ler_objeto(self, conn, digest):
+        linha = conn.execute('SELECT metodo, dados FROM objetos WHERE hash = ?', (digest,)).fetchone()
+        if linha is None:
+            raise ErroBackup(f"Objeto ausente no repositório: {digest.hex()}")
+        dados = self._descomprimir(*linha)
+        if hashlib.sha256(dados).digest() != digest:
+            raise ErroBackup(f"Objeto corrompido no repositório: {digest.hex()}")
+        return dados
+
+    # --- manifesto
+
+    def _ler_manifesto(self):
+        if not os.path.exists(self.caminho_manifesto):
+            return {'versao': self.VERSAO_MANIFESTO, 'backups': []}
+        with open(self.caminho_manifesto, encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+
+    def _gravar_manifesto(self, manifesto):
+        # Grava em arquivo temporário e troca de uma vez: nunca fica meio escrito
+        temporario = self.caminho_manifesto + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(manifesto, arquivo, ensure_ascii=False, indent=1)
+        os.replace(temporario, self.caminho_manifesto)
+
+    def listar_backups(self):
+        """Backups do manifesto, do mais recente para o mais antigo"""
+        return sorted(self._ler_manifesto()['backups'], key=lambda b: b['criado_em'], reverse=True)
+
+    def arquivos_importados(self):
+        """Nomes dos arquivos já levados ao repositório por importar_arquivo"""
+        manifesto = self._ler_manifesto()
+        # A lista fica fora de 'backups': a retenção não a apaga
+        importados = set(manifesto.get('importados', []))
+        importados.update(b['arquivo_origem'] for b in manifesto['backups'] if 'arquivo_origem' in b)
+        return importados
+
+    def ultimo_backup(self):
+        backups = self.listar_backups()
+        return backups[0] if backups else None
+
+    # --- criação
+
+    def criar_backup(self, origem, progresso=None, cancelar=None, **metadados):
+        """Gera um snapshot de origem e guarda só as páginas novas. Retorna a entrada do manifesto"""
+        # Nome único: outro processo pode estar gerando o seu snapshot na mesma pasta
+        descritor, temporario = tempfile.mkstemp(prefix='snapshot_', suffix='.db', dir=self.raiz)
+        os.close(descritor)
+        fazer_backup(origem, temporario, progresso=progresso, cancelar=cancelar)
+        try:
+            return self._armazenar_arquivo(temporario, datetime.now(), cancelar, metadados)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+    def importar_arquivo(self, caminho, **metadados):
+        """Importa um arquivo de banco já existente (ex.: backups antigos em .db)"""
+        verificar_integridade(caminho)
+        criado_em = datetime.fromtimestamp(os.path.getmtime(caminho))
+        metadados.setdefault('arquivo_origem', os.path.basename(caminho))
+        return self._armazenar_arquivo(caminho, criado_em, None, metadados)
+
+    def _armazenar_arquivo(self, caminho, criado_em, cancelar, metadados):
+        inicio = time.perf_counter()
+        tamanho = os.path.getsize(caminho)
+        digests = []
+        paginas_novas = 0
+        bytes_gravados = 0
+
+        # Objetos, manifesto e retenção numa só seção travada: a coleta de outro
+        # processo não pode apagar páginas gravadas antes de entrarem no manifesto
+        with self._travado():
+            conn = self._abrir_objetos()
+            try:
+                with conn, open(caminho, 'rb') as arquivo:
+                    cabecalho = arquivo.read(100)
+                    tamanho_pagina = _tamanho_pagina(cabecalho)
+                    arquivo.seek(0)
+                    while True:
+                        if cancelar is not None and cancelar.is_set():
+                            raise BackupCancelado("Backup cancelado")
+                        pagina = arquivo.read(tamanho_pagina)
+                        if not pagina:
+                            break
+                        digest, gravados = self._gravar_objeto(conn, pagina)
+                        digests.append(digest)
+                        if gravados:
+                            paginas_novas += 1
+                            bytes_gravados += gravados
+                    lista, gravados = self._gravar_objeto(conn, b''.join(digests))
+                    bytes_gravados += gravados
+            finally:
+                conn.close()
+
+            manifesto = self._ler_manifesto()
+            ids = {b['id'] for b in manifesto['backups']}
+            backup_id = criado_em.strftime('%Y%m%d_%H%M%S')
+            sufixo = 1
+            while backup_id in ids:
+                sufixo += 1
+                backup_id = f"{criado_em.strftime('%Y%m%d_%H%M%S')}_{sufixo}"
+
+            entrada = {
+                'id': backup_id,
+                'criado_em': criado_em.isoformat(timespec='seconds'),
+                'tamanho': tamanho,
+                'tamanho_pagina': tamanho_pagina,
+                'paginas': len(digests),
+                'paginas_novas': paginas_novas,
+                'bytes_gravados': bytes_gravados,
+                'lista_paginas': lista.hex(),
+            }
+            entrada.update(metadados)
+            manifesto['backups'].append(entrada)
+            origem = metadados.get('arquivo_origem')
+            if origem and origem not in manifesto.setdefault('importados', []):
+                manifesto['importados'].append(origem)
+            self._gravar_manifesto(manifesto)
+            logger.info(
+                "Backup %s: %d de %d páginas novas, %d bytes gravados (%.2fs)",
+                backup_id, paginas_novas, len(digests), bytes_gravados, time.perf_counter() - inicio
+            )
+
+            self._aplicar_retencao()
+        return entrada
+
+    # --- restauração
+
+    def restaurar_para_arquivo(self, backup_id, destino):
+        """Remonta o backup em destino (verificado com integrity_check)"""
+        temporario = destino + '.tmp'
+        # Travado: a retenção de outro processo não apaga objetos no meio da leitura
+        with self._travado():
+            entrada = next((b for b in self.listar_backups() if b['id'] == backup_id), None)
+            if entrada is None:
+                raise ErroBackup(f"Backup não encontrado: {backup_id}")
+            self._remontar(entrada, temporario)
+
+        try:
+            verificar_integridade(temporario)
+        except ErroBackup:
+            os.remove(temporario)
+            raise
+        os.replace(temporario, destino)
+        return destino
+
+    def _remontar(self, entrada, temporario):
+        conn = self._abrir_objetos()
+        try:
+            lista = self._ler_objeto(conn, bytes.fromhex(entrada['lista_paginas']))
+            with open(temporario, 'wb') as arquivo:
+                for posicao in range(0, len(lista), 32):
+                    arquivo.write(self._ler_objeto(conn, lista[posicao:posicao + 32]))
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        finally:
+            conn.close()
+
+    # --- retenção
+
+    def _selecionar_retidos(self, backups):
+        """Ids a manter: os últimos e o mais recente de cada uma das últimas horas, dias e semanas"""
+        ordenados = sorted(backups, key=lambda b: b['criado_em'], reverse=True)
+        manter = {backup['id'] for backup in ordenados[:max(self.ultimos, 1)]}
+        for formato, quantidade in (('%Y-%m-%d %H', self.horarios),
+                                    ('%Y-%m-%d', self.diarios),
+                                    ('%G-%V', self.semanais)):
+            periodos = set()
+            for backup in ordenados:
+                periodo = datetime.fromisoformat(backup['criado_em']).strftime(formato)
+                if periodo in periodos:
+                    continue
+                if len(periodos) >= quantidade:
+                    break
+                periodos.add(periodo)
+                manter.add(backup['id'])
+        return manter
+
+    def aplicar_retencao(self):
+        """Remove do manifesto os backups fora da retenção e apaga objetos sem referência"""
+        with self._travado():
+            return self._aplicar_retencao()
+
+    def _aplicar_retencao(self):
+        manifesto = self._ler_manifesto()
+        manter = self._selecionar_retidos(manifesto['backups'])
+        removidos = [b['id'] for b in manifesto['backups'] if b['id'] not in manter]
+        if removidos:
+            manifesto['backups'] = [b for b in manifesto['backups'] if b['id'] in manter]
+            self._gravar_manifesto(manifesto)
+            # Só há objetos a liberar quando algum backup saiu do manifesto
+            self._coletar_objetos(manifesto['backups'])
+        return removidos
+
+    def _coletar_objetos(self, backups):
+        conn = self._abrir_objetos()
+        try:
+            with conn:
+                conn.execute('CREATE TEMP TABLE IF NOT EXISTS referenciados (hash BLOB PRIMARY KEY)')
+                conn.execute('DELETE FROM referenciados')
+                for backup in backups:
+                    lista_hash = bytes.fromhex(backup['lista_paginas'])
+                    lista = self._ler_objeto(conn, lista_hash)
+                    conn.execute('INSERT OR IGNORE INTO referenciados VALUES (?)', (lista_hash,))
+                    conn.executemany(
+                        'INSERT OR IGNORE INTO referenciados VALUES (?)',
+                        ((lista[posicao:posicao + 32],) for posicao in range(0, len(lista), 32))
+                    )
+                apagados = conn.execute(
+                    'DELETE FROM objetos WHERE hash NOT IN (SELECT hash FROM referenciados)'
+                ).rowcount
+            if apagados:
+                conn.execute('PRAGMA incremental_vacuum')
+        finally:
+            conn.close()
@@ -0,0 +1,199 @@
+"""Benchmarks do DatabaseManager com bancos gerados (gerador.py).
+
+Uso:
+    python benchmarks/bench_banco.py --tamanhos 10000 100000 1000000
+
+Cada operação roda sobre uma cópia do banco gerado, para que inclusões e
+exclusões de uma medição não afetem a seguinte. O resultado vai para
+benchmarks/resultados/banco_<data>_<commit>.json; compare duas execuções
+com benchmarks/comparar.py.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRETORIO))
+
+from gerador import gerar_banco, gerar_produtos
+from database import DatabaseManager, STATUS_NORMAL, STATUS_PROXIMO_VENCIMENTO, STATUS_VENCIDO
+
+TERMOS_BUSCA = ("luva", "dch 013", "3m", "protetor auricular")
+
+def cronometrar(funcao, repeticoes=5, preparar=None):
+    """Tempos de funcao() em ms; preparar() roda antes de cada repetição, fora da medição"""
+    tempos = []
+    for _ in range(repeticoes):
+        argumento = preparar() if preparar else None
+        inicio = time.perf_counter()
+        funcao(argumento) if preparar else funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        'repeticoes': repeticoes,
+        'min_ms': round(min(tempos), 3),
+        'mediana_ms': round(statistics.median(tempos), 3),
+        'max_ms': round(max(tempos), 3),
+    }
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRETORIO,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Bancada:
+    """Banco gerado para um tamanho e cópias de trabalho descartáveis"""
+
+    def __init__(self, pasta, quantidade, semente):
+        self.pasta = pasta
+        self.quantidade = quantidade
+        self.semente = semente
+        self.base = os.path.join(pasta, f'produtos_{quantidade}_{semente}.db')
+        self.trabalho = os.path.join(pasta, 'trabalho.db')
+        # Reaproveitado entre execuções: mesma semente, mesmos dados
+        if not os.path.exists(self.base):
+            print(f"  gerando {quantidade} produtos...", flush=True)
+            gerar_banco(self.base, quantidade, semente)
+
+    def copia(self):
+        for sufixo in ('-wal', '-shm'):
+            if os.path.exists(self.trabalho + sufixo):
+                os.remove(self.trabalho + sufixo)
+        shutil.copyfile(self.base, self.trabalho)
+        return DatabaseManager(self.trabalho)
+
+    def ids_aleatorios(self, quantidade, semente):
+        aleatorio = random.Random(semente)
+        return aleatorio.sample(range(1, self.quantidade + 1), min(quantidade, self.quantidade))
+
+def medir_tamanho(bancada, operacoes, repeticoes):
+    resultados = {}
+
+    def registrar(nome, medicao, itens=None):
+        if itens:
+            medicao['itens'] = itens
+            medicao['us_por_item'] = round(medicao['mediana_ms'] * 1000 / itens, 3)
+        resultados[nome] = medicao
+        print(f"  {nome:<32} {medicao['mediana_ms']:>10.2f} ms", flush=True)
+
+    # Inclusão em lote num banco vazio (gera as linhas antes de medir)
+    linhas = list(gerar_produtos(bancada.quantidade, bancada.semente + 1))
+    vazio = os.path.join(bancada.pasta, 'vazio.db')
+
+    def banco_vazio():
+        for sufixo in ('', '-wal', '-shm'):
+            if os.path.exists(vazio + sufixo):
+                os.remove(vazio + sufixo)
+        return DatabaseManager(vazio), linhas
+
+    def inserir_em_lote(preparado):
+        db, produtos = preparado
+        db.adicionar_produtos_em_lote(produtos)
+        db.fechar()
+
+    registrar('inserir_em_lote', cronometrar(
+        inserir_em_lote, repeticoes=1, preparar=banco_vazio
+    ), bancada.quantidade)
+
+    db = bancada.copia()
+    try:
+        novos = list(gerar_produtos(operacoes, bancada.semente + 2))
+        registrar('inserir', cronometrar(
+            lambda: [db.adicionar_produto(*produto) for produto in novos], repeticoes=1
+        ), operacoes)
+
+        registrar('carregar_frio', cronometrar(
+            lambda _: db.carregar_produtos(), repeticoes, preparar=db.cache.invalidar
+        ), bancada.quantidade)
+        registrar('carregar_quente', cronometrar(db.carregar_produtos, repeticoes), bancada.quantidade)
+        registrar('carregar_paginado_frio', cronometrar(
+            lambda _: sum(1 for _ in db.iterar_produtos()), repeticoes, preparar=db.cache.invalidar
+        ), bancada.quantidade)
+        registrar('carregar_paginado_quente', cronometrar(
+            lambda: sum(1 for _ in db.iterar_produtos()), repeticoes
+        ), bancada.quantidade)
+        registrar('contar_por_status_frio', cronometrar(
+            lambda _: db.contar_por_status(), repeticoes, preparar=db.cache.invalidar
+        ))
+        registrar('contar_por_status_quente', cronometrar(db.contar_por_status, repeticoes))
+
+        for status in (STATUS_NORMAL, STATUS_PROXIMO_VENCIMENTO, STATUS_VENCIDO):
+            chave = status.lower().replace(' do ', '_').replace(' ', '_').replace('ó', 'o')
+            registrar(f'filtrar_status_{chave}', cronometrar(
+                lambda status=status: db.consultar_produtos(status=status), repeticoes
+            ))
+        for termo in TERMOS_BUSCA:
+            registrar(f"buscar_{termo.replace(' ', '_')}", cronometrar(
+                lambda termo=termo: db.buscar_produtos(termo, limite=None), repeticoes
+            ))
+
+        alterados = bancada.ids_aleatorios(operacoes, bancada.semente + 3)
+        registrar('atualizar', cronometrar(
+            lambda: [
+                db.atualizar_produto(produto_id, f"ITEM {produto_id}", "LT-001", 1234, 10,
+                                     "01/01/2024", "01/12/2023", "01/01/2027")
+                for produto_id in alterados
+            ], repeticoes=1
+        ), len(alterados))
+
+        excluidos = bancada.ids_aleatorios(operacoes, bancada.semente + 4)
+        registrar('excluir', cronometrar(
+            lambda: [db.excluir_produto(produto_id) for produto_id in excluidos], repeticoes=1
+        ), len(excluidos))
+    finally:
+        db.fechar()
+    return resultados
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do DatabaseManager")
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--operacoes', type=int, default=200,
+                        help="inclusões, edições e exclusões individuais por tamanho")
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--dados', help="pasta dos bancos gerados (padrão: pasta temporária reaproveitada)")
+    parser.add_argument('--saida', default=os.path.join(DIRETORIO, 'resultados'))
+    args = parser.parse_args(argv)
+
+    pasta_dados = args.dados or os.path.join(tempfile.gettempdir(), 'torp_benchmarks')
+    os.makedirs(pasta_dados, exist_ok=True)
+    os.makedirs(args.saida, exist_ok=True)
+
+    commit = commit_atual()
+    relatorio = {
+        'suite': 'banco',
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+        'semente': args.semente,
+        'resultados': {},
+    }
+    for quantidade in args.tamanhos:
+        print(f"{quantidade} produtos", flush=True)
+        bancada = Bancada(pasta_dados, quantidade, args.semente)
+        relatorio['resultados'][str(quantidade)] = medir_tamanho(bancada, args.operacoes, args.repeticoes)
+
+    nome = f"banco_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit or 'sem-commit'}.json"
+    caminho = os.path.join(args.saida, nome)
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=1)
+    print(f"Resultados gravados em {caminho}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
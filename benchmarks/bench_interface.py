@@ -0,0 +1,263 @@
+"""Benchmarks da janela principal com Qt offscreen (sem display).
+
+Uso:
+    python benchmarks/bench_interface.py --tamanhos 10000 100000
+
+Abre a MainWindow sobre bancos gerados (gerador.py) e mede, do pedido
+até a tabela pronta: carga inicial, recarga, filtros por nome, lote e
+status, busca e exportação. Para cada operação grava o tempo (mínimo,
+mediana e máximo), o pico de memória Python (tracemalloc, numa execução
+à parte para não distorcer o tempo) e o pico de memória do processo. O
+JSON tem o mesmo formato de bench_banco.py e pode ser comparado com
+benchmarks/comparar.py.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRETORIO))
+
+from PyQt5.QtCore import QEventLoop, QSettings, QT_VERSION_STR
+from PyQt5.QtWidgets import QApplication
+
+from bench_banco import Bancada, commit_atual
+from database import STATUS_NORMAL, STATUS_PROXIMO_VENCIMENTO, STATUS_VENCIDO
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TERMOS_BUSCA = ("luva", "dch 013")
+FORMATOS_EXPORTACAO = ("csv", "excel", "pdf")
+
+def pico_rss_kb():
+    """Maior memória residente do processo até agora (None se indisponível)"""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB, macOS em bytes
+    return pico // 1024 if sys.platform == 'darwin' else pico
+
+def esperar(condicao, timeout=300):
+    """Processa eventos do Qt até condicao() ser verdadeira"""
+    limite = time.perf_counter() + timeout
+    while not condicao():
+        if time.perf_counter() > limite:
+            raise TimeoutError("Operação não terminou no tempo limite")
+        QApplication.processEvents(QEventLoop.AllEvents, 10)
+        # Libera o GIL para a thread do banco
+        time.sleep(0.0005)
+
+class Medidor:
+    def __init__(self, repeticoes):
+        self.repeticoes = repeticoes
+        self.resultados = {}
+
+    def medir(self, nome, operacao, preparar=None):
+        """operacao() dispara a ação e devolve a condição de término"""
+        tempos = []
+        try:
+            for _ in range(self.repeticoes):
+                if preparar:
+                    preparar()
+                inicio = time.perf_counter()
+                esperar(operacao())
+                tempos.append((time.perf_counter() - inicio) * 1000)
+
+            # Memória numa execução separada: tracemalloc deixa tudo mais lento
+            if preparar:
+                preparar()
+            tracemalloc.start()
+            esperar(operacao())
+            _atual, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        except Exception as e:
+            tracemalloc.stop()
+            self.resultados[nome] = {'erro': str(e)}
+            print(f"  {nome:<32} erro: {e}", flush=True)
+            return
+        self.resultados[nome] = {
+            'repeticoes': self.repeticoes,
+            'min_ms': round(min(tempos), 3),
+            'mediana_ms': round(statistics.median(tempos), 3),
+            'max_ms': round(max(tempos), 3),
+            'pico_python_kb': pico // 1024,
+            'pico_rss_kb': pico_rss_kb(),
+        }
+        print(f"  {nome:<32} {self.resultados[nome]['mediana_ms']:>10.2f} ms "
+              f"{pico // 1024:>10} KiB", flush=True)
+
+def tabela_pronta(janela):
+    def pronta():
+        if janela._carregando or janela.worker.ocupado('tabela'):
+            return False
+        # Com filtro, a janela ainda pode pedir páginas para preencher a área visível
+        QApplication.processEvents()
+        return not janela.worker.ocupado('tabela')
+    return pronta
+
+def definir_filtro(janela, campo, texto):
+    """Como a digitação, mas sem esperar o intervalo do timer dos filtros"""
+    campo.setText(texto)
+    janela.apply_filters()
+
+def limpar_filtros(janela):
+    for campo in (janela.nome_filter, janela.lote_filter, janela.search_input):
+        campo.blockSignals(True)
+        campo.clear()
+        campo.blockSignals(False)
+    janela.status_filter_combo.blockSignals(True)
+    janela.status_filter_combo.setCurrentText("Todos")
+    janela.status_filter_combo.blockSignals(False)
+    janela.apply_filters()
+    janela.search_produtos()
+    esperar(tabela_pronta(janela))
+
+def medir_tamanho(bancada, repeticoes, pasta):
+    from interface import MainWindow
+
+    medidor = Medidor(repeticoes)
+    db = bancada.copia()
+    janelas = []
+
+    def abrir():
+        if janelas:
+            janelas.pop().close()
+        janela = MainWindow(banco=db, pasta_backups=os.path.join(pasta, 'backups'))
+        janela.show()
+        janelas.append(janela)
+        return lambda: janela.modelo.rowCount() > 0
+
+    try:
+        def abrir_completa():
+            abrir()
+            return tabela_pronta(janelas[-1])
+        medidor.medir('abrir_ate_primeira_pagina', abrir)
+        medidor.medir('abrir_ate_carga_completa', abrir_completa)
+        janela = janelas[-1]
+        esperar(tabela_pronta(janela))
+
+        def recarregar():
+            janela.carregar_produtos()
+            return tabela_pronta(janela)
+        medidor.medir('recarregar', recarregar)
+
+        def filtrar(campo, texto):
+            def operacao():
+                definir_filtro(janela, campo, texto)
+                return tabela_pronta(janela)
+            return operacao
+        medidor.medir('filtro_nome', filtrar(janela.nome_filter, "LUVA"), lambda: limpar_filtros(janela))
+        medidor.medir('filtro_lote', filtrar(janela.lote_filter, "DCH"), lambda: limpar_filtros(janela))
+
+        for status in (STATUS_NORMAL, STATUS_PROXIMO_VENCIMENTO, STATUS_VENCIDO):
+            def filtrar_status(status=status):
+                janela.status_filter_combo.setCurrentText(status)
+                return tabela_pronta(janela)
+            chave = status.lower().replace(' do ', '_').replace(' ', '_').replace('ó', 'o')
+            medidor.medir(f'filtro_status_{chave}', filtrar_status, lambda: limpar_filtros(janela))
+
+        def filtrado_por_nome():
+            limpar_filtros(janela)
+            definir_filtro(janela, janela.nome_filter, "LUVA")
+            esperar(tabela_pronta(janela))
+
+        def limpar():
+            definir_filtro(janela, janela.nome_filter, "")
+            return tabela_pronta(janela)
+        medidor.medir('limpar_filtros', limpar, filtrado_por_nome)
+
+        limpar_filtros(janela)
+        for termo in TERMOS_BUSCA:
+            def buscar(termo=termo):
+                janela.search_input.setText(termo)
+                janela.search_produtos()
+                return lambda: not janela.worker.ocupado('busca') and tabela_pronta(janela)()
+            medidor.medir(f"busca_{termo.replace(' ', '_')}", buscar)
+        janela.search_input.clear()
+        janela.search_produtos()
+
+        for formato in FORMATOS_EXPORTACAO:
+            arquivo = os.path.join(pasta, f"relatorio.{'xlsx' if formato == 'excel' else formato}")
+
+            def exportar(formato=formato, arquivo=arquivo):
+                estado = {}
+
+                def falhou(erro):
+                    estado['erro'] = erro
+                janela.exportar_relatorio(
+                    formato, arquivo,
+                    ao_concluir=lambda _arquivo: estado.setdefault('ok', True),
+                    ao_falhar=falhou
+                )
+
+                def terminou():
+                    if 'erro' in estado:
+                        raise estado['erro']
+                    return 'ok' in estado
+                return terminou
+            medidor.medir(f'exportar_{formato}', exportar)
+    finally:
+        for janela in janelas:
+            janela.close()
+        db.fechar()
+    return medidor.resultados
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks da interface com Qt offscreen")
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--dados', help="pasta dos bancos gerados (padrão: pasta temporária reaproveitada)")
+    parser.add_argument('--saida', default=os.path.join(DIRETORIO, 'resultados'))
+    args = parser.parse_args(argv)
+
+    pasta_dados = args.dados or os.path.join(tempfile.gettempdir(), 'torp_benchmarks')
+    os.makedirs(pasta_dados, exist_ok=True)
+    os.makedirs(args.saida, exist_ok=True)
+    pasta_trabalho = tempfile.mkdtemp(prefix='torp_interface_')
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    # Configurações e larguras de coluna gravadas numa pasta temporária
+    for formato in (QSettings.NativeFormat, QSettings.IniFormat):
+        QSettings.setPath(formato, QSettings.UserScope, pasta_trabalho)
+    configuracoes = QSettings('TorpEPI', 'Sistema de Controle')
+    configuracoes.setValue('email/avisos_ativos', False)
+    configuracoes.sync()
+
+    commit = commit_atual()
+    relatorio = {
+        'suite': 'interface',
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'qt': QT_VERSION_STR,
+        'plataforma': platform.platform(),
+        'semente': args.semente,
+        'resultados': {},
+    }
+    for quantidade in args.tamanhos:
+        print(f"{quantidade} produtos", flush=True)
+        bancada = Bancada(pasta_dados, quantidade, args.semente)
+        relatorio['resultados'][str(quantidade)] = medir_tamanho(bancada, args.repeticoes, pasta_trabalho)
+
+    nome = f"interface_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit or 'sem-commit'}.json"
+    caminho = os.path.join(args.saida, nome)
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=1)
+    print(f"Resultados gravados em {caminho}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""Compara dois resultados de benchmark (JSON gravado por bench_banco.py ou bench_interface.py).
+
+Uso:
+    python benchmarks/comparar.py antes.json depois.json [--limite 10] [--falhar]
+
+Mostra a mediana de cada medição nas duas execuções e a variação; com
+--falhar, sai com código 1 se alguma ficou mais lenta que o limite (%).
+"""
+import argparse
+import json
+import sys
+
+def carregar(caminho):
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara dois resultados de benchmark")
+    parser.add_argument('antes')
+    parser.add_argument('depois')
+    parser.add_argument('--limite', type=float, default=10.0, help="piora tolerada, em %% (padrão: 10)")
+    parser.add_argument('--falhar', action='store_true', help="código de saída 1 se houver piora")
+    args = parser.parse_args(argv)
+
+    antes, depois = carregar(args.antes), carregar(args.depois)
+    print(f"antes:  {antes.get('commit')} ({antes.get('data')})")
+    print(f"depois: {depois.get('commit')} ({depois.get('data')})")
+
+    pioras = 0
+    for tamanho, medicoes in depois['resultados'].items():
+        anteriores = antes['resultados'].get(tamanho, {})
+        print(f"\n{tamanho}")
+        for nome, medicao in medicoes.items():
+            if 'erro' in medicao:
+                print(f"  {nome:<32} erro: {medicao['erro']}")
+                continue
+            atual = medicao['mediana_ms']
+            anterior = anteriores.get(nome, {}).get('mediana_ms')
+            if anterior is None:
+                print(f"  {nome:<32} {'-':>10} {atual:>10.2f} ms")
+                continue
+            variacao = (atual - anterior) / anterior * 100 if anterior else 0.0
+            marca = ''
+            if variacao > args.limite:
+                marca = '  <-- piorou'
+                pioras += 1
+            print(f"  {nome:<32} {anterior:>10.2f} {atual:>10.2f} ms {variacao:+7.1f}%{marca}")
+
+    return 1 if args.falhar and pioras else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Gerador de produtos sintéticos, reproduzível pela semente.
+
+Os lotes imitam os cadastrados na empresa: itens de EPI com variações de
+tamanho e marca, CA compartilhado pelo mesmo item, datas de compra nos
+últimos anos e validades espalhadas (vencidos, próximos do vencimento e
+normais).
+"""
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ITENS = [
+    # (nome, vida útil mínima e máxima em dias a partir da fabricação)
+    ("LUVA NITRÍLICA", 730, 1825),
+    ("LUVA DE VAQUETA", 730, 1460),
+    ("LUVA ANTICORTE", 1095, 1825),
+    ("CAPACETE DE SEGURANÇA", 1095, 1825),
+    ("ÓCULOS PROTEÇÃO INDIVIDUAL", 730, 1825),
+    ("PROTETOR AURICULAR PLUG", 365, 1095),
+    ("PROTETOR AURICULAR CONCHA", 730, 1460),
+    ("MÁSCARA PFF2", 365, 1095),
+    ("RESPIRADOR SEMIFACIAL", 1095, 1825),
+    ("FILTRO QUÍMICO", 365, 1095),
+    ("BOTA DE SEGURANÇA", 730, 1460),
+    ("BOTINA COM BICO DE AÇO", 730, 1460),
+    ("AVENTAL DE PVC", 365, 1095),
+    ("CINTO PARAQUEDISTA", 1460, 1825),
+    ("TALABARTE DUPLO", 1460, 1825),
+    ("CREME PROTETOR", 180, 730),
+    ("MANGOTE DE RASPA", 730, 1460),
+    ("PROTETOR FACIAL", 730, 1825),
+]
+VARIACOES = ["", "P", "M", "G", "GG", "HASTE PRETA", "INCOLOR", "FUMÊ", "CANO LONGO", "TAM 40", "TAM 42"]
+MARCAS = ["3M", "DANNY", "VOLK", "KALIPSO", "MARLUVAS", "PLASTCOR", "DELTA PLUS", "STEELFLEX"]
+PREFIXOS_LOTE = ["DCH", "LT", "L", "FAB", "NF"]
+
+def gerar_produtos(quantidade, semente=42, hoje=None):
+    """Gera quantidade tuplas na ordem de CAMPOS_CADASTRO, com datas em dd/mm/aaaa"""
+    aleatorio = random.Random(semente)
+    hoje = hoje or date.today()
+    # Cada combinação item/marca tem o seu CA
+    cas = {}
+    for _ in range(quantidade):
+        nome_base, vida_minima, vida_maxima = aleatorio.choice(ITENS)
+        marca = aleatorio.choice(MARCAS)
+        variacao = aleatorio.choice(VARIACOES)
+        nome = " ".join(parte for parte in (nome_base, variacao, marca) if parte)
+        ca = cas.setdefault((nome_base, marca), aleatorio.randint(5000, 45000))
+
+        compra = hoje - timedelta(days=aleatorio.randint(0, 3 * 365))
+        fabricacao = compra - timedelta(days=aleatorio.randint(15, 240))
+        validade = fabricacao + timedelta(days=aleatorio.randint(vida_minima, vida_maxima))
+        lote = (
+            f"{aleatorio.choice(PREFIXOS_LOTE)}-{aleatorio.randint(1, 999):03d} "
+            f"{fabricacao.strftime('%d %m %Y')}"
+        )
+        # Alguns cadastros antigos não têm as datas de compra e fabricação
+        sem_datas = aleatorio.random() < 0.05
+        yield (
+            nome, lote, ca, aleatorio.choice((1, 2, 5, 10, 12, 20, 50, 100, 200)),
+            None if sem_datas else compra.strftime('%d/%m/%Y'),
+            None if sem_datas else fabricacao.strftime('%d/%m/%Y'),
+            validade.strftime('%d/%m/%Y'),
+        )
+
+def gerar_banco(caminho, quantidade, semente=42):
+    """Cria em caminho um banco novo com quantidade produtos gerados"""
+    from database import DatabaseManager
+
+    for sufixo in ('', '-wal', '-shm'):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)
+    db = DatabaseManager(caminho)
+    inseridos, erros = db.adicionar_produtos_em_lote(gerar_produtos(quantidade, semente))
+    if erros:
+        raise ValueError(f"{len(erros)} produto(s) gerado(s) inválido(s): {erros[:3]}")
+    db.conexao().execute('ANALYZE')
+    # Fecha as conexões para que o arquivo possa ser copiado sem o WAL
+    db.fechar()
+    return caminho
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gera um banco com produtos sintéticos")
+    parser.add_argument('caminho')
+    parser.add_argument('quantidade', type=int)
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+    gerar_banco(args.caminho, args.quantidade, args.semente)
+    print(f"{args.quantidade} produtos gerados em {args.caminho}")
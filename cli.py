@@ -0,0 +1,156 @@
+"""Operações em lote pela linha de comando, sem interface gráfica.
+
+Este módulo não importa PyQt5: pode rodar em servidores sem display
+(ex.: tarefas agendadas no cron). Uso: python main.py <comando> [opções].
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+
+import backup
+import database
+from database import CAMPOS_CADASTRO, COLUNAS_PRODUTOS, STATUS_NORMAL, STATUS_PROXIMO_VENCIMENTO, STATUS_VENCIDO
+
+STATUS = (STATUS_NORMAL, STATUS_PROXIMO_VENCIMENTO, STATUS_VENCIDO)
+
+def _pasta_backups_padrao():
+    # A mesma pasta usada pela interface (MainWindow.backup_folder)
+    base = os.getenv('APPDATA') or os.path.expanduser('~')
+    return os.path.join(base, 'TorpControl', 'backups', 'repositorio')
+
+def _abrir_banco(args):
+    if args.banco:
+        return database.DatabaseManager(args.banco)
+    return database.get_db()
+
+def _produtos(db, status):
+    if status:
+        return db.consultar_produtos(status=status)
+    return db.iterar_produtos()
+
+def _linha_csv(linha):
+    # Nomes de coluna sem diferença de maiúsculas; células vazias viram None
+    return {
+        campo.strip().lower(): (valor or '').strip() or None
+        for campo, valor in linha.items() if campo
+    }
+
+def comando_importar(args):
+    db = _abrir_banco(args)
+    with open(args.arquivo, newline='', encoding=args.codificacao) as arquivo:
+        amostra = arquivo.read(4096)
+        arquivo.seek(0)
+        separador = args.separador or csv.Sniffer().sniff(amostra, delimiters=',;\t').delimiter
+        leitor = csv.DictReader(arquivo, delimiter=separador)
+        faltando = set(CAMPOS_CADASTRO) - {campo.strip().lower() for campo in leitor.fieldnames or []}
+        if faltando - {'data_compra', 'data_fabricacao'}:
+            print(f"Colunas obrigatórias ausentes: {', '.join(sorted(faltando))}", file=sys.stderr)
+            return 2
+        inseridos, erros = db.adicionar_produtos_em_lote(_linha_csv(linha) for linha in leitor)
+
+    for indice, mensagem in erros:
+        # +2: cabeçalho e numeração a partir de 1
+        print(f"Linha {indice + 2}: {mensagem}", file=sys.stderr)
+    print(f"{inseridos} produto(s) importado(s), {len(erros)} erro(s)")
+    return 1 if erros else 0
+
+def comando_exportar(args):
+    db = _abrir_banco(args)
+    total = 0
+    with open(args.arquivo, 'w', newline='', encoding=args.codificacao) as arquivo:
+        escritor = csv.writer(arquivo, delimiter=args.separador)
+        escritor.writerow(COLUNAS_PRODUTOS)
+        for produto in _produtos(db, args.status):
+            escritor.writerow(produto)
+            total += 1
+    print(f"{total} produto(s) exportado(s) para {args.arquivo}")
+    return 0
+
+def comando_relatorio(args):
+    from relatorios import CABECALHOS, formatar_linha, gravar_relatorio
+
+    db = _abrir_banco(args)
+    formato = args.formato or os.path.splitext(args.arquivo)[1].lstrip('.').lower()
+    if formato not in ('pdf', 'csv', 'xlsx'):
+        print(f"Formato de relatório desconhecido: {formato!r} (use pdf, csv ou xlsx)", file=sys.stderr)
+        return 2
+    dados = [formatar_linha(produto) for produto in _produtos(db, args.status)]
+    gravar_relatorio(formato, args.arquivo, CABECALHOS, dados)
+    print(f"Relatório com {len(dados)} produto(s) gravado em {args.arquivo}")
+    return 0
+
+def comando_backup(args):
+    db = _abrir_banco(args)
+    if args.arquivo:
+        db.fazer_backup(args.arquivo)
+        print(f"Backup gravado em {args.arquivo}")
+        return 0
+    repositorio = backup.RepositorioBackup(args.repositorio or _pasta_backups_padrao())
+    entrada = db.backup_incremental(repositorio, tipo='linha de comando')
+    print(
+        f"Backup {entrada['id']}: {entrada['paginas_novas']} de {entrada['paginas']} páginas novas, "
+        f"{entrada['bytes_gravados'] / 1024:.0f} KB gravados em {repositorio.raiz}"
+    )
+    return 0
+
+def comando_recalcular_status(args):
+    db = _abrir_banco(args)
+    atualizadas = db.recalcular_status_gravado()
+    if atualizadas is None:
+        return 1
+    print(f"{atualizadas} produto(s) com status atualizado")
+    return 0
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog='main.py', description="Sistema de Controle de EPI - operações em lote"
+    )
+    parser.add_argument('--banco', help="arquivo do banco de dados (padrão: database.db do programa)")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    importar = comandos.add_parser('importar', help="importa produtos de um arquivo CSV")
+    importar.add_argument('arquivo')
+    importar.add_argument('--separador', help="separador de campos (padrão: detectado)")
+    importar.add_argument('--codificacao', default='utf-8-sig')
+    importar.set_defaults(funcao=comando_importar)
+
+    exportar = comandos.add_parser('exportar', help="exporta os produtos para CSV")
+    exportar.add_argument('arquivo')
+    exportar.add_argument('--status', choices=STATUS)
+    exportar.add_argument('--separador', default=',')
+    exportar.add_argument('--codificacao', default='utf-8')
+    exportar.set_defaults(funcao=comando_exportar)
+
+    relatorio = comandos.add_parser('relatorio', help="gera o relatório de produtos (pdf, csv ou xlsx)")
+    relatorio.add_argument('arquivo')
+    relatorio.add_argument('--formato', choices=('pdf', 'csv', 'xlsx'), help="padrão: extensão do arquivo")
+    relatorio.add_argument('--status', choices=STATUS)
+    relatorio.set_defaults(funcao=comando_relatorio)
+
+    fazer_backup = comandos.add_parser('backup', help="faz backup do banco de dados")
+    fazer_backup.add_argument('--repositorio', help="pasta do repositório de backups (padrão: a da interface)")
+    fazer_backup.add_argument('--arquivo', help="grava uma cópia completa neste arquivo em vez do repositório")
+    fazer_backup.set_defaults(funcao=comando_backup)
+
+    recalcular = comandos.add_parser(
+        'recalcular-status', help="atualiza as colunas dias_restantes e status gravadas na tabela"
+    )
+    recalcular.set_defaults(funcao=comando_recalcular_status)
+    return parser
+
+def main(argv=None):
+    """Executa o comando e retorna o código de saída do processo"""
+    args = criar_parser().parse_args(argv)
+    inicio = time.perf_counter()
+    try:
+        return args.funcao(args)
+    except Exception as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    finally:
+        print(f"Concluído em {time.perf_counter() - inicio:.2f}s", file=sys.stderr)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,648 @@
+import bisect
 import os
+import re
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import atexit
+import logging
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
 import sys
+import backup
+import instrumentacao
+
+logger = logging.getLogger(__name__)
+
+# Status de validade, calculados no momento da leitura a partir de data_validade
+STATUS_NORMAL = "Normal"
+STATUS_PROXIMO_VENCIMENTO = "Próximo do Vencimento"
+STATUS_VENCIDO = "Vencido"
+DIAS_AVISO_VENCIMENTO = 30
+
+# Expressões SQL de "hoje" no fuso local, avaliadas uma vez por instrução
+SQL_HOJE = "date('now', 'localtime')"
+SQL_LIMITE_AVISO = f"date('now', 'localtime', '+{DIAS_AVISO_VENCIMENTO} days')"
+
+def condicao_status(status):
+    """Condição SQL por faixa de data_validade (usa idx_produtos_data_validade)"""
+    if status == STATUS_VENCIDO:
+        return f"data_validade < {SQL_HOJE}"
+    if status == STATUS_PROXIMO_VENCIMENTO:
+        return f"data_validade BETWEEN {SQL_HOJE} AND {SQL_LIMITE_AVISO}"
+    if status == STATUS_NORMAL:
+        return f"(data_validade > {SQL_LIMITE_AVISO} OR data_validade IS NULL)"
+    raise ValueError(f"Status desconhecido: {status}")
+
+@lru_cache(maxsize=8192)
+def _data_para_iso(texto):
+    # Lotes costumam repetir as mesmas datas; o cache evita converter de novo
+    try:
+        dia, mes, ano = texto.split('/')
+        return date(int(ano), int(mes), int(dia)).isoformat()
+    except ValueError:
+        raise ValueError(f"Data inválida: {texto!r} (use dd/mm/aaaa)") from None
+
+def converter_data(valor):
+    """Converte 'dd/mm/aaaa' (ou date/datetime) para o formato do banco, YYYY-MM-DD"""
+    if not valor:
+        return None
+    if isinstance(valor, datetime):
+        return valor.date().isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if not isinstance(valor, str):
+        # Ex.: número vindo de planilha; no lote vira erro da linha, não do lote inteiro
+        raise TypeError(f"Data inválida: {valor!r} (use dd/mm/aaaa)")
+    return _data_para_iso(valor.strip())
+
+CAMPOS_CADASTRO = (
+    'nome', 'lote', 'ca', 'quantidade', 'data_compra', 'data_fabricacao', 'data_validade'
+)
+
+def _preparar_linha(produto):
+    """Valida um produto do lote e devolve a tupla de parâmetros do INSERT"""
+    if isinstance(produto, dict):
+        nome, lote, ca, quantidade, data_compra, data_fabricacao, data_validade = (
+            produto.get(campo) for campo in CAMPOS_CADASTRO
+        )
+    else:
+        nome, lote, ca, quantidade, data_compra, data_fabricacao, data_validade = produto
+    
+    if not nome or not str(nome).strip():
+        raise ValueError("Nome é obrigatório")
+    if lote is None:
+        raise ValueError("Lote é obrigatório")
+    try:
+        quantidade = int(quantidade)
+        ca = int(ca) if ca not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError("CA e quantidade devem ser números inteiros") from None
+    
+    return (
+        nome, lote, ca, quantidade,
+        converter_data(data_compra),
+        converter_data(data_fabricacao),
+        converter_data(data_validade)
+    )
+
+# Ordem das colunas devolvidas pelas consultas (a mesma exibida na tabela principal)
+COLUNAS_PRODUTOS = (
+    'id', 'nome', 'lote', 'ca', 'quantidade', 'data_compra',
+    'data_fabricacao', 'validade_dias', 'data_validade', 'dias_restantes', 'status'
+)
+SELECT_PRODUTOS = ', '.join(COLUNAS_PRODUTOS)
+
+def _migracao_esquema_base(conn):
+    """Cria a tabela produtos ou completa bancos criados por versões antigas"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS produtos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            lote TEXT NOT NULL,
+            ca INTEGER,
+            quantidade INTEGER NOT NULL,
+            data_compra DATE,
+            data_fabricacao DATE,
+            validade_dias INTEGER,
+            data_validade DATE,
+            dias_restantes INTEGER,
+            status TEXT
+        )
+    ''')
+    # Bancos criados pelo criar_banco_dados antigo não têm a coluna validade_dias
+    colunas = {coluna[1] for coluna in conn.execute('PRAGMA table_info(produtos)')}
+    if 'validade_dias' not in colunas:
+        conn.execute('ALTER TABLE produtos ADD COLUMN validade_dias INTEGER')
+
+def _migracao_indices(conn):
+    """Índices para as colunas usadas em filtros e buscas"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_produtos_status ON produtos (status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_produtos_data_validade ON produtos (data_validade)')
+    # NOCASE permite que LIKE 'prefixo%' (que não diferencia maiúsculas) use o índice
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_produtos_lote ON produtos (lote COLLATE NOCASE)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_produtos_nome ON produtos (nome COLLATE NOCASE)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_produtos_ca ON produtos (ca)')
+
+def _migracao_status_calculado(conn):
+    """View com dias_restantes e status calculados a partir da data atual.
+
+    As colunas dias_restantes e status da tabela deixam de ser mantidas: o
+    valor gravado envelhecia no dia seguinte. Alterar DIAS_AVISO_VENCIMENTO
+    exige uma nova migração que recrie a view.
+    """
+    conn.execute('DROP INDEX IF EXISTS idx_produtos_status')
+    conn.execute('DROP VIEW IF EXISTS vw_produtos')
+    conn.execute(f'''
+        CREATE VIEW vw_produtos AS
+        SELECT id, nome, lote, ca, quantidade, data_compra, data_fabricacao,
+               validade_dias, data_validade,
+               CAST(julianday(data_validade) - julianday({SQL_HOJE}) AS INTEGER) AS dias_restantes,
+               CASE
+                   WHEN data_validade IS NULL THEN '{STATUS_NORMAL}'
+                   WHEN data_validade < {SQL_HOJE} THEN '{STATUS_VENCIDO}'
+                   WHEN data_validade <= {SQL_LIMITE_AVISO} THEN '{STATUS_PROXIMO_VENCIMENTO}'
+                   ELSE '{STATUS_NORMAL}'
+               END AS status
+        FROM produtos
+    ''')
+
+def _migracao_busca_textual(conn):
+    """Índice FTS5 sobre nome, lote e CA, mantido por triggers"""
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE produtos_fts USING fts5(
+                nome, lote, ca,
+                content='produtos', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite compilado sem FTS5: a busca usa LIKE como alternativa
+        if 'fts5' not in str(e):
+            raise
+        logger.warning("FTS5 indisponível, busca textual usará LIKE: %s", e)
+        return
+    
+    conn.execute('''
+        CREATE TRIGGER produtos_fts_ai AFTER INSERT ON produtos BEGIN
+            INSERT INTO produtos_fts (rowid, nome, lote, ca)
+            VALUES (new.id, new.nome, new.lote, new.ca);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER produtos_fts_ad AFTER DELETE ON produtos BEGIN
+            INSERT INTO produtos_fts (produtos_fts, rowid, nome, lote, ca)
+            VALUES ('delete', old.id, old.nome, old.lote, old.ca);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER produtos_fts_au AFTER UPDATE OF nome, lote, ca ON produtos BEGIN
+            INSERT INTO produtos_fts (produtos_fts, rowid, nome, lote, ca)
+            VALUES ('delete', old.id, old.nome, old.lote, old.ca);
+            INSERT INTO produtos_fts (rowid, nome, lote, ca)
+            VALUES (new.id, new.nome, new.lote, new.ca);
+        END
+    ''')
+    # Indexa as linhas já existentes
+    conn.execute("INSERT INTO produtos_fts (produtos_fts) VALUES ('rebuild')")
+
+def consulta_fts(termo):
+    """Converte o texto digitado numa consulta FTS5: todos os termos, por prefixo"""
+    # Cada termo vai entre aspas para que operadores e pontuação do usuário
+    # não sejam interpretados pela sintaxe do FTS5
+    termos = re.findall(r'\w+', termo or '')
+    return ' '.join(f'"{t}"*' for t in termos)
+
+# Colunas aceitas em ordenar_por; texto é ordenado sem diferenciar maiúsculas
+_ORDENACAO_PRODUTOS = {coluna: coluna for coluna in COLUNAS_PRODUTOS}
+_ORDENACAO_PRODUTOS['nome'] = 'nome COLLATE NOCASE'
+_ORDENACAO_PRODUTOS['lote'] = 'lote COLLATE NOCASE'
+
+def montar_consulta_produtos(nome=None, lote=None, status=None, validade_de=None,
+                             validade_ate=None, ca=None, quantidade_minima=None,
+                             ordenar_por='id', decrescente=False, limite=None,
+                             apos_id=None, usar_fts=True):
+    """Monta (sql, parametros) de uma consulta filtrada na vw_produtos.
+
+    Filtros vazios são ignorados e os demais são combinados com AND:
+    nome e lote por prefixo de palavra (FTS5, ou LIKE sem FTS5), status e
+    validade por faixa de data_validade, CA exato e quantidade mínima.
+    apos_id faz paginação por chave e só vale para ordenação por id.
+    """
+    condicoes = []
+    parametros = []
+    
+    termos_fts = []
+    for coluna, valor in (('nome', nome), ('lote', lote)):
+        if not valor or not valor.strip():
+            continue
+        consulta = consulta_fts(valor)
+        if usar_fts and consulta:
+            termos_fts.append(f'{coluna} : ({consulta})')
+        else:
+            condicoes.append(f'{coluna} LIKE ?')
+            parametros.append(f'%{valor.strip()}%')
+    if termos_fts:
+        condicoes.append('id IN (SELECT rowid FROM produtos_fts WHERE produtos_fts MATCH ?)')
+        parametros.append(' AND '.join(termos_fts))
+    
+    if status and status != 'Todos':
+        condicoes.append(condicao_status(status))
+    if validade_de:
+        condicoes.append('data_validade >= ?')
+        parametros.append(converter_data(validade_de))
+    if validade_ate:
+        condicoes.append('data_validade <= ?')
+        parametros.append(converter_data(validade_ate))
+    if ca not in (None, ''):
+        condicoes.append('ca = ?')
+        parametros.append(int(ca))
+    if quantidade_minima is not None:
+        condicoes.append('quantidade >= ?')
+        parametros.append(int(quantidade_minima))
+    
+    if ordenar_por not in _ORDENACAO_PRODUTOS:
+        raise ValueError(f"Coluna de ordenação inválida: {ordenar_por}")
+    direcao = 'DESC' if decrescente else 'ASC'
+    if apos_id is not None:
+        if ordenar_por != 'id':
+            raise ValueError("apos_id só pode ser usado com ordenação por id")
+        condicoes.append('id < ?' if decrescente else 'id > ?')
+        parametros.append(apos_id)
+    ordem = _ORDENACAO_PRODUTOS[ordenar_por] + f' {direcao}'
+    if ordenar_por != 'id':
+        # Desempate estável para páginas consecutivas
+        ordem += f', id {direcao}'
+    
+    sql = f'SELECT {SELECT_PRODUTOS} FROM vw_produtos'
+    if condicoes:
+        sql += ' WHERE ' + ' AND '.join(condicoes)
+    sql += f' ORDER BY {ordem}'
+    if limite is not None:
+        sql += ' LIMIT ?'
+        parametros.append(int(limite))
+    return sql, parametros
+
+def _migracao_log_alteracoes(conn):
+    """Log de alterações (somente inclusão), mantido por triggers"""
+    # AUTOINCREMENT garante que seq nunca é reutilizado, mesmo após limpezas
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS produtos_alteracoes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            produto_id INTEGER NOT NULL,
+            operacao TEXT NOT NULL CHECK (operacao IN ('I', 'U', 'D')),
+            registrado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER produtos_log_ai AFTER INSERT ON produtos BEGIN
+            INSERT INTO produtos_alteracoes (produto_id, operacao) VALUES (new.id, 'I');
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER produtos_log_au AFTER UPDATE ON produtos BEGIN
+            INSERT INTO produtos_alteracoes (produto_id, operacao) VALUES (new.id, 'U');
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER produtos_log_ad AFTER DELETE ON produtos BEGIN
+            INSERT INTO produtos_alteracoes (produto_id, operacao) VALUES (old.id, 'D');
+        END
+    ''')
+
+def _migracao_log_colunas_cadastro(conn):
+    """Log de edições restrito às colunas de cadastro.
+
+    Atualizar as colunas dias_restantes e status gravadas (recalcular_status_gravado)
+    não é uma alteração do produto e não deve aparecer no log.
+    """
+    conn.execute('DROP TRIGGER IF EXISTS produtos_log_au')
+    conn.execute(f'''
+        CREATE TRIGGER produtos_log_au AFTER UPDATE OF {', '.join(CAMPOS_CADASTRO)}, validade_dias
+        ON produtos BEGIN
+            INSERT INTO produtos_alteracoes (produto_id, operacao) VALUES (new.id, 'U');
+        END
+    ''')
+
+def _migracao_fts_pausavel(conn):
+    """Permite suspender o trigger de inclusão do FTS5 durante inclusões em lote.
+
+    Uma linha em produtos_fts_pausa desliga produtos_fts_ai; o lote a grava e
+    apaga dentro da própria transação, então nenhuma outra conexão a enxerga.
+    """
+    existe = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'produtos_fts'"
+    ).fetchone()
+    if not existe:
+        return
+    conn.execute('CREATE TABLE IF NOT EXISTS produtos_fts_pausa (pausado INTEGER)')
+    conn.execute('DROP TRIGGER IF EXISTS produtos_fts_ai')
+    conn.execute('''
+        CREATE TRIGGER produtos_fts_ai AFTER INSERT ON produtos
+        WHEN NOT EXISTS (SELECT 1 FROM produtos_fts_pausa) BEGIN
+            INSERT INTO produtos_fts (rowid, nome, lote, ca)
+            VALUES (new.id, new.nome, new.lote, new.ca);
+        END
+    ''')
+
+# Migrações em ordem: (versão gravada em PRAGMA user_version, função)
+# Nunca altere uma migração já publicada; adicione uma nova ao final.
+MIGRACOES = [
+    (1, _migracao_esquema_base),
+    (2, _migracao_indices),
+    (3, _migracao_status_calculado),
+    (4, _migracao_busca_textual),
+    (5, _migracao_log_alteracoes),
+    (6, _migracao_log_colunas_cadastro),
+    (7, _migracao_fts_pausavel),
+]
+
+class ConnectionManager:
+    """Mantém uma conexão SQLite persistente por thread, configurada uma única vez"""
+
+    def __init__(self, db_path, busy_timeout=5000, cache_size=-16000):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        # Valor negativo = tamanho em KiB (16 MiB por conexão)
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conexoes = []
+        self._proximo_serial = 1
+        # Fechado durante pausar(): outras threads esperam em conexao()
+        self._liberado = threading.Event()
+        self._liberado.set()
+        self._dono_pausa = None
+
+    def _abrir(self):
+        # isolation_level=None: o módulo sqlite3 não abre transações implícitas,
+        # elas são controladas explicitamente por transacao()
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            # Com a instrumentação ligada, mede as consultas e registra as lentas
+            factory=instrumentacao.fabrica_conexao()
+        )
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        conn.execute(f'PRAGMA cache_size = {int(self.cache_size)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA foreign_keys = ON')
+        return conn
+
+    def conexao(self):
+        """Retorna a conexão da thread atual, abrindo-a na primeira chamada"""
+        if not self._liberado.is_set() and self._dono_pausa != threading.get_ident():
+            self._liberado.wait()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._abrir()
+            with self._lock:
+                self._local.serial = self._proximo_serial
+                self._proximo_serial += 1
+                self._conexoes.append(conn)
+            self._local.conn = conn
+            self._local.nivel = 0
+        return conn
+
+    def serial(self):
+        """Identificador da conexão da thread atual (não é reutilizado)"""
+        self.conexao()
+        return self._local.serial
+
+    @contextmanager
+    def transacao(self, imediata=True):
+        """Escopo de transação explícito; escopos aninhados viram SAVEPOINTs.
+
+        Com imediata=True a trava de escrita é obtida já no BEGIN, evitando
+        SQLITE_BUSY na promoção de leitura para escrita em modo WAL.
+        """
+        conn = self.conexao()
+        nivel = self._local.nivel
+        if nivel == 0:
+            conn.execute('BEGIN IMMEDIATE' if imediata else 'BEGIN')
+        else:
+            conn.execute(f'SAVEPOINT sp_{nivel}')
+        self._local.nivel = nivel + 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.nivel = nivel
+            if nivel == 0:
+                conn.execute('ROLLBACK')
+            else:
+                conn.execute(f'ROLLBACK TO sp_{nivel}')
+                conn.execute(f'RELEASE sp_{nivel}')
+            raise
+        else:
+            self._local.nivel = nivel
+            if nivel == 0:
+                conn.execute('COMMIT')
+            else:
+                conn.execute(f'RELEASE sp_{nivel}')
+
+    @contextmanager
+    def pausar(self):
+        """Suspende o acesso das outras threads enquanto o bloco roda (ex.: restauração).
+
+        Só a thread que pausou continua obtendo conexões; as demais esperam
+        em conexao() até o fim do bloco.
+        """
+        with self._lock:
+            if self._dono_pausa is not None:
+                raise RuntimeError("Acesso ao banco já está pausado")
+            self._dono_pausa = threading.get_ident()
+            self._liberado.clear()
+        try:
+            yield self.conexao()
+        finally:
+            with self._lock:
+                self._dono_pausa = None
+                self._liberado.set()
+
+    def em_transacao(self):
+        """Indica se a thread atual está dentro de um escopo de transacao()"""
+        return getattr(self._local, 'nivel', 0) > 0
+
+    def fechar(self):
+        """Fecha todas as conexões abertas (chamar no encerramento da aplicação)"""
+        with self._lock:
+            conexoes, self._conexoes = self._conexoes, []
+        for conn in conexoes:
+            try:
+                conn.execute('PRAGMA optimize')
+                conn.close()
+            except Exception:
+                logger.exception("Erro ao fechar conexão")
+        # Conexões de outras threads ficam inválidas; a thread atual reabre sob demanda
+        self._local = threading.local()
+
+class CacheProdutos:
+    """Cópia em memória das linhas de vw_produtos, compartilhada pelo processo.
+
+    É preenchido conforme as páginas são lidas (carregar_pagina): todas as
+    linhas com id até 'coberto' estão no cache, e com 'completo' a tabela
+    inteira. Escritas feitas pelo DatabaseManager o atualizam no lugar.
+    Para detectar escritas de fora (outra instância do programa, a linha de
+    comando) guarda-se um token (conexão, PRAGMA data_version, total_changes):
+    data_version só muda quando outra conexão grava e total_changes só muda
+    quando a própria conexão grava. Com o token diferente o cache é posto em
+    dia pelo log de alterações; como status e dias_restantes dependem da
+    data atual, a virada do dia o esvazia.
+
+    Cada mudança de estado avança a geração: o que foi lido do banco só é
+    guardado se nenhuma escrita foi aplicada ao cache durante a leitura.
+    """
 
-class DatabaseManager:
     def __init__(self):
-        self.db_path = self.get_database_path()
+        self._lock = threading.RLock()
+        self._geracao = 0
+        self.invalidar()
+
+    def invalidar(self):
+        with self._lock:
+            self._linhas = {}
+            # Ids em ordem crescente, para servir páginas por chave
+            self._ordem = []
+            self._coberto = 0
+            self._completo = False
+            self._contagem = None
+            self._token = None
+            self._dia = None
+            # Última sequência do log de alterações já refletida nas linhas
+            self._seq = None
+            self._geracao += 1
+
+    def geracao_valida(self, token, dia):
+        """Geração atual se o cache reflete o banco para este token, senão None"""
+        with self._lock:
+            if self._seq is None or self._token != token or self._dia != dia:
+                return None
+            return self._geracao
+
+    def seq_para_delta(self, dia):
+        """Sequência a partir da qual o cache pode ser posto em dia pelo log, ou None"""
+        with self._lock:
+            if self._seq is None or self._dia != dia:
+                return None
+            return self._seq
+
+    def reiniciar(self, token, dia, seq):
+        """Esvazia o cache e o associa ao estado atual do banco; retorna a geração"""
+        with self._lock:
+            self.invalidar()
+            self._token = token
+            self._dia = dia
+            self._seq = seq
+            return self._geracao
+
+    def completo(self):
+        return self._completo
+
+    # --- leitura
+
+    def pagina(self, apos_id, limite):
+        """Linhas com id > apos_id (até limite, negativo = todas), ou None se o cache não as tem todas"""
+        with self._lock:
+            inicio = bisect.bisect_right(self._ordem, apos_id)
+            ids = self._ordem[inicio:] if limite < 0 else self._ordem[inicio:inicio + limite]
+            # Sem a tabela inteira, só serve páginas cheias dentro do trecho coberto
+            if not self._completo and (limite < 0 or len(ids) < limite or (ids and ids[-1] > self._coberto)):
+                return None
+            return [self._linhas[produto_id] for produto_id in ids]
+
+    def todas(self):
+        """Todas as linhas em ordem de id, ou None se o cache não tem a tabela inteira"""
+        with self._lock:
+            if not self._completo:
+                return None
+            return [self._linhas[produto_id] for produto_id in self._ordem]
+
+    def linhas(self, ids):
+        """(encontradas, faltantes): ids cobertos e ausentes do banco não vão para nenhuma"""
+        with self._lock:
+            encontradas = []
+            faltantes = []
+            for produto_id in ids:
+                linha = self._linhas.get(produto_id)
+                if linha is not None:
+                    encontradas.append(linha)
+                elif not self._completo and produto_id > self._coberto:
+                    faltantes.append(produto_id)
+            return encontradas, faltantes
+
+    def contagem(self):
+        with self._lock:
+            return None if self._contagem is None else dict(self._contagem)
+
+    # --- preenchimento com o que foi lido do banco
+
+    def guardar_pagina(self, geracao, apos_id, limite, linhas):
+        """Guarda o resultado de 'id > apos_id ORDER BY id LIMIT limite' (None ou negativo: todas)"""
+        with self._lock:
+            if geracao != self._geracao:
+                return
+            for linha in linhas:
+                self._gravar(linha)
+            if apos_id <= self._coberto:
+                if limite is None or limite < 0 or len(linhas) < limite:
+                    self._completo = True
+                elif linhas:
+                    self._coberto = max(self._coberto, linhas[-1][0])
+
+    def guardar_linhas(self, geracao, linhas):
+        with self._lock:
+            if geracao == self._geracao:
+                for linha in linhas:
+                    self._gravar(linha)
+
+    def guardar_contagem(self, geracao, contagem):
+        with self._lock:
+            if geracao == self._geracao:
+                self._contagem = dict(contagem)
+
+    # --- escritas
+
+    def _gravar(self, linha):
+        produto_id = linha[0]
+        if produto_id not in self._linhas:
+            bisect.insort(self._ordem, produto_id)
+        self._linhas[produto_id] = linha
+
+    def _remover(self, produto_id):
+        if self._linhas.pop(produto_id, None) is not None:
+            del self._ordem[bisect.bisect_left(self._ordem, produto_id)]
+
+    def _aplicar(self, alteracoes):
+        for operacao, valor in alteracoes:
+            if operacao == 'remover':
+                self._remover(valor)
+            elif self._completo or valor[0] <= self._coberto or valor[0] in self._linhas:
+                # Linhas além do trecho coberto chegam com a página que as contém
+                self._gravar(valor)
+        if alteracoes:
+            self._contagem = None
+        self._geracao += 1
+
+    def aplicar_delta(self, alteracoes, token, seq):
+        """Aplica o resultado de get_changes_since, adota o novo token e retorna a geração"""
+        with self._lock:
+            self._aplicar([
+                ('remover', produto_id) if linha is None else ('gravar', linha)
+                for produto_id, _operacao, linha in alteracoes
+            ])
+            self._token = token
+            self._seq = seq
+            return self._geracao
+
+    def aplicar(self, alteracoes, token_antes, token_depois, seq):
+        """Aplica as escritas já confirmadas no banco.
+
+        O token só avança se o cache estava em dia com a conexão que gravou;
+        caso contrário a próxima leitura o põe em dia pelo log.
+        """
+        with self._lock:
+            if self._seq is None:
+                return
+            self._aplicar(alteracoes)
+            if self._token == token_antes:
+                self._token = token_depois
+                self._seq = seq
+
+@instrumentacao.cronometrar_metodos('db', ignorar=('conexao', 'transacao', 'connect', 'get_database_path'))
+class DatabaseManager:
+    def __init__(self, db_path=None):
+        # Sem db_path, usa o database.db ao lado do programa
+        self.db_path = db_path or self.get_database_path()
+        self.conexoes = ConnectionManager(self.db_path)
+        self.cache = CacheProdutos()
         self.criar_banco_dados()
+        atexit.register(self.fechar)
 
     def get_database_path(self):
         if getattr(sys, 'frozen', False):
@@ -16,227 +652,602 @@ class DatabaseManager:
         return os.path.join(application_path, 'database.db')
 
     def connect(self):
+        """Abre uma conexão avulsa (quem chama deve fechá-la).
+
+        Os métodos do DatabaseManager usam a conexão persistente da thread;
+        este método existe apenas para compatibilidade.
+        """
         try:
             return sqlite3.connect(self.db_path)
-        except Exception as e:
-            print(f"Erro ao conectar ao banco de dados: {e}")
+        except Exception:
+            logger.exception("Erro ao conectar ao banco de dados")
             return None
 
+    def conexao(self):
+        """Conexão persistente da thread atual"""
+        return self.conexoes.conexao()
+
+    def transacao(self, imediata=True):
+        """Escopo de transação na conexão da thread atual"""
+        return self.conexoes.transacao(imediata)
+
+    def fechar(self):
+        """Encerra todas as conexões do banco de dados"""
+        self.conexoes.fechar()
+        self.cache.invalidar()
+
+    def _token_cache(self):
+        """Estado da conexão da thread atual usado para validar o cache"""
+        conn = self.conexao()
+        versao = conn.execute('PRAGMA data_version').fetchone()[0]
+        return (self.conexoes.serial(), versao, conn.total_changes)
+
+    def _validar_cache(self):
+        """Põe o cache em dia com o banco e retorna sua geração.
+
+        Escritas de fora do cache são aplicadas pelo log de alterações; se o
+        log já foi limpo além do ponto do cache, ou o dia mudou, ele recomeça vazio.
+        """
+        token = self._token_cache()
+        hoje = date.today()
+        geracao = self.cache.geracao_valida(token, hoje)
+        if geracao is not None:
+            return geracao
+        seq = self.cache.seq_para_delta(hoje)
+        if seq is not None:
+            ultimo_seq, alteracoes = self.get_changes_since(seq)
+            if alteracoes is not None:
+                instrumentacao.contar('cache.deltas')
+                return self.cache.aplicar_delta(alteracoes, token, ultimo_seq)
+        return self.cache.reiniciar(token, hoje, self._ultimo_seq(self.conexao()))
+
+    @contextmanager
+    def _escrita(self):
+        """Transação de escrita que repassa ao cache as linhas alteradas.
+
+        O bloco recebe (conn, alteracoes) e registra ('gravar', linha) ou
+        ('remover', id); o cache só é atualizado depois do COMMIT.
+        """
+        aninhada = self.conexoes.em_transacao()
+        token_antes = None if aninhada else self._token_cache()
+        alteracoes = []
+        with self.transacao() as conn:
+            yield conn, alteracoes
+            seq = self._ultimo_seq(conn)
+        if aninhada:
+            # O COMMIT ainda depende da transação externa
+            self.cache.invalidar()
+        else:
+            self.cache.aplicar(alteracoes, token_antes, self._token_cache(), seq)
+
+    def _ultimo_seq(self, conn):
+        cursor = conn.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'produtos_alteracoes'"
+        )
+        linha = cursor.fetchone()
+        return linha[0] if linha else 0
+
+    def _ultimo_id(self, conn):
+        cursor = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'produtos'")
+        linha = cursor.fetchone()
+        return linha[0] if linha else 0
+
+    def _ler_linha(self, conn, produto_id):
+        return conn.execute(
+            f'SELECT {SELECT_PRODUTOS} FROM vw_produtos WHERE id = ?', (produto_id,)
+        ).fetchone()
+
+    def fazer_backup(self, destino, progresso=None, cancelar=None):
+        """Backup consistente do banco em uso, sem bloquear as gravações (ver backup.fazer_backup)"""
+        return backup.fazer_backup(self.conexao(), destino, progresso=progresso, cancelar=cancelar)
+
+    def backup_incremental(self, repositorio, progresso=None, cancelar=None, **metadados):
+        """Guarda um snapshot no RepositorioBackup, registrando a última alteração incluída"""
+        # Lido antes do snapshot: na dúvida, o próximo backup automático não é pulado
+        metadados['seq_alteracoes'] = self.ultima_alteracao()
+        return repositorio.criar_backup(self.conexao(), progresso=progresso, cancelar=cancelar, **metadados)
+
+    def restaurar(self, origem, progresso=None):
+        """Substitui o conteúdo do banco em uso pelo do arquivo origem, sem reiniciar.
+
+        A cópia usa a API de backup do SQLite sobre a conexão ativa, com as
+        demais threads pausadas; depois o esquema é migrado (o backup pode
+        ser de uma versão anterior) e o cache é descartado.
+        """
+        fonte = sqlite3.connect(f'file:{origem}?mode=ro', uri=True)
+        try:
+            with self.conexoes.pausar() as conn:
+                if self.conexoes.em_transacao():
+                    raise RuntimeError("Restauração dentro de uma transação")
+                fonte.backup(conn, progress=progresso and (
+                    lambda _status, restantes, total: progresso(total - restantes, total)))
+                conn.execute('PRAGMA journal_mode = WAL')
+                self.cache.invalidar()
+                self._fts = None
+                self.migrar()
+        finally:
+            fonte.close()
+
+    def versao_esquema(self):
+        """Versão do esquema gravada em PRAGMA user_version"""
+        return self.conexao().execute('PRAGMA user_version').fetchone()[0]
+
+    def migrar(self):
+        """Aplica, em ordem, as migrações ainda não aplicadas ao banco"""
+        versao_atual = self.versao_esquema()
+        ultima_versao = MIGRACOES[-1][0]
+        if versao_atual > ultima_versao:
+            logger.error(
+                "Banco de dados na versão %d, mais nova que a suportada (%d)", versao_atual, ultima_versao
+            )
+            return versao_atual
+        
+        aplicadas = 0
+        for versao, migracao in MIGRACOES:
+            if versao <= versao_atual:
+                continue
+            # Cada migração e a nova versão são gravadas na mesma transação
+            with self.transacao() as conn:
+                migracao(conn)
+                conn.execute(f'PRAGMA user_version = {versao}')
+            aplicadas += 1
+        
+        if aplicadas:
+            # Atualiza as estatísticas usadas pelo planejador de consultas
+            self.conexao().execute('ANALYZE')
+        self._fts = None
+        return ultima_versao
+
+    def busca_textual_disponivel(self):
+        """Indica se o índice FTS5 foi criado neste banco"""
+        if getattr(self, '_fts', None) is None:
+            cursor = self.conexao().execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'produtos_fts'"
+            )
+            self._fts = cursor.fetchone() is not None
+        return self._fts
+
     def criar_banco_dados(self):
         try:
-            conn = self.connect()
-            if not conn:
-                return False
-            
-            cursor = conn.cursor()
-            
-            # Verifica se a tabela existe
-            cursor.execute('''
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name='produtos'
-            ''')
-            
-            if cursor.fetchone() is None:
-                # Cria a tabela com a nova estrutura
-                cursor.execute('''
-                    CREATE TABLE produtos (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        nome TEXT NOT NULL,
-                        lote TEXT NOT NULL,
-                        ca INTEGER,
-                        quantidade INTEGER NOT NULL,
-                        data_compra DATE,
-                        data_fabricacao DATE,
-                        data_validade DATE,
-                        dias_restantes INTEGER,
-                        status TEXT
-                    )
-                ''')
-                conn.commit()
-                return True
+            self.migrar()
             return True
             
-        except Exception as e:
-            print(f"Erro ao criar banco de dados: {e}")
+        except Exception:
+            logger.exception("Erro ao criar banco de dados")
             return False
-        finally:
-            if conn:
-                conn.close()
 
     def adicionar_produto(self, nome, lote, ca, quantidade, data_compra, data_fabricacao, data_validade):
+        """Insere o produto e retorna sua linha de vw_produtos (False em caso de erro)"""
         try:
-            conn = self.connect()
-            if not conn:
-                return False
+            # Converter datas, permitindo valores vazios
+            data_compra_iso = converter_data(data_compra)
+            data_fabricacao_iso = converter_data(data_fabricacao)
+            data_validade_iso = converter_data(data_validade)
             
-            cursor = conn.cursor()
+            with self._escrita() as (conn, alteracoes):
+                cursor = conn.execute('''
+                    INSERT INTO produtos (
+                        nome, lote, ca, quantidade, data_compra, 
+                        data_fabricacao, data_validade
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    nome, lote, ca, quantidade,
+                    data_compra_iso, data_fabricacao_iso, data_validade_iso
+                ))
+                linha = self._ler_linha(conn, cursor.lastrowid)
+                alteracoes.append(('gravar', linha))
+            return linha
             
-            # Converter datas, permitindo valores vazios
-            data_compra_obj = datetime.strptime(data_compra, '%d/%m/%Y') if data_compra else None
-            data_fabricacao_obj = datetime.strptime(data_fabricacao, '%d/%m/%Y') if data_fabricacao else None
-            data_validade_obj = datetime.strptime(data_validade, '%d/%m/%Y') if data_validade else None
-            
-            # Calcular dias restantes, se a data de validade for fornecida
-            dias_restantes = (data_validade_obj.date() - datetime.now().date()).days if data_validade_obj else None
-            
-            # Determinar status
-            status = "Normal"
-            if dias_restantes is not None:
-                if dias_restantes < 0:
-                    status = "Vencido"
-                elif dias_restantes <= 30:
-                    status = "Próximo do Vencimento"
-            
-            cursor.execute('''
-                INSERT INTO produtos (
-                    nome, lote, ca, quantidade, data_compra, 
-                    data_fabricacao, data_validade, dias_restantes, status
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                nome, lote, ca, quantidade,
-                data_compra_obj.strftime('%Y-%m-%d') if data_compra_obj else None,
-                data_fabricacao_obj.strftime('%Y-%m-%d') if data_fabricacao_obj else None,
-                data_validade_obj.strftime('%Y-%m-%d') if data_validade_obj else None,
-                dias_restantes,
-                status
-            ))
-            
-            conn.commit()
-            return True
+        except Exception:
+            logger.exception("Erro ao adicionar produto")
+            return False
+
+    def adicionar_produtos_em_lote(self, produtos, tamanho_bloco=5000):
+        """Insere vários produtos numa única transação.
+
+        Cada item é um dicionário com os campos de adicionar_produto ou uma
+        sequência na mesma ordem. Itens inválidos são pulados sem abortar o
+        lote. Retorna (quantidade_inserida, erros), com erros no formato
+        [(indice_do_item, mensagem), ...].
+
+        O trigger do FTS5 fica suspenso durante o lote; as linhas novas são
+        indexadas de uma vez no final, na mesma transação.
+        """
+        inseridos = 0
+        erros = []
+        bloco = []
+        sql = f'''
+            INSERT INTO produtos ({', '.join(CAMPOS_CADASTRO)})
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        '''
+        fts = self.busca_textual_disponivel()
+        try:
+            with self._escrita() as (conn, alteracoes):
+                if fts:
+                    conn.execute('INSERT INTO produtos_fts_pausa (pausado) VALUES (1)')
+                # AUTOINCREMENT: os ids do lote ficam todos acima deste
+                primeiro_id = self._ultimo_id(conn) + 1
+                for indice, produto in enumerate(produtos):
+                    try:
+                        bloco.append(_preparar_linha(produto))
+                    except (ValueError, TypeError) as e:
+                        erros.append((indice, str(e)))
+                        continue
+                    
+                    if len(bloco) >= tamanho_bloco:
+                        conn.executemany(sql, bloco)
+                        inseridos += len(bloco)
+                        bloco = []
+                
+                if bloco:
+                    conn.executemany(sql, bloco)
+                    inseridos += len(bloco)
+                
+                if fts:
+                    conn.execute('DELETE FROM produtos_fts_pausa')
+                    if inseridos:
+                        conn.execute('''
+                            INSERT INTO produtos_fts (rowid, nome, lote, ca)
+                            SELECT id, nome, lote, ca FROM produtos WHERE id BETWEEN ? AND ?
+                        ''', (primeiro_id, self._ultimo_id(conn)))
+                
+                # Ids novos ficam além do trecho coberto, a menos que o cache tenha a tabela inteira
+                if inseridos and self.cache.completo():
+                    cursor = conn.execute(
+                        f'SELECT {SELECT_PRODUTOS} FROM vw_produtos WHERE id >= ? ORDER BY id',
+                        (primeiro_id,)
+                    )
+                    alteracoes.extend(('gravar', linha) for linha in cursor)
+            return inseridos, erros
             
         except Exception as e:
-            print(f"Erro ao adicionar produto: {e}")
-            return False
-        finally:
-            if conn:
-                conn.close()
+            # Falha do banco desfaz o lote inteiro
+            logger.exception("Erro ao adicionar produtos em lote")
+            erros.append((None, str(e)))
+            return 0, erros
 
     def atualizar_produto(self, id, nome, lote, ca, quantidade, data_compra, data_fabricacao, data_validade):
+        """Atualiza o produto e retorna sua nova linha de vw_produtos.
+
+        Retorna None se o id não existir e False em caso de erro.
+        """
         try:
-            conn = self.connect()
-            if not conn:
-                return False
-            
-            cursor = conn.cursor()
-            
             # Converter datas para o formato do banco de dados
-            data_compra_obj = datetime.strptime(data_compra, '%d/%m/%Y').strftime('%Y-%m-%d') if data_compra else None
-            data_fabricacao_obj = datetime.strptime(data_fabricacao, '%d/%m/%Y').strftime('%Y-%m-%d') if data_fabricacao else None
-            data_validade_obj = datetime.strptime(data_validade, '%d/%m/%Y').strftime('%Y-%m-%d') if data_validade else None
-            
-            # Calcular dias restantes e status
-            dias_restantes = None
-            status = "Normal"
-            if data_validade_obj:
-                data_validade_date = datetime.strptime(data_validade_obj, '%Y-%m-%d').date()
-                dias_restantes = (data_validade_date - datetime.now().date()).days
-                if dias_restantes < -9152:
-                    status = "Vencido"
-                elif dias_restantes <= 30:
-                    status = "Próximo do Vencimento"
-            
-            cursor.execute('''
-                UPDATE produtos 
-                SET nome = ?, 
-                    lote = ?, 
-                    ca = ?, 
-                    quantidade = ?, 
-                    data_compra = ?, 
-                    data_fabricacao = ?, 
-                    data_validade = ?,
-                    dias_restantes = ?,
-                    status = ?
-                WHERE id = ?
-            ''', (nome, lote, ca, quantidade, data_compra_obj, data_fabricacao_obj, data_validade_obj, 
-                  dias_restantes, status, id))
-            
-            conn.commit()
-            return True
+            data_compra_iso = converter_data(data_compra)
+            data_fabricacao_iso = converter_data(data_fabricacao)
+            data_validade_iso = converter_data(data_validade)
             
-        except Exception as e:
-            print(f"Erro ao atualizar produto: {e}")
+            with self._escrita() as (conn, alteracoes):
+                conn.execute('''
+                    UPDATE produtos 
+                    SET nome = ?, 
+                        lote = ?, 
+                        ca = ?, 
+                        quantidade = ?, 
+                        data_compra = ?, 
+                        data_fabricacao = ?, 
+                        data_validade = ?
+                    WHERE id = ?
+                ''', (nome, lote, ca, quantidade, data_compra_iso, data_fabricacao_iso, data_validade_iso, id))
+                linha = self._ler_linha(conn, id)
+                if linha:
+                    alteracoes.append(('gravar', linha))
+            return linha
+            
+        except Exception:
+            logger.exception("Erro ao atualizar produto")
             return False
-        finally:
-            if conn:
-                conn.close()
 
     def carregar_produtos(self):
         try:
-            conn = self.connect()
-            if not conn:
+            geracao = self._validar_cache()
+            produtos = self.cache.todas()
+            if produtos is not None:
+                instrumentacao.contar('cache.acertos')
+                return produtos
+            
+            instrumentacao.contar('cache.falhas')
+            produtos = self.conexao().execute(
+                f'SELECT {SELECT_PRODUTOS} FROM vw_produtos ORDER BY id'
+            ).fetchall()
+            self.cache.guardar_pagina(geracao, 0, None, produtos)
+            return produtos
+            
+        except Exception:
+            logger.exception("Erro ao carregar produtos")
+            return []
+
+    def contar_produtos(self):
+        try:
+            return self.conexao().execute('SELECT COUNT(*) FROM produtos').fetchone()[0]
+            
+        except Exception:
+            logger.exception("Erro ao contar produtos")
+            return 0
+
+    def contar_por_status(self):
+        """{status: quantidade}, com uma contagem por faixa de idx_produtos_data_validade"""
+        try:
+            geracao = self._validar_cache()
+            contagem = self.cache.contagem()
+            if contagem is not None:
+                instrumentacao.contar('cache.acertos')
+                return contagem
+            
+            instrumentacao.contar('cache.falhas')
+            conn = self.conexao()
+            contagem = {
+                status: conn.execute(
+                    f'SELECT COUNT(*) FROM produtos WHERE {condicao_status(status)}'
+                ).fetchone()[0]
+                for status in (STATUS_NORMAL, STATUS_PROXIMO_VENCIMENTO, STATUS_VENCIDO)
+            }
+            self.cache.guardar_contagem(geracao, contagem)
+            return contagem
+            
+        except Exception:
+            logger.exception("Erro ao contar produtos por status")
+            return {}
+
+    def validades_pendentes(self):
+        """[(id, data_validade)] dos lotes ainda não vencidos, para o agendador de validade"""
+        try:
+            # Faixa do índice de data_validade, que já contém o id: não lê a tabela
+            return self.conexao().execute(
+                f'SELECT id, data_validade FROM produtos WHERE data_validade >= {SQL_HOJE}'
+            ).fetchall()
+            
+        except Exception:
+            logger.exception("Erro ao ler datas de validade")
+            return []
+
+    def get_produtos(self, ids):
+        """Linhas de vw_produtos dos ids informados, em ordem de id"""
+        try:
+            geracao = self._validar_cache()
+            produtos, ids = self.cache.linhas(ids)
+            instrumentacao.contar('cache.acertos', len(produtos))
+            if ids:
+                instrumentacao.contar('cache.falhas', len(ids))
+                lidos = []
+                conn = self.conexao()
+                # Blocos abaixo do limite de parâmetros do SQLite
+                for inicio in range(0, len(ids), 500):
+                    bloco = ids[inicio:inicio + 500]
+                    marcadores = ', '.join('?' * len(bloco))
+                    lidos.extend(conn.execute(
+                        f'SELECT {SELECT_PRODUTOS} FROM vw_produtos WHERE id IN ({marcadores})', bloco
+                    ).fetchall())
+                self.cache.guardar_linhas(geracao, lidos)
+                produtos.extend(lidos)
+            produtos.sort(key=lambda produto: produto[0])
+            return produtos
+            
+        except Exception:
+            logger.exception("Erro ao buscar produtos")
+            return []
+
+    def carregar_pagina(self, apos_id=0, limite=500):
+        """Produtos com id > apos_id, em ordem de id (paginação por chave).
+
+        Para a próxima página passe o id da última linha recebida; o custo
+        não cresce com a posição, ao contrário de OFFSET.
+        """
+        try:
+            geracao = self._validar_cache()
+            pagina = self.cache.pagina(apos_id, limite)
+            if pagina is not None:
+                instrumentacao.contar('cache.acertos')
+                return pagina
+            
+            instrumentacao.contar('cache.falhas')
+            pagina = self.conexao().execute(f'''
+                SELECT {SELECT_PRODUTOS}
+                FROM vw_produtos
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (apos_id, limite)).fetchall()
+            self.cache.guardar_pagina(geracao, apos_id, limite, pagina)
+            return pagina
+            
+        except Exception:
+            logger.exception("Erro ao carregar página de produtos")
+            return []
+
+    def iterar_produtos(self, tamanho_pagina=1000, apos_id=0):
+        """Gera os produtos página a página, sem montar a tabela inteira em memória"""
+        while True:
+            pagina = self.carregar_pagina(apos_id, tamanho_pagina)
+            yield from pagina
+            if len(pagina) < tamanho_pagina:
+                return
+            apos_id = pagina[-1][0]
+
+    def buscar_produtos(self, termo, limite=200):
+        """Ids dos produtos cujo nome, lote ou CA contêm palavras começando pelos termos.
+
+        Resultado ordenado por relevância (bm25); limite=None retorna todos.
+        """
+        try:
+            consulta = consulta_fts(termo)
+            if not consulta:
                 return []
+            limite = -1 if limite is None else limite
             
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM produtos')
-            return cursor.fetchall()
+            if self.busca_textual_disponivel():
+                cursor = self.conexao().execute('''
+                    SELECT rowid FROM produtos_fts
+                    WHERE produtos_fts MATCH ?
+                    ORDER BY rank
+                    LIMIT ?
+                ''', (consulta, limite))
+            else:
+                padrao = f"%{termo.strip()}%"
+                cursor = self.conexao().execute('''
+                    SELECT id FROM produtos
+                    WHERE nome LIKE ? OR lote LIKE ? OR CAST(ca AS TEXT) LIKE ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (padrao, padrao, padrao, limite))
+            return [linha[0] for linha in cursor]
             
-        except Exception as e:
-            print(f"Erro ao carregar produtos: {e}")
+        except Exception:
+            logger.exception("Erro ao buscar produtos")
             return []
-        finally:
-            if conn:
-                conn.close()
 
     def get_produto(self, produto_id):
         try:
-            conn = self.connect()
-            if not conn:
-                return None
-            
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM produtos WHERE id = ?', (produto_id,))
-            return cursor.fetchone()
+            produtos = self.get_produtos([produto_id])
+            return produtos[0] if produtos else None
             
-        except Exception as e:
-            print(f"Erro ao buscar produto: {e}")
+        except Exception:
+            logger.exception("Erro ao buscar produto")
             return None
-        finally:
-            if conn:
-                conn.close()
 
     def excluir_produto(self, produto_id):
         try:
-            conn = self.connect()
-            if not conn:
-                return False
-            
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM produtos WHERE id = ?', (produto_id,))
-            conn.commit()
+            with self._escrita() as (conn, alteracoes):
+                conn.execute('DELETE FROM produtos WHERE id = ?', (produto_id,))
+                alteracoes.append(('remover', produto_id))
             return True
             
-        except Exception as e:
-            print(f"Erro ao excluir produto: {e}")
+        except Exception:
+            logger.exception("Erro ao excluir produto")
             return False
-        finally:
-            if conn:
-                conn.close()
 
-    def filtrar_por_status(self, status):
+    def ultima_alteracao(self):
+        """Sequência da alteração mais recente registrada no log"""
         try:
-            conn = self.connect()
-            if not conn:
-                return []
+            return self._ultimo_seq(self.conexao())
             
-            cursor = conn.cursor()
-            # Query SQL para filtrar por status
-            cursor.execute('''
-                SELECT id, nome, lote, ca, quantidade, 
-                       data_compra, data_fabricacao, data_validade, 
-                       val_dias, dias_rest, status
-                FROM produtos 
-                WHERE status = ?
-            ''', (status,))
+        except Exception:
+            logger.exception("Erro ao ler log de alterações")
+            return 0
+
+    def get_changes_since(self, seq):
+        """Alterações de produtos com sequência maior que seq.
+
+        Retorna (ultimo_seq, alteracoes), com alteracoes no formato
+        [(produto_id, operacao, linha), ...]: uma entrada por produto, na
+        ordem da última alteração, com operacao 'I', 'U' ou 'D' e a linha
+        atual da vw_produtos (None quando excluído). Um produto incluído e
+        excluído no intervalo não aparece. Se parte do intervalo já foi
+        removida por limpar_alteracoes, alteracoes é None e o consumidor
+        deve recarregar tudo.
+        """
+        try:
+            with self.transacao(imediata=False) as conn:
+                ultimo_seq = self._ultimo_seq(conn)
+                if seq >= ultimo_seq:
+                    return ultimo_seq, []
+                
+                primeiro_retido = conn.execute(
+                    'SELECT MIN(seq) FROM produtos_alteracoes'
+                ).fetchone()[0]
+                if primeiro_retido is None or primeiro_retido > seq + 1:
+                    return ultimo_seq, None
+                
+                # Primeira e última operação de cada produto no intervalo
+                resumo = {}
+                cursor = conn.execute('''
+                    SELECT produto_id, operacao FROM produtos_alteracoes
+                    WHERE seq > ? ORDER BY seq
+                ''', (seq,))
+                for produto_id, operacao in cursor:
+                    primeira = resumo.pop(produto_id, (operacao,))[0]
+                    resumo[produto_id] = (primeira, operacao)
+                
+                ids = [produto_id for produto_id, (_, ultima) in resumo.items() if ultima != 'D']
+                linhas = {}
+                for inicio in range(0, len(ids), 500):
+                    bloco = ids[inicio:inicio + 500]
+                    marcadores = ', '.join('?' * len(bloco))
+                    for linha in conn.execute(
+                        f'SELECT {SELECT_PRODUTOS} FROM vw_produtos WHERE id IN ({marcadores})', bloco
+                    ):
+                        linhas[linha[0]] = linha
             
-            return cursor.fetchall()
+            alteracoes = []
+            for produto_id, (primeira, ultima) in resumo.items():
+                if ultima == 'D':
+                    if primeira != 'I':
+                        alteracoes.append((produto_id, 'D', None))
+                else:
+                    operacao = 'I' if primeira == 'I' else 'U'
+                    alteracoes.append((produto_id, operacao, linhas.get(produto_id)))
+            return ultimo_seq, alteracoes
             
-        except Exception as e:
-            print(f"Erro ao filtrar por status: {e}")
+        except Exception:
+            logger.exception("Erro ao ler alterações")
+            return seq, None
+
+    def limpar_alteracoes(self, ate_seq):
+        """Remove do log as alterações com sequência até ate_seq"""
+        try:
+            with self.transacao() as conn:
+                conn.execute('DELETE FROM produtos_alteracoes WHERE seq <= ?', (ate_seq,))
+            return True
+            
+        except Exception:
+            logger.exception("Erro ao limpar log de alterações")
+            return False
+
+    def consultar_produtos(self, **filtros):
+        """Produtos que atendem aos filtros de montar_consulta_produtos, numa única consulta"""
+        try:
+            filtros.setdefault('usar_fts', self.busca_textual_disponivel())
+            sql, parametros = montar_consulta_produtos(**filtros)
+            return self.conexao().execute(sql, parametros).fetchall()
+            
+        except Exception:
+            logger.exception("Erro ao consultar produtos")
             return []
-        finally:
-            if conn:
-                conn.close()
 
-# Criar instância global do DatabaseManager
-db = DatabaseManager() 
\ No newline at end of file
+    def recalcular_status_gravado(self):
+        """Atualiza as colunas dias_restantes e status gravadas na tabela produtos.
+
+        O programa usa os valores calculados por vw_produtos; as colunas da
+        tabela só existem para quem lê o arquivo diretamente. Retorna a
+        quantidade de linhas atualizadas.
+        """
+        try:
+            with self.transacao() as conn:
+                desatualizadas = conn.execute('''
+                    SELECT v.dias_restantes, v.status, v.id
+                    FROM vw_produtos v JOIN produtos p ON p.id = v.id
+                    WHERE p.dias_restantes IS NOT v.dias_restantes OR p.status IS NOT v.status
+                ''').fetchall()
+                conn.executemany(
+                    'UPDATE produtos SET dias_restantes = ?, status = ? WHERE id = ?',
+                    desatualizadas
+                )
+            return len(desatualizadas)
+            
+        except Exception:
+            logger.exception("Erro ao recalcular status")
+            return None
+
+    def filtrar_por_status(self, status):
+        # Status é derivado da validade: a consulta vira uma faixa no índice de data_validade
+        return self.consultar_produtos(status=status)
+
+# Instância global do DatabaseManager, criada no primeiro uso: importar o
+# módulo (ex.: cli.py com --banco) não abre nem migra o database.db padrão
+_db = None
+_db_lock = threading.Lock()
+
+def get_db():
+    """DatabaseManager do database.db do programa"""
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = DatabaseManager()
+        return _db
+
+def __getattr__(nome):
+    # Compatibilidade com 'from database import db'
+    if nome == 'db':
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}") 
\ No newline at end of file
@@ -0,0 +1,266 @@
+"""Medição de tempos, contadores e log de consultas lentas.
+
+Desligada por padrão. Com a variável de ambiente TORP_INSTRUMENTACAO=1 o
+programa passa a registrar:
+
+- o tempo de cada método público do DatabaseManager e das principais
+  operações da interface (chamadas, total, máximo);
+- as consultas SQL acima de TORP_CONSULTA_LENTA_MS (padrão 100 ms), com
+  o texto e os parâmetros, no logger 'instrumentacao';
+- contadores (consultas, acertos e falhas do cache, tarefas da thread do banco).
+
+O resumo vai para o log ao sair e, se TORP_INSTRUMENTACAO_ARQUIVO estiver
+definido, para esse arquivo em JSON. Desligada, os decoradores devolvem
+a própria função e as conexões são sqlite3.Connection comuns: o custo é
+uma verificação de flag nos contadores.
+"""
+import atexit
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ATIVA = os.environ.get('TORP_INSTRUMENTACAO', '').strip().lower() not in ('', '0', 'false', 'nao', 'não')
+LIMITE_CONSULTA_LENTA_MS = float(os.environ.get('TORP_CONSULTA_LENTA_MS', '100'))
+
+class Estatisticas:
+    """Tempos e contadores acumulados no processo (seguro entre threads)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tempos = {}
+        self._contadores = {}
+
+    def registrar_tempo(self, nome, segundos):
+        with self._lock:
+            tempo = self._tempos.get(nome)
+            if tempo is None:
+                self._tempos[nome] = [1, segundos, segundos]
+            else:
+                tempo[0] += 1
+                tempo[1] += segundos
+                if segundos > tempo[2]:
+                    tempo[2] = segundos
+
+    def incrementar(self, nome, quantidade=1):
+        with self._lock:
+            self._contadores[nome] = self._contadores.get(nome, 0) + quantidade
+
+    def instantaneo(self):
+        """{'tempos': {nome: {...}}, 'contadores': {nome: n}} com os valores atuais"""
+        with self._lock:
+            return {
+                'tempos': {
+                    nome: {
+                        'chamadas': chamadas,
+                        'total_ms': round(total * 1000, 3),
+                        'media_ms': round(total * 1000 / chamadas, 3),
+                        'max_ms': round(maximo * 1000, 3),
+                    }
+                    for nome, (chamadas, total, maximo) in sorted(self._tempos.items())
+                },
+                'contadores': dict(sorted(self._contadores.items())),
+            }
+
+    def exportar(self, caminho):
+        """Grava o instantâneo em JSON"""
+        import json
+
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump(self.instantaneo(), arquivo, ensure_ascii=False, indent=1)
+        return caminho
+
+    def zerar(self):
+        with self._lock:
+            self._tempos.clear()
+            self._contadores.clear()
+
+    def registrar_resumo(self, maximo=20):
+        """Escreve no log as operações com maior tempo total"""
+        dados = self.instantaneo()
+        mais_lentas = sorted(dados['tempos'].items(), key=lambda item: item[1]['total_ms'], reverse=True)
+        for nome, tempo in mais_lentas[:maximo]:
+            logger.info(
+                "%-40s %6d chamadas  total %10.1f ms  média %8.2f ms  máx %8.1f ms",
+                nome, tempo['chamadas'], tempo['total_ms'], tempo['media_ms'], tempo['max_ms']
+            )
+        for nome, valor in dados['contadores'].items():
+            logger.info("%-40s %d", nome, valor)
+
+estatisticas = Estatisticas()
+
+def contar(nome, quantidade=1):
+    """Incrementa um contador (sem efeito com a instrumentação desligada)"""
+    if ATIVA:
+        estatisticas.incrementar(nome, quantidade)
+
+def iniciar():
+    """Marca o início de uma operação assíncrona; ver finalizar()"""
+    return time.perf_counter() if ATIVA else None
+
+def finalizar(nome, inicio):
+    """Registra o tempo desde iniciar(); inicio None é ignorado"""
+    if inicio is not None:
+        estatisticas.registrar_tempo(nome, time.perf_counter() - inicio)
+
+def cronometrado(nome):
+    """Decorador que registra o tempo de cada chamada em nome"""
+    def decorar(funcao):
+        if not ATIVA:
+            return funcao
+
+        @functools.wraps(funcao)
+        def medir(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                estatisticas.registrar_tempo(nome, time.perf_counter() - inicio)
+        return medir
+    return decorar
+
+def cronometrar_metodos(prefixo, ignorar=()):
+    """Decorador de classe: cronometra os métodos públicos como prefixo.metodo.
+
+    Geradores ficam de fora (o tempo seria só o da criação), assim como os
+    nomes em ignorar (ex.: métodos chamados a todo momento como conexao).
+    """
+    def decorar(classe):
+        if not ATIVA:
+            return classe
+        import inspect
+
+        for nome, funcao in list(vars(classe).items()):
+            if (nome.startswith('_') or nome in ignorar or not inspect.isfunction(funcao)
+                    or inspect.isgeneratorfunction(funcao)):
+                continue
+            setattr(classe, nome, cronometrado(f'{prefixo}.{nome}')(funcao))
+        return classe
+    return decorar
+
+# --- SQL
+
+def _resumir_sql(sql):
+    return ' '.join(sql.split())
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """Mede o tempo de cada instrução, incluindo a leitura das linhas"""
+
+    _sql = None
+    _parametros = None
+    _tempo = 0.0
+    _registrado = True
+
+    def _registrar(self):
+        if self._registrado:
+            return
+        self._registrado = True
+        estatisticas.registrar_tempo('sql', self._tempo)
+        if self._tempo * 1000 >= LIMITE_CONSULTA_LENTA_MS:
+            estatisticas.incrementar('sql.lentas')
+            logger.warning(
+                "Consulta lenta (%.1f ms): %s | parâmetros: %r",
+                self._tempo * 1000, _resumir_sql(self._sql), self._parametros
+            )
+
+    def _concluir(self, inicio, fim_da_consulta):
+        self._tempo += time.perf_counter() - inicio
+        if fim_da_consulta:
+            self._registrar()
+
+    def _iniciar(self, sql, parametros):
+        # Consulta anterior do mesmo cursor lida só em parte (ex.: fetchone)
+        self._registrar()
+        self._sql = sql
+        self._parametros = parametros
+        self._tempo = 0.0
+        self._registrado = False
+        estatisticas.incrementar('sql.consultas')
+
+    def execute(self, sql, parametros=()):
+        self._iniciar(sql, parametros)
+        inicio = time.perf_counter()
+        try:
+            super().execute(sql, parametros)
+        finally:
+            # Sem linhas a ler (INSERT, UPDATE, PRAGMA...) a instrução já terminou
+            self._concluir(inicio, self.description is None)
+        return self
+
+    def executemany(self, sql, sequencia):
+        self._iniciar(sql, '<executemany>')
+        inicio = time.perf_counter()
+        try:
+            super().executemany(sql, sequencia)
+        finally:
+            self._concluir(inicio, True)
+        return self
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        linha = super().fetchone()
+        self._concluir(inicio, linha is None)
+        return linha
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        linhas = super().fetchmany(self.arraysize if size is None else size)
+        self._concluir(inicio, not linhas)
+        return linhas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        self._concluir(inicio, True)
+        return linhas
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        try:
+            linha = super().__next__()
+        except StopIteration:
+            self._concluir(inicio, True)
+            raise
+        self._concluir(inicio, False)
+        return linha
+
+    def close(self):
+        self._registrar()
+        super().close()
+
+    def __del__(self):
+        # Cursores descartados sem ler todas as linhas
+        self._registrar()
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    """Conexão cujos cursores (inclusive os de execute()) são CursorInstrumentado"""
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    # Os atalhos em C criam o cursor sem passar por cursor()
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, sequencia):
+        return self.cursor().executemany(sql, sequencia)
+
+def fabrica_conexao():
+    """Classe a passar em sqlite3.connect(factory=...)"""
+    return ConexaoInstrumentada if ATIVA else sqlite3.Connection
+
+def _ao_sair():
+    estatisticas.registrar_resumo()
+    caminho = os.environ.get('TORP_INSTRUMENTACAO_ARQUIVO')
+    if caminho:
+        try:
+            estatisticas.exportar(caminho)
+        except OSError:
+            logger.exception("Erro ao exportar métricas para %s", caminho)
+
+if ATIVA:
+    atexit.register(_ao_sair)
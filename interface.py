@@ -1,23 +1,27 @@
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
-    QPushButton, QTableWidget, QTableWidgetItem, QDialog, QLabel, QLineEdit, 
+    QPushButton, QTableView, QAbstractItemView, QDialog, QLabel, QLineEdit, 
     QSpinBox, QDateEdit, QMessageBox, QFrame, QHeaderView, QMenu, QComboBox,
-    QFormLayout, QFileDialog, QGroupBox
+    QFormLayout, QFileDialog, QGroupBox, QStyle
 )
-from PyQt5.QtCore import Qt, QTimer, QDateTime, QDate, QSettings
-from PyQt5.QtGui import QIcon, QColor, QFont
+from PyQt5.QtCore import Qt, QTimer, QDateTime, QDate, QSettings, QModelIndex
+from PyQt5.QtGui import QIcon, QFont
 from datetime import datetime, timedelta
+import logging
 import os
 import sqlite3
-import shutil
-from tkinter import filedialog
-import pandas as pd
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import sys
-from PyQt5.QtWidgets import QApplication
-from database import db
+import instrumentacao
+from database import (
+    get_db, STATUS_NORMAL, STATUS_PROXIMO_VENCIMENTO, STATUS_VENCIDO, DIAS_AVISO_VENCIMENTO
+)
+from worker import DatabaseWorker
+from backup import RepositorioBackup
+from validade import AgendadorValidade, transferir_contagem
+from notificacoes import Aviso, FilaNotificacoes
+from relatorios import CABECALHOS, formatar_linha, gravar_relatorio
+from modelos import FiltroProdutos, ModeloProdutos
+
+logger = logging.getLogger(__name__)
 
 class DatabaseManager:
     def __init__(self):
@@ -32,8 +36,8 @@ class DatabaseManager:
             
             # Criar banco de dados e tabelas se não existirem
             self.create_database()
-        except Exception as e:
-            print(f"Erro na inicialização do banco de dados: {str(e)}")
+        except Exception:
+            logger.exception("Erro na inicialização do banco de dados")
 
     def create_database(self):
         try:
@@ -56,8 +60,8 @@ class DatabaseManager:
             ''')
 
             conn.commit()
-        except Exception as e:
-            print(f"Erro ao criar tabela: {str(e)}")
+        except Exception:
+            logger.exception("Erro ao criar tabela")
         finally:
             if conn:
                 conn.close()
@@ -65,8 +69,8 @@ class DatabaseManager:
     def connect(self):
         try:
             return sqlite3.connect(self.db_path)
-        except Exception as e:
-            print(f"Erro ao conectar ao banco de dados: {str(e)}")
+        except Exception:
+            logger.exception("Erro ao conectar ao banco de dados")
             return None
 
 class CadastroProdutoDialog(QDialog):
@@ -203,6 +207,7 @@ class CadastroProdutoDialog(QDialog):
         save_btn = QPushButton("Salvar")
         save_btn.setObjectName("saveButton")
         save_btn.clicked.connect(self.cadastrar_produto)
+        self.save_btn = save_btn
         
         cancel_btn = QPushButton("Cancelar")
         cancel_btn.setObjectName("cancelButton")
@@ -250,8 +255,8 @@ class CadastroProdutoDialog(QDialog):
                 self.dias_restantes_label.setText("Data de validade não definida")
                 self.dias_restantes_label.setStyleSheet("color: black; font-weight: bold;")
                 
-        except Exception as e:
-            print(f"Erro ao atualizar dias restantes: {e}")
+        except Exception:
+            logger.exception("Erro ao atualizar dias restantes")
 
     def cadastrar_produto(self):
         try:
@@ -277,16 +282,31 @@ class CadastroProdutoDialog(QDialog):
                 'data_validade': data_validade
             }
             
-            # Adicionar produto ao banco
-            if self.parent().db.adicionar_produto(**produto_dados):
-                self.parent().carregar_produtos()  # Atualiza a tabela principal
-                self.accept()
-            else:
-                QMessageBox.critical(self, "Erro", "Erro ao cadastrar produto!")
+            # Adicionar produto ao banco pela thread do banco de dados
+            self.save_btn.setEnabled(False)
+            self.parent().worker.executar(
+                self.parent().db.adicionar_produto,
+                ao_concluir=self._produto_cadastrado,
+                ao_falhar=self._falha_cadastro,
+                **produto_dados
+            )
                 
-        except Exception as e:
-            print(f"Erro ao cadastrar produto: {e}")  # Log do erro no console
-            # Produto foi salvo, então não mostramos mensagem de erro para o usuário
+        except Exception:
+            logger.exception("Erro ao cadastrar produto")
+            self.save_btn.setEnabled(True)
+
+    def _produto_cadastrado(self, produto):
+        self.save_btn.setEnabled(True)
+        if produto:
+            self.parent().aplicar_gravacao(produto)  # Insere só a nova linha
+            self.accept()
+        else:
+            QMessageBox.critical(self, "Erro", "Erro ao cadastrar produto!")
+
+    def _falha_cadastro(self, erro):
+        logger.error("Erro ao cadastrar produto", exc_info=erro)
+        self.save_btn.setEnabled(True)
+        QMessageBox.critical(self, "Erro", "Erro ao cadastrar produto!")
 
 class EditarProdutoDialog(QDialog):
     def __init__(self, produto, parent=None):
@@ -401,8 +421,8 @@ class EditarProdutoDialog(QDialog):
         self.data_validade_input = QDateEdit()
         self.data_validade_input.setCalendarPopup(True)
         self.data_validade_input.setDisplayFormat("dd/MM/yyyy")
-        if self.produto[7]:  # Data de validade está no índice 7
-            self.data_validade_input.setDate(QDate.fromString(str(self.produto[7]), 'dd/MM/yyyy'))
+        if self.produto[8]:  # Data de validade está no índice 8 (7 é a validade em dias)
+            self.data_validade_input.setDate(QDate.fromString(str(self.produto[8]), 'dd/MM/yyyy'))
         
         dates_layout.addRow("Data de Compra:", self.data_compra_input)
         dates_layout.addRow("Data de Fabricação:", self.data_fabricacao_input)
@@ -416,6 +436,7 @@ class EditarProdutoDialog(QDialog):
         save_btn = QPushButton("Salvar")
         save_btn.setObjectName("saveButton")
         save_btn.clicked.connect(self.editar_produto)
+        self.save_btn = save_btn
         
         cancel_btn = QPushButton("Cancelar")
         cancel_btn.setObjectName("cancelButton")
@@ -443,8 +464,10 @@ class EditarProdutoDialog(QDialog):
             data_fabricacao = self.data_fabricacao_input.date().toString('dd/MM/yyyy') if self.data_fabricacao_input.date().isValid() else None
             data_validade = self.data_validade_input.date().toString('dd/MM/yyyy') if self.data_validade_input.date().isValid() else None
             
-            # Atualizar produto no banco usando o ID original
-            if self.parent().db.atualizar_produto(
+            # Atualizar produto no banco usando o ID original, pela thread do banco de dados
+            self.save_btn.setEnabled(False)
+            self.parent().worker.executar(
+                self.parent().db.atualizar_produto,
                 self.produto[0],  # ID
                 nome,
                 lote,
@@ -452,20 +475,33 @@ class EditarProdutoDialog(QDialog):
                 quantidade,
                 data_compra,
                 data_fabricacao,
-                data_validade
-            ):
-                QMessageBox.information(self, "Sucesso", "Produto atualizado com sucesso!")
-                self.parent().carregar_produtos()  # Atualiza a tabela principal
-                self.accept()
-            else:
-                QMessageBox.critical(self, "Erro", "Erro ao atualizar produto!")
+                data_validade,
+                ao_concluir=self._produto_atualizado,
+                ao_falhar=self._falha_edicao
+            )
                 
         except Exception as e:
-            print(f"Erro ao editar produto: {e}")  # Log do erro para debug
+            logger.exception("Erro ao editar produto")
+            self.save_btn.setEnabled(True)
             QMessageBox.critical(self, "Erro", f"Erro ao atualizar produto: {str(e)}")
 
+    def _produto_atualizado(self, produto):
+        self.save_btn.setEnabled(True)
+        if produto:
+            self.parent().aplicar_gravacao(produto)  # Reescreve só a linha editada
+            QMessageBox.information(self, "Sucesso", "Produto atualizado com sucesso!")
+            self.accept()
+        else:
+            QMessageBox.critical(self, "Erro", "Erro ao atualizar produto!")
+
+    def _falha_edicao(self, erro):
+        logger.error("Erro ao editar produto", exc_info=erro)
+        self.save_btn.setEnabled(True)
+        QMessageBox.critical(self, "Erro", f"Erro ao atualizar produto: {str(erro)}")
+
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, banco=None, pasta_backups=None):
+        """banco e pasta_backups substituem o banco global e a pasta de backups (testes e benchmarks)"""
         super().__init__()
         self.setWindowTitle("Sistema de Controle de Produtos - TORP")
         
@@ -476,19 +512,57 @@ class MainWindow(QMainWindow):
         # Configurar para abrir em tela cheia
         self.showMaximized()
         
-        self.db = db
+        self.db = banco if banco is not None else get_db()
+        # Todo acesso ao banco e a arquivos passa pela thread do banco de dados
+        self.worker = DatabaseWorker(self)
+        self.worker.progresso.connect(self._exibir_progresso)
+        self.seq_alteracoes = None
+        self._carregando = False
+        self._alteracoes_pendentes = False
+        # (nome, início) da carga da tabela em andamento, para a instrumentação
+        self._medicao_tabela = None
+        # Próximas mudanças de status (30 dias antes e depois da validade)
+        self.agendador_validade = AgendadorValidade()
+        self.contagem_status = {}
         self.settings = QSettings('TorpEPI', 'Sistema de Controle')
         self.table = None  # Inicializa a tabela como None
         self.setupUI()  # Cria a interface
         self.setupMenuBar()  # Configura o menu
-        self.carregar_produtos()  # Carrega os produtos
         self.carregar_tamanho_colunas()  # Carrega as configurações de tamanho
-        self.setup_backup_timer()
+        self.setup_notificacoes()
+        self.setup_timer_validade()
+        self.setup_timer_alteracoes()
         
         # Criar pasta de backup se não existir
-        self.backup_folder = os.path.join(os.getenv('APPDATA'), 'TorpControl', 'backups')
+        self.backup_folder = pasta_backups or os.path.join(
+            os.getenv('APPDATA') or os.path.expanduser('~'), 'TorpControl', 'backups')
         if not os.path.exists(self.backup_folder):
             os.makedirs(self.backup_folder)
+        self.repositorio_backup = RepositorioBackup(
+            os.path.join(self.backup_folder, 'repositorio'),
+            compressao=self.settings.value('backup/compressao', 'zlib'),
+            ultimos=self.settings.value('backup/ultimos', 5, type=int),
+            horarios=self.settings.value('backup/horarios', 24, type=int),
+            diarios=self.settings.value('backup/diarios', 7, type=int),
+            semanais=self.settings.value('backup/semanais', 4, type=int)
+        )
+        self.setup_backup_timer()
+
+    # Os dados só começam a ser lidos depois que a janela aparece
+    _carga_agendada = False
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self._carga_agendada:
+            self._carga_agendada = True
+            # Roda na próxima volta do loop de eventos, depois da primeira pintura
+            QTimer.singleShot(0, self.iniciar_carga)
+
+    def iniciar_carga(self):
+        """Primeiras leituras do banco, com a janela já na tela"""
+        self.carregar_produtos()  # Carrega os produtos em segundo plano
+        self.carregar_validades()
+        self.worker.executar(self._importar_backups_antigos, chave='backup', cancelavel=True)
 
     def setupUI(self):
         self.setWindowTitle("Torp- Sistema de Controle de EPI 1.0")
@@ -497,13 +571,13 @@ class MainWindow(QMainWindow):
             QMainWindow {
                 background-color: #f0f0f0;
             }
-            QTableWidget {
+            QTableView {
                 background-color: white;
                 border: 1px solid #ddd;
                 border-radius: 4px;
                 gridline-color: #ddd;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 5px;
             }
             QHeaderView::section {
@@ -559,7 +633,7 @@ class MainWindow(QMainWindow):
         search_layout = QHBoxLayout(search_frame)
         
         self.search_input = QLineEdit()
-        self.search_input.setPlaceholderText("Pesquisar por nome ou lote...")
+        self.search_input.setPlaceholderText("Pesquisar por nome, lote ou CA...")
         self.search_input.setMinimumWidth(300)
         
         self.search_button = QPushButton("Buscar")
@@ -570,12 +644,16 @@ class MainWindow(QMainWindow):
         search_layout.addWidget(self.search_button)
         layout.addWidget(search_frame)
 
-        # Configurar a tabela com colunas redimensionáveis
-        self.table = QTableWidget()
-        self.table.setColumnCount(11)
-        headers = ["ID", "Nome", "Lote", "CA", "Qtd.", "Data Compra", 
-                  "Data Fab.", "Val. Dias", "Data Val.", "Dias Rest.", "Status"]
-        self.table.setHorizontalHeaderLabels(headers)
+        # Tabela sobre um modelo que lê os produtos por páginas conforme a rolagem
+        self.table = QTableView()
+        self.modelo = ModeloProdutos(self._buscar_pagina, self.TAMANHO_PAGINA, self)
+        self.modelo.falha_carga.connect(self._falha_carga)
+        # Páginas que chegam podem não ter linhas que passem pelo filtro
+        self.modelo.rowsInserted.connect(self._agendar_preenchimento)
+        # Filtros e busca sem reler o banco; a ordenação é feita pelo modelo
+        self.filtro = FiltroProdutos(self)
+        self.filtro.setSourceModel(self.modelo)
+        self.table.setModel(self.filtro)
         
         # Configurar cabeçalhos da tabela
         header = self.table.horizontalHeader()
@@ -602,16 +680,25 @@ class MainWindow(QMainWindow):
             self.table.setColumnWidth(col, width)
         
         # Configurações adicionais da tabela
-        self.table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.table.setSelectionMode(QTableWidget.SingleSelection)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
         self.table.setAlternatingRowColors(True)
         self.table.verticalHeader().setVisible(False)
         
-        # Conectar sinal de mudança de tamanho de coluna
+        # Conectar sinal de mudança de tamanho de coluna; as larguras são
+        # gravadas juntas quando o arraste termina
+        self._larguras_pendentes = {}
+        self._ajuste_automatico = False
+        self.timer_colunas = QTimer(self)
+        self.timer_colunas.setSingleShot(True)
+        self.timer_colunas.setInterval(self.ATRASO_GRAVAR_COLUNAS_MS)
+        self.timer_colunas.timeout.connect(self.gravar_tamanho_colunas)
         self.table.horizontalHeader().sectionResized.connect(self.salvar_tamanho_colunas)
         
         # Estilizar a tabela
         self.table.setAlternatingRowColors(True)
+        # Ordem inicial por ID crescente, a mesma das páginas: não exige ler tudo
+        header.setSortIndicator(0, Qt.AscendingOrder)
         self.table.setSortingEnabled(True)
         
         # Configurar menu de contexto para o cabeçalho
@@ -640,18 +727,24 @@ class MainWindow(QMainWindow):
         # Filtros específicos
         self.nome_filter = QLineEdit()
         self.nome_filter.setPlaceholderText("Filtrar por Nome")
-        self.nome_filter.textChanged.connect(self.apply_filters)
+        self.nome_filter.textChanged.connect(self._agendar_filtros)
         
         self.lote_filter = QLineEdit()
         self.lote_filter.setPlaceholderText("Filtrar por Lote")
-        self.lote_filter.textChanged.connect(self.apply_filters)
+        self.lote_filter.textChanged.connect(self._agendar_filtros)
         
         self.status_filter_combo = QComboBox()
         self.status_filter_combo.addItem("Todos")
         self.status_filter_combo.addItem("Normal")
         self.status_filter_combo.addItem("Próximo do Vencimento")
         self.status_filter_combo.addItem("Vencido")
-        self.status_filter_combo.currentTextChanged.connect(self.apply_status_filter)
+        self.status_filter_combo.currentTextChanged.connect(self.apply_filters)
+        
+        # Filtros de texto aplicados quando a digitação pausa, não a cada tecla
+        self.timer_filtros = QTimer(self)
+        self.timer_filtros.setSingleShot(True)
+        self.timer_filtros.setInterval(self.ATRASO_FILTROS_MS)
+        self.timer_filtros.timeout.connect(self.apply_filters)
         
         # Adicionar filtros ao layout
         filter_layout.addWidget(QLabel("Nome:"))
@@ -727,9 +820,14 @@ class MainWindow(QMainWindow):
         timer.timeout.connect(self.update_datetime)
         timer.start(1000)  # Atualiza a cada segundo
         
+        # Contadores de status, mantidos pelo agendador de validade
+        self.contagem_label = QLabel()
+        
         # Adicionar labels ao layout do rodapé
         footer_layout.addWidget(dev_label)
         footer_layout.addStretch()
+        footer_layout.addWidget(self.contagem_label)
+        footer_layout.addSpacing(20)
         footer_layout.addWidget(self.datetime_label)
         
         # Adicionar rodapé ao layout principal
@@ -742,48 +840,9 @@ class MainWindow(QMainWindow):
         self.datetime_label.setText(formatted_datetime)
 
     def add_produto(self):
+        # O próprio diálogo grava o produto e atualiza a tabela
         dialog = CadastroProdutoDialog(self)
-        if dialog.exec_() == QDialog.Accepted:
-            try:
-                conn = self.db.connect()
-                if not conn:
-                    raise Exception("Não foi possível conectar ao banco de dados")
-                    
-                cursor = conn.cursor()
-                
-                # Calcular data de validade
-                data_fab = dialog.data_fabricacao.date().toPyDate()
-                val_dias = getattr(dialog, '_dias_reais', dialog.validade_dias.value())
-                if len(str(dialog.validade_dias.value())) <= 2 and 1 <= dialog.validade_dias.value() <= 12:
-                    val_dias = dialog.validade_dias.value() * 365
-                data_val = data_fab + timedelta(days=val_dias)
-                
-                cursor.execute("""
-                    INSERT INTO produtos (
-                        nome, lote, ca, quantidade, data_compra, 
-                        data_fabricacao, validade_dias, data_validade
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    dialog.nome.text(),
-                    dialog.lote.text(),
-                    dialog.ca.value(),
-                    dialog.quantidade.value(),
-                    dialog.data_compra.date().toPyDate(),
-                    data_fab,
-                    val_dias,  # Usar o valor real em dias
-                    data_val
-                ))
-                
-                conn.commit()
-                QMessageBox.information(self, "Sucesso", "Produto cadastrado com sucesso!")
-                self.load_produtos()  # Recarregar a tabela
-                
-            except Exception as e:
-                QMessageBox.critical(self, "Erro", f"Erro ao cadastrar produto: {str(e)}")
-            finally:
-                if conn:
-                    conn.close()
+        dialog.exec_()
 
     def dias_para_anos(self, dias):
         """Converte dias para anos e dias"""
@@ -799,81 +858,280 @@ class MainWindow(QMainWindow):
             return f"{anos} ano(s)"
         return f"{dias} dia(s)"
 
+    TAMANHO_PAGINA = 1000
+
     def carregar_produtos(self):
+        """Recarrega a tabela a partir da primeira página; as demais são lidas conforme a rolagem"""
         try:
-            # Limpa a tabela antes de carregar os dados
-            self.table.setRowCount(0)
+            # Páginas da carga anterior que ainda chegarem são descartadas
+            self.modelo.suspender_busca()
+            self._carregando = True
+            self._medicao_tabela = ('ui.carregar_produtos', instrumentacao.iniciar())
             
-            # Carrega os produtos do banco de dados
-            produtos = self.db.carregar_produtos()
-            
-            # Configura o número de linhas na tabela
-            self.table.setRowCount(len(produtos))
+            # A chave 'tabela' cancela cargas ou filtros anteriores ainda pendentes
+            self.worker.executar(
+                self._ler_primeira_pagina,
+                chave='tabela',
+                ao_concluir=self._receber_primeira_pagina,
+                ao_falhar=self._falha_carga
+            )
             
-            # Preenche a tabela com os dados
-            for row, produto in enumerate(produtos):
-                for col, valor in enumerate(produto):
-                    # Tratamento especial para datas
-                    if col in [5, 6, 7] and valor:  # Colunas de data
-                        try:
-                            data = datetime.strptime(valor, '%Y-%m-%d')
-                            valor = data.strftime('%d/%m/%Y')
-                        except:
-                            pass
-                    
-                    item = QTableWidgetItem(str(valor) if valor is not None else "")
-                    
-                    # Colorir célula de status
-                    if col == 9:  # Coluna de status
-                        if valor == "Vencido":
-                            item.setForeground(QColor("red"))
-                        elif valor == "Próximo do Vencimento":
-                            item.setForeground(QColor("orange"))
-                        elif valor == "Normal":
-                            item.setForeground(QColor("green"))
-                    
-                    self.table.setItem(row, col, item)
-                
-                # Verificar data de validade e colorir linha
-                try:
-                    data_validade_item = self.table.item(row, 8)  # Coluna da data de validade
-                    if data_validade_item and data_validade_item.text():
-                        # Alterado aqui: usando o formato YYYY-MM-DD
-                        data_validade = datetime.strptime(data_validade_item.text(), '%Y-%m-%d')
-                        hoje = datetime.now()
-                        
-                        # Se já estiver vencido (vermelho)
-                        if data_validade < hoje:
-                            self._colorir_linha(row, QColor(255, 200, 200))  # Vermelho claro
-                        
-                        # Se estiver próximo do vencimento (30 dias) (amarelo)
-                        elif data_validade < hoje + timedelta(days=30):
-                            self._colorir_linha(row, QColor(255, 255, 200))  # Amarelo claro
-                except Exception as e:
-                    print(f"Erro ao colorir linha {row}: {e}")
+        except Exception as e:
+            self._falha_carga(e)
+
+    def _ler_primeira_pagina(self):
+        # Roda na thread do banco. Alterações posteriores a este ponto serão
+        # aplicadas por aplicar_alteracoes
+        seq = self.db.ultima_alteracao()
+        return seq, self.db.carregar_pagina(0, self.TAMANHO_PAGINA)
+
+    @instrumentacao.cronometrado('ui.primeira_pagina')
+    def _receber_primeira_pagina(self, resultado):
+        self.seq_alteracoes, pagina = resultado
+        self.modelo.definir_linhas(pagina, paginado=True)
+        self._tabela_carregada()
+
+    def _buscar_pagina(self, apos_id, limite, ao_receber, ao_falhar):
+        # Pedido pelo modelo quando a rolagem chega ao fim das linhas carregadas
+        self.worker.executar(
+            self.db.carregar_pagina, apos_id, limite,
+            chave='tabela',
+            ao_concluir=ao_receber,
+            ao_falhar=ao_falhar
+        )
+
+    def _tabela_carregada(self):
+        self._carregando = False
+        if self._medicao_tabela is not None:
+            instrumentacao.finalizar(*self._medicao_tabela)
+            self._medicao_tabela = None
+        self._agendar_preenchimento()
+        
+        # Ajusta as colunas sem largura salva, por amostra
+        self.ajustar_colunas(manter_salvas=True)
+        
+        if self._alteracoes_pendentes:
+            self._alteracoes_pendentes = False
+            self.aplicar_alteracoes()
+
+    def _falha_carga(self, erro):
+        logger.error("Erro ao carregar produtos", exc_info=erro)
+        self._carregando = False
+        self._medicao_tabela = None
+        QMessageBox.critical(self, "Erro", "Erro ao carregar produtos!")
+
+    def _agendar_preenchimento(self, *_):
+        # Depois que o filtro e a view processarem as linhas novas
+        QTimer.singleShot(0, self._preencher_area_visivel)
+
+    def _preencher_area_visivel(self):
+        """Lê mais páginas enquanto as linhas filtradas não ocuparem a tabela.
+
+        A view só pede páginas quando a rolagem chega ao fim; com um filtro
+        restritivo uma página inteira pode não ter nenhuma linha visível.
+        """
+        if self._carregando or not self.filtro.canFetchMore(QModelIndex()):
+            return
+        total = self.filtro.rowCount()
+        if total == 0 or self.table.visualRect(self.filtro.index(total - 1, 0)).top() < self.table.viewport().height():
+            self.filtro.fetchMore(QModelIndex())
+
+    def aplicar_gravacao(self, produto):
+        """Reflete na tabela só a linha devolvida por adicionar/atualizar_produto"""
+        if self._carregando:
+            # A carga em andamento termina com aplicar_alteracoes
+            self._alteracoes_pendentes = True
+            return
+        # O log de alterações ainda trará esta linha; reaplicá-la não muda nada
+        self._registrar_validades([(produto[0], 'U', produto)])
+        self.modelo.gravar_produto(produto)
+        # Avança seq_alteracoes até esta gravação (e as de outros processos)
+        self.aplicar_alteracoes()
+
+    def aplicar_alteracoes(self):
+        """Atualiza só as linhas alteradas desde a última leitura (log de alterações)"""
+        if self._carregando:
+            # Aplicadas quando a carga em andamento terminar
+            self._alteracoes_pendentes = True
+            return
+        if self.seq_alteracoes is None:
+            self.carregar_produtos()
+            return
+        self.worker.executar(
+            self.db.get_changes_since, self.seq_alteracoes,
+            chave='alteracoes',
+            ao_concluir=self._receber_alteracoes,
+            ao_falhar=lambda erro: self.carregar_produtos()
+        )
+
+    @instrumentacao.cronometrado('ui.aplicar_alteracoes')
+    def _receber_alteracoes(self, resultado):
+        try:
+            if self._carregando:
+                self._alteracoes_pendentes = True
+                return
             
-            # Ajusta o tamanho das colunas
-            self.table.resizeColumnsToContents()
+            ultimo_seq, alteracoes = resultado
+            if alteracoes is None:
+                # Log já limpo além deste ponto
+                self.carregar_produtos()
+                self.carregar_validades()
+                return
+            self.seq_alteracoes = ultimo_seq
+            if not alteracoes:
+                return
+            self._registrar_validades(alteracoes)
+            # Linhas alteradas entram ou saem do filtro sozinhas (filtro dinâmico)
+            self.modelo.aplicar_alteracoes(alteracoes)
             
-        except Exception as e:
-            print(f"Erro ao carregar produtos: {e}")
-            QMessageBox.critical(self, "Erro", "Erro ao carregar produtos!")
+        except Exception:
+            logger.exception("Erro ao aplicar alterações")
+            self.carregar_produtos()
+
+    INTERVALO_ALTERACOES = 30 * 1000
+
+    def setup_timer_alteracoes(self):
+        """Lê o log de alterações periodicamente, sem recarregar a tabela"""
+        # Traz gravações de outros processos (linha de comando, outra instância)
+        # e mantém seq_alteracoes em dia para a limpeza do log após o backup
+        self.timer_alteracoes = QTimer(self)
+        self.timer_alteracoes.timeout.connect(self.aplicar_alteracoes)
+        self.timer_alteracoes.start(self.INTERVALO_ALTERACOES)
+
+    def setup_timer_validade(self):
+        """Dispara as mudanças de status na virada do dia, sem percorrer a tabela"""
+        self.timer_validade = QTimer(self)
+        self.timer_validade.setSingleShot(True)
+        self.timer_validade.timeout.connect(self.virada_do_dia)
+
+    def carregar_validades(self):
+        """(Re)monta o agendador de validade e os contadores na thread do banco"""
+        self.worker.executar(
+            self._ler_validades,
+            chave='validades',
+            ao_concluir=self._validades_carregadas,
+            ao_falhar=lambda erro: logger.error("Erro ao carregar datas de validade", exc_info=erro)
+        )
+
+    def _ler_validades(self):
+        # Roda na thread do banco
+        self.agendador_validade.carregar(self.db.validades_pendentes())
+        return self.db.contar_por_status()
+
+    def _validades_carregadas(self, contagem):
+        self.contagem_status = contagem
+        self._exibir_contagem()
+        self._agendar_virada_do_dia()
+
+    def _agendar_virada_do_dia(self):
+        # Dispara logo depois da meia-noite local; se o próximo evento for
+        # mais distante, o timer só consulta o topo do heap e se reagenda
+        agora = datetime.now()
+        meia_noite = datetime.combine(agora.date() + timedelta(days=1), datetime.min.time())
+        self.timer_validade.start(int((meia_noite - agora).total_seconds() * 1000) + 1000)
+
+    def virada_do_dia(self):
+        """Aplica as mudanças de status do dia só aos lotes que cruzaram um limite"""
+        mudancas = self.agendador_validade.avancar()
+        self._agendar_virada_do_dia()
+        if not mudancas:
+            return
+        
+        for status_anterior, status_novo in mudancas.values():
+            transferir_contagem(self.contagem_status, status_anterior, status_novo)
+        self._exibir_contagem()
+        self.alertar_mudancas_status(mudancas)
+        
+        self.worker.executar(
+            self.db.get_produtos, list(mudancas),
+            ao_concluir=self._receber_mudancas_status
+        )
+
+    def _receber_mudancas_status(self, produtos):
+        for produto in produtos:
+            self.enviar_email_aviso(produto)
+        # Lotes podem entrar ou sair do filtro de status
+        self._atualizar_linhas(produtos)
+
+    def _atualizar_linhas(self, produtos):
+        # Reescreve só as linhas dos produtos informados, se estiverem na tabela
+        self.modelo.atualizar_linhas(produtos)
+
+    def _registrar_validades(self, alteracoes):
+        # Inclusões, edições e exclusões chegam pelo log de alterações
+        for produto_id, operacao, produto in alteracoes:
+            if operacao == 'D' or produto is None:
+                self.agendador_validade.remover(produto_id)
+            else:
+                self.agendador_validade.atualizar(produto_id, produto[8])  # data_validade
+        self.worker.executar(
+            self.db.contar_por_status,
+            chave='contagem',
+            ao_concluir=self._contagem_atualizada
+        )
+
+    def _contagem_atualizada(self, contagem):
+        self.contagem_status = contagem
+        self._exibir_contagem()
+
+    def _exibir_contagem(self):
+        self.contagem_label.setText(
+            f"Vencidos: {self.contagem_status.get(STATUS_VENCIDO, 0)}  |  "
+            f"Próximos do vencimento: {self.contagem_status.get(STATUS_PROXIMO_VENCIMENTO, 0)}  |  "
+            f"Normais: {self.contagem_status.get(STATUS_NORMAL, 0)}"
+        )
+
+    def alertar_mudancas_status(self, mudancas):
+        """Avisa sobre os lotes que mudaram de status hoje ({id: (anterior, novo)})"""
+        vencidos = sum(1 for _, novo in mudancas.values() if novo == STATUS_VENCIDO)
+        proximos = len(mudancas) - vencidos
+        partes = []
+        if vencidos:
+            partes.append(f"{vencidos} lote(s) venceram")
+        if proximos:
+            partes.append(f"{proximos} lote(s) a {DIAS_AVISO_VENCIMENTO} dias do vencimento")
+        self.statusBar().showMessage("Hoje: " + ", ".join(partes))
 
     def search_produtos(self):
-        termo_pesquisa = self.search_input.text().lower()
-        for row in range(self.table.rowCount()):
-            # Verifica se o item existe antes de acessar
-            item = self.table.item(row, 2)  # Supondo que a coluna do lote é a 2
-            if item is not None:
-                lote = item.text().lower()
-                # Lógica de pesquisa aqui
-                if termo_pesquisa in lote:
-                    self.table.setRowHidden(row, False)
-                else:
-                    self.table.setRowHidden(row, True)
-            else:
-                # Se o item for None, esconda a linha ou trate conforme necessário
-                self.table.setRowHidden(row, True)
+        termo_pesquisa = self.search_input.text().strip()
+        if not termo_pesquisa:
+            self.filtro.definir_ids(None)
+            self._agendar_preenchimento()
+            return
+        
+        # A busca por nome, lote e CA é resolvida pelo índice textual do banco
+        inicio = instrumentacao.iniciar()
+        self.worker.executar(
+            self.db.buscar_produtos, termo_pesquisa, limite=None,
+            chave='busca',
+            ao_concluir=lambda ids: self._exibir_resultado_busca(ids, inicio)
+        )
+
+    def _exibir_resultado_busca(self, ids, inicio=None):
+        # Encontrados em páginas ainda não lidas aparecem conforme elas chegam
+        self.filtro.definir_ids(ids)
+        self._agendar_preenchimento()
+        instrumentacao.finalizar('ui.busca', inicio)
+
+    def exportar_relatorio(self, format_type, file_name, ao_concluir=None, ao_falhar=None):
+        """Grava o relatório da tabela atual em file_name, sem diálogos.
+
+        Contém as linhas que passam pelos filtros, na ordem exibida. As
+        páginas ainda não lidas são buscadas antes; o texto das linhas e o
+        arquivo são gerados na thread do banco e ao_concluir recebe file_name.
+        """
+        def gravar():
+            self.worker.executar(
+                self._gravar_relatorio, format_type, file_name, self.filtro.linhas(),
+                ao_concluir=ao_concluir,
+                ao_falhar=ao_falhar
+            )
+        self.modelo.completar(gravar, ao_falhar)
+
+    @staticmethod
+    def _gravar_relatorio(format_type, file_name, produtos):
+        # Roda na thread do banco, sobre a cópia das linhas na ordem exibida
+        return gravar_relatorio(format_type, file_name, CABECALHOS, [formatar_linha(p) for p in produtos])
 
     def show_export_dialog(self):
         dialog = ExportDialog(self)
@@ -882,22 +1140,18 @@ class MainWindow(QMainWindow):
     def editar_produto_selecionado(self):
         try:
             # Obtém a linha selecionada
-            linha_selecionada = self.table.currentRow()
+            linha_selecionada = self.filtro.mapToSource(self.table.currentIndex()).row()
             if linha_selecionada >= 0:
-                # Obtém os dados do produto selecionado
-                produto = []
-                for col in range(self.table.columnCount()):
-                    item = self.table.item(linha_selecionada, col)
-                    produto.append(item.text() if item else None)
+                # Obtém os dados do produto selecionado, como exibidos
+                produto = self.modelo.textos(linha_selecionada)
                 
                 # Abre o diálogo de edição
+                # O próprio diálogo grava o produto e atualiza a linha
                 dialog = EditarProdutoDialog(produto, self)
-                if dialog.exec_() == QDialog.Accepted:
-                    # Recarrega a tabela após a edição
-                    self.carregar_produtos()
+                dialog.exec_()
                     
-        except Exception as e:
-            print(f"Erro ao editar produto: {e}")
+        except Exception:
+            logger.exception("Erro ao editar produto")
             QMessageBox.critical(self, "Erro", "Erro ao abrir edição do produto!")
 
     def show_header_menu(self, pos):
@@ -907,126 +1161,174 @@ class MainWindow(QMainWindow):
         
         # Opção para ajustar ao conteúdo
         fit_action = menu.addAction("Ajustar à Coluna")
-        fit_action.triggered.connect(lambda: header.resizeSection(
-            header.logicalIndexAt(pos), 
-            header.sectionSizeHint(header.logicalIndexAt(pos))
-        ))
+        coluna = header.logicalIndexAt(pos)
+        fit_action.triggered.connect(lambda: self.ajustar_colunas([coluna]))
         
         # Opção para ajustar todas as colunas
         fit_all_action = menu.addAction("Ajustar Todas as Colunas")
-        fit_all_action.triggered.connect(self.table.resizeColumnsToContents)
+        fit_all_action.triggered.connect(lambda: self.ajustar_colunas())
         
         menu.exec_(header.mapToGlobal(pos))
 
+    ATRASO_FILTROS_MS = 250
+    ATRASO_GRAVAR_COLUNAS_MS = 500
+    # Linhas visíveis medidas no ajuste das colunas (telas muito altas)
+    AMOSTRA_LINHAS_VISIVEIS = 100
+
+    def _agendar_filtros(self, _texto=None):
+        # Reinicia a contagem a cada tecla
+        self.timer_filtros.start()
+
+    @instrumentacao.cronometrado('ui.aplicar_filtros')
     def apply_filters(self):
         """Aplicar filtros à tabela"""
-        for row in range(self.table.rowCount()):
-            nome = self.table.item(row, 1).text().lower() if self.table.item(row, 1) else ""
-            lote = self.table.item(row, 2).text().lower() if self.table.item(row, 2) else ""
-            status = self.table.item(row, 9).text() if self.table.item(row, 9) else ""
-            
-            nome_match = self.nome_filter.text().lower() in nome
-            lote_match = self.lote_filter.text().lower() in lote
-            status_match = (self.status_filter_combo.currentText() == "Todos" or 
-                          self.status_filter_combo.currentText() == status)
-            
-            self.table.setRowHidden(row, not (nome_match and lote_match and status_match))
+        self.timer_filtros.stop()
+        # Nome, lote e status combinados numa única passada do filtro
+        self.filtro.definir_filtros(
+            self.nome_filter.text(),
+            self.lote_filter.text(),
+            self.status_filter_combo.currentText()
+        )
+        self._agendar_preenchimento()
 
     def apply_status_filter(self):
         """Aplica o filtro de status à tabela."""
-        selected_status = self.status_filter_combo.currentText()
-        for row in range(self.table.rowCount()):
-            status_item = self.table.item(row, 10)  # Ajustado para a coluna 10
-            if status_item:
-                status = status_item.text()
-                if selected_status == "Todos" or status == selected_status:
-                    self.table.setRowHidden(row, False)
-                else:
-                    self.table.setRowHidden(row, True)
+        self.apply_filters()
 
     def setup_backup_timer(self):
-        """Configura o timer para realizar backup a cada 2 dias."""
+        """Configura o backup automático de hora em hora.
+
+        Os backups são incrementais (só as páginas alteradas são gravadas) e
+        a retenção do repositório mantém um por hora, por dia e por semana.
+        """
         self.backup_timer = QTimer(self)
-        # 2 dias em milissegundos: 2 * 24 * 60 * 60 * 1000
-        self.backup_timer.setInterval(2 * 24 * 60 * 60 * 1000)
         self.backup_timer.timeout.connect(self.backup_database)
-        self.backup_timer.start()
+        # Primeiro backup depois que a tabela já carregou; os seguintes de hora em hora
+        self.backup_timer.start(60 * 1000)
 
     def backup_database(self):
-        """Faz backup do banco de dados e remove o backup antigo."""
-        try:
-            # Caminho do banco de dados
-            db_path = self.db.db_path
-            # Caminho para o backup
-            backup_path = os.path.join(os.path.dirname(db_path), 'torp_database_backup.db')
-            
-            # Remover backup antigo, se existir
-            if os.path.exists(backup_path):
-                os.remove(backup_path)
-            
-            # Copiar o banco de dados para o backup
-            shutil.copy2(db_path, backup_path)
-            print("Backup realizado com sucesso!")
-        
-        except Exception as e:
-            print(f"Erro ao fazer backup: {str(e)}")
+        """Faz o backup automático no repositório de backups."""
+        self.backup_timer.setInterval(60 * 60 * 1000)
+        if self.worker.ocupado('backup'):
+            return
+        self.worker.executar(
+            self._backup_automatico,
+            chave='backup',
+            cancelavel=True,
+            ao_concluir=lambda entrada: entrada and logger.info("Backup %s realizado", entrada['id']),
+            ao_falhar=lambda erro: logger.error("Erro ao fazer backup", exc_info=erro)
+        )
+
+    def _backup_automatico(self, cancelar=None):
+        # Roda na thread do banco; sem alterações desde o último backup não há o que guardar
+        ultimo = self.repositorio_backup.ultimo_backup()
+        entrada = None
+        if ultimo is None or ultimo.get('seq_alteracoes') != self.db.ultima_alteracao():
+            entrada = self.db.backup_incremental(
+                self.repositorio_backup, progresso=self._progresso_backup, cancelar=cancelar,
+                tipo='automatico')
+        self._limpar_log_alteracoes()
+        return entrada
+
+    def _limpar_log_alteracoes(self):
+        # Roda na thread do banco. A tabela é a única leitora do log: o que ela
+        # já aplicou pode sair. Outra instância que ficar para trás recebe None
+        # de get_changes_since e recarrega tudo.
+        seq = self.seq_alteracoes
+        if seq:
+            self.db.limpar_alteracoes(seq)
+
+    def _importar_backups_antigos(self, cancelar=None):
+        # Roda na thread do banco: leva para o repositório os backups .db das versões anteriores
+        importados = self.repositorio_backup.arquivos_importados()
+        for nome in sorted(os.listdir(self.backup_folder)):
+            if cancelar is not None and cancelar.is_set():
+                # Fechando o programa: os restantes ficam para a próxima vez
+                return
+            if nome.endswith('.db') and nome not in importados:
+                try:
+                    self.repositorio_backup.importar_arquivo(
+                        os.path.join(self.backup_folder, nome), tipo='importado')
+                except Exception:
+                    logger.exception("Erro ao importar backup %s", nome)
+
+    def _progresso_backup(self, copiadas, total):
+        # Chamado na thread do banco a cada etapa da cópia
+        self.worker.informar_progresso("Backup", copiadas, total)
+
+    def _exibir_progresso(self, etapa, feito, total):
+        if total and feito < total:
+            self.statusBar().showMessage(f"{etapa}: {feito * 100 // total}%")
+        else:
+            self.statusBar().showMessage(f"{etapa}: concluído", 5000)
+
+    def setup_notificacoes(self):
+        """Fila de avisos de validade por e-mail, enviada numa thread própria"""
+        self.notificacoes_ativas = self.settings.value('email/avisos_ativos', True, type=bool)
+        self.destinatarios_aviso = [
+            destinatario.strip()
+            for destinatario in self.settings.value('email/destinatarios', "fabiane.lourenco@torp.ind.br").split(',')
+            if destinatario.strip()
+        ]
+        self.notificacoes = FilaNotificacoes(
+            self.settings.value('email/remetente', "dtitorp@gmail.com"),
+            self.settings.value('email/senha', "torp@2021"),  # Substitua pela senha correta ou use um App Password
+            servidor=self.settings.value('email/servidor', 'smtp.gmail.com'),
+            porta=self.settings.value('email/porta', 587, type=int),
+            usar_tls=self.settings.value('email/usar_tls', True, type=bool)
+        )
 
     def enviar_email_aviso(self, produto):
-        """Envia um e-mail de aviso sobre o produto próximo do vencimento."""
-        try:
-            # Configurações do e-mail
-            remetente = "dtitorp@gmail.com"
-            senha = "torp@2021"  # Substitua pela senha correta ou use um App Password
-            destinatario = "fabiane.lourenco@torp.ind.br"
-            assunto = f"Aviso: Produto {produto[1]} próximo do vencimento"
-            corpo = f"O produto {produto[1]} (Lote: {produto[2]}) está a 30 dias do vencimento."
-
-            # Criar mensagem
-            msg = MIMEMultipart()
-            msg['From'] = remetente
-            msg['To'] = destinatario
-            msg['Subject'] = assunto
-            msg.attach(MIMEText(corpo, 'plain'))
-
-            # Conectar ao servidor SMTP do Gmail
-            server = smtplib.SMTP('smtp.gmail.com', 587)
-            server.starttls()
-            server.login(remetente, senha)
-            server.send_message(msg)
-            server.quit()
-
-            print(f"E-mail enviado para {destinatario} sobre o produto {produto[1]}.")
-        
-        except Exception as e:
-            print(f"Erro ao enviar e-mail: {str(e)}")
+        """Agenda o aviso por e-mail de um produto; avisos próximos saem num único e-mail."""
+        if not self.notificacoes_ativas:
+            return
+        for destinatario in self.destinatarios_aviso:
+            self.notificacoes.enfileirar(Aviso(
+                destinatario, produto[0], produto[1], produto[2],
+                produto[8],  # data_validade
+                produto[10]  # status
+            ))
 
     def manual_backup(self):
         """Realiza backup manual do banco de dados"""
-        try:
-            # Criar nome do arquivo com timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_filename = f'torp_database_backup_{timestamp}.db'
-            backup_path = os.path.join(self.backup_folder, backup_filename)
-            
-            # Copiar o banco de dados
-            shutil.copy2(self.db.db_path, backup_path)
-            
-            # Manter apenas os últimos 5 backups
-            backups = sorted([f for f in os.listdir(self.backup_folder) if f.endswith('.db')])
-            while len(backups) > 5:
-                os.remove(os.path.join(self.backup_folder, backups.pop(0)))
-            
-            QMessageBox.information(self, "Sucesso", 
-                "Backup realizado com sucesso!\nLocalização: " + backup_path)
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Erro", f"Erro ao fazer backup: {str(e)}")
+        if self.worker.ocupado('backup'):
+            QMessageBox.information(self, "Aviso", "Já existe um backup em andamento.")
+            return
+        self.backup_button.setEnabled(False)
+        self.worker.executar(
+            self._copiar_backup_manual,
+            chave='backup',
+            cancelavel=True,
+            ao_concluir=self._backup_concluido,
+            ao_falhar=self._falha_backup
+        )
+
+    def _copiar_backup_manual(self, cancelar=None):
+        # Roda na thread do banco
+        # Snapshot consistente pela API de backup; só as páginas novas são gravadas
+        return self.db.backup_incremental(
+            self.repositorio_backup, progresso=self._progresso_backup, cancelar=cancelar, tipo='manual')
+
+    def _backup_concluido(self, entrada):
+        self.backup_button.setEnabled(True)
+        QMessageBox.information(self, "Sucesso", 
+            "Backup realizado com sucesso!\n"
+            f"Páginas novas: {entrada['paginas_novas']} de {entrada['paginas']} "
+            f"({entrada['bytes_gravados'] / 1024:.0f} KB gravados)\n"
+            "Localização: " + self.repositorio_backup.raiz)
+
+    def _falha_backup(self, erro):
+        self.backup_button.setEnabled(True)
+        QMessageBox.critical(self, "Erro", f"Erro ao fazer backup: {str(erro)}")
 
     def restore_backup(self):
         """Restaura um backup selecionado"""
+        if self.worker.ocupado('backup'):
+            QMessageBox.information(self, "Aviso", "Aguarde o backup em andamento terminar.")
+            return
         try:
-            # Listar backups disponíveis
-            backups = sorted([f for f in os.listdir(self.backup_folder) if f.endswith('.db')], reverse=True)
+            # Listar backups disponíveis no manifesto do repositório
+            backups = self.repositorio_backup.listar_backups()
             
             if not backups:
                 QMessageBox.warning(self, "Aviso", "Nenhum backup encontrado!")
@@ -1039,7 +1341,11 @@ class MainWindow(QMainWindow):
             layout = QVBoxLayout(dialog)
             
             combo = QComboBox()
-            combo.addItems([f"Backup de {f.split('_')[3].split('.')[0]}" for f in backups])
+            combo.addItems([
+                f"Backup de {datetime.fromisoformat(b['criado_em']).strftime('%d/%m/%Y %H:%M:%S')}"
+                f" ({b['tamanho'] / (1024 * 1024):.1f} MB)"
+                for b in backups
+            ])
             layout.addWidget(QLabel("Selecione o backup para restaurar:"))
             layout.addWidget(combo)
             
@@ -1060,44 +1366,131 @@ class MainWindow(QMainWindow):
                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
                 
                 if reply == QMessageBox.Yes:
-                    selected_backup = backups[combo.currentIndex()]
-                    backup_path = os.path.join(self.backup_folder, selected_backup)
+                    backup_id = backups[combo.currentIndex()]['id']
+                    # O backup automático pode ter começado com o diálogo aberto;
+                    # a mesma chave substituiria a tarefa e descartaria seus retornos
+                    if self.worker.ocupado('backup'):
+                        QMessageBox.information(self, "Aviso", "Aguarde o backup em andamento terminar.")
+                        return
                     
-                    # Fechar conexão com o banco atual
-                    if hasattr(self, 'db'):
-                        try:
-                            conn = self.db.connect()
-                            if conn:
-                                conn.close()
-                        except:
-                            pass
-                    
-                    # Restaurar backup
-                    shutil.copy2(backup_path, self.db.db_path)
-                    
-                    QMessageBox.information(self, "Sucesso", 
-                        "Backup restaurado com sucesso!\nO programa será reiniciado.")
-                    
-                    # Reiniciar aplicação
-                    self.close()
-                    QApplication.instance().quit()
-                    os.execl(sys.executable, sys.executable, *sys.argv)
+                    self.restore_button.setEnabled(False)
+                    self.worker.executar(
+                        self._copiar_restauracao, backup_id,
+                        chave='backup',
+                        ao_concluir=self._restauracao_concluida,
+                        ao_falhar=self._falha_restauracao
+                    )
         
         except Exception as e:
             QMessageBox.critical(self, "Erro", f"Erro ao restaurar backup: {str(e)}")
 
+    def _copiar_restauracao(self, backup_id):
+        # Roda na thread do banco
+        # Remontar o backup ao lado do banco (páginas verificadas e integrity_check)
+        restaurado = self.db.db_path + '.restaurar'
+        self.repositorio_backup.restaurar_para_arquivo(backup_id, restaurado)
+        try:
+            # Copiado para o banco em uso pela API de backup, sem fechar o programa
+            self.db.restaurar(restaurado, progresso=self._progresso_restauracao)
+        finally:
+            os.remove(restaurado)
+
+    def _progresso_restauracao(self, copiadas, total):
+        # Chamado na thread do banco durante a cópia
+        self.worker.informar_progresso("Restauração", copiadas, total)
+
+    def _restauracao_concluida(self, _):
+        self.restore_button.setEnabled(True)
+        # O log de alterações voltou junto com o backup: recarrega a tabela inteira
+        self.seq_alteracoes = None
+        self.carregar_produtos()
+        self.carregar_validades()
+        self.statusBar().showMessage("Backup restaurado com sucesso!", 5000)
+
+    def _falha_restauracao(self, erro):
+        self.restore_button.setEnabled(True)
+        QMessageBox.critical(self, "Erro", f"Erro ao restaurar backup: {str(erro)}")
+
     def salvar_tamanho_colunas(self, logical_index, old_size, new_size):
-        """Salva o tamanho das colunas quando são redimensionadas"""
-        if hasattr(self, 'settings'):
-            self.settings.setValue(f'column_width_{logical_index}', new_size)
+        """Guarda o tamanho das colunas redimensionadas para gravar de uma vez"""
+        if self._ajuste_automatico:
+            return
+        self._larguras_pendentes[logical_index] = new_size
+        # Reinicia a contagem a cada passo do arraste
+        self.timer_colunas.start()
+
+    def gravar_tamanho_colunas(self):
+        """Grava no QSettings as larguras pendentes"""
+        self.timer_colunas.stop()
+        pendentes, self._larguras_pendentes = self._larguras_pendentes, {}
+        for coluna, largura in pendentes.items():
+            self.settings.setValue(f'column_width_{coluna}', largura)
+
+    @instrumentacao.cronometrado('ui.ajustar_colunas')
+    def ajustar_colunas(self, colunas=None, manter_salvas=False):
+        """Ajusta a largura das colunas ao conteúdo, estimada por amostra.
+
+        Em vez de medir todas as células, considera o cabeçalho, as linhas
+        visíveis e o valor mais longo de cada coluna visto na carga. Com
+        manter_salvas=True (ajuste automático após a carga), as colunas com
+        largura salva pelo usuário não mudam e nada é gravado.
+        """
+        header = self.table.horizontalHeader()
+        metricas = self.table.fontMetrics()
+        # Margens do texto na célula, se não houver linha visível para medir
+        margem_padrao = 2 * (self.table.style().pixelMetric(QStyle.PM_FocusFrameHMargin, None, self.table) + 1)
+        grade = 1 if self.table.showGrid() else 0
+        maiores = self.modelo.maiores_textos()
+        topo = self.table.rowAt(0)
+        base = self.table.rowAt(self.table.viewport().height() - 1)
+        if base < 0:
+            base = self.filtro.rowCount() - 1
+        visiveis = range(max(topo, 0), min(base, topo + self.AMOSTRA_LINHAS_VISIVEIS) + 1) if topo >= 0 else ()
+
+        self._ajuste_automatico = manter_salvas
+        try:
+            for coluna in (range(self.modelo.columnCount()) if colunas is None else colunas):
+                if manter_salvas and (coluna in self._larguras_pendentes
+                                      or self.settings.value(f'column_width_{coluna}', type=int)):
+                    continue
+                # Linhas visíveis, medidas pelo delegate como no ajuste do Qt
+                larguras = [self.table.sizeHintForIndex(self.filtro.index(row, coluna)).width() for row in visiveis]
+                margem = margem_padrao
+                if larguras:
+                    # Mesma margem do delegate para o valor mais longo
+                    texto = self.filtro.index(visiveis[0], coluna).data() or ''
+                    margem = larguras[0] - metricas.horizontalAdvance(texto)
+                largura = max(
+                    header.sectionSizeHint(coluna),
+                    max(larguras, default=0) + grade,
+                    metricas.horizontalAdvance(maiores[coluna]) + margem + grade
+                )
+                header.resizeSection(coluna, largura)
+        finally:
+            self._ajuste_automatico = False
 
     def carregar_tamanho_colunas(self):
         """Carrega os tamanhos salvos das colunas"""
         if hasattr(self, 'table') and self.table is not None:
-            for i in range(self.table.columnCount()):
-                width = self.settings.value(f'column_width_{i}', type=int)
-                if width:
-                    self.table.setColumnWidth(i, width)
+            # Já estão gravados: não precisam voltar ao QSettings
+            self._ajuste_automatico = True
+            try:
+                for i in range(self.modelo.columnCount()):
+                    width = self.settings.value(f'column_width_{i}', type=int)
+                    if width:
+                        self.table.setColumnWidth(i, width)
+            finally:
+                self._ajuste_automatico = False
+
+    def closeEvent(self, event):
+        """Interrompe o backup em andamento e aguarda a tarefa do banco e os avisos na fila antes de fechar"""
+        self.backup_timer.stop()
+        self.timer_validade.stop()
+        self.timer_alteracoes.stop()
+        self.gravar_tamanho_colunas()
+        self.worker.encerrar()
+        self.notificacoes.encerrar()
+        super().closeEvent(event)
 
     def resizeEvent(self, event):
         """Manipula o evento de redimensionamento da janela"""
@@ -1137,23 +1530,10 @@ class MainWindow(QMainWindow):
         
         for col, width in default_widths.items():
             self.table.setColumnWidth(col, width)
-            self.settings.setValue(f'column_width_{col}', width)
-
-    def exibir_produtos(self, produtos):
-        self.table.setRowCount(0)
-        self.table.setRowCount(len(produtos))
-        
-        for row, produto in enumerate(produtos):
-            for col, valor in enumerate(produto):
-                item = QTableWidgetItem(str(valor) if valor is not None else "")
-                self.table.setItem(row, col, item)
-
-    def _colorir_linha(self, row, color):
-        """Função auxiliar para colorir uma linha inteira da tabela"""
-        for col in range(self.table.columnCount()):
-            item = self.table.item(row, col)
-            if item:
-                item.setBackground(color)
+            # Colunas que já estavam no padrão não emitem sectionResized
+            self._larguras_pendentes[col] = width
+        # Gravadas de uma vez, pelo mesmo caminho do redimensionamento manual
+        self.timer_colunas.start()
 
 class ExportDialog(QDialog):
     def __init__(self, parent=None):
@@ -1222,191 +1602,31 @@ class ExportDialog(QDialog):
             )
 
             if file_name:
-                # Obter dados da tabela principal
-                main_window = self.parent()
-                data = []
-                headers = []
-                
-                # Obter cabeçalhos
-                for col in range(main_window.table.columnCount()):
-                    headers.append(main_window.table.horizontalHeaderItem(col).text())
-                
-                # Obter dados
-                for row in range(main_window.table.rowCount()):
-                    row_data = []
-                    for col in range(main_window.table.columnCount()):
-                        item = main_window.table.item(row, col)
-                        row_data.append(item.text() if item else "")
-                    data.append(row_data)
-                
-                # Criar DataFrame
-                df = pd.DataFrame(data, columns=headers)
-                
-                # Exportar baseado no formato
-                if format_type == "pdf":
-                    from reportlab.lib import colors
-                    from reportlab.lib.pagesizes import A4
-                    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-                    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-                    from reportlab.pdfbase import pdfmetrics
-                    from reportlab.pdfbase.ttfonts import TTFont
-                    from reportlab.lib.utils import ImageReader
-                    import os
-
-                    class PDFWithBackground:
-                        def __init__(self, filename, pagesize=A4):
-                            self.filename = filename
-                            self.pagesize = pagesize
-                            
-                        def onFirstPage(self, canvas, doc):
-                            canvas.saveState()
-                            # Configurar alta resolução
-                            canvas.setPageSize(self.pagesize)
-                            canvas.setPageCompression(1)
-                            
-                            # Desenhar o fundo em alta qualidade
-                            img_path = os.path.join(os.path.dirname(__file__), 'assets', 'torp_background.png')
-                            img = ImageReader(img_path)
-                            canvas.drawImage(img, 0, 0, 
-                                          width=self.pagesize[0], 
-                                          height=self.pagesize[1],
-                                          preserveAspectRatio=True,
-                                          anchor='c',
-                                          mask='auto')
-                            
-                            # Configurar fonte para melhor renderização
-                            canvas.setFont('Helvetica', 8)
-                            canvas.setFillColor(colors.grey)
-                            canvas.setStrokeColor(colors.grey)
-                            canvas.setLineWidth(0.5)
-                            
-                            # Rodapé em alta qualidade
-                            footer_text = "Rua Bernardo Mascarenhas, 675, Mariano Procópio, Juiz de Fora - MG"
-                            footer_text2 = "(32) 2101-4700"
-                            canvas.drawString(30, 30, footer_text)
-                            canvas.drawString(30, 20, footer_text2)
-                            canvas.restoreState()
-
-                        def onLaterPages(self, canvas, doc):
-                            self.onFirstPage(canvas, doc)
-
-                    # Criar documento PDF em alta resolução
-                    pdf = PDFWithBackground(file_name)
-                    doc = SimpleDocTemplate(
-                        file_name,
-                        pagesize=A4,
-                        rightMargin=30,
-                        leftMargin=30,
-                        topMargin=40,
-                        bottomMargin=50,
-                        initialFontName='Helvetica',
-                        initialFontSize=10,
-                        pageCompression=1
-                    )
-                    
-                    elements = []
-                    
-                    # Estilo para o título em alta resolução
-                    styles = getSampleStyleSheet()
-                    title_style = ParagraphStyle(
-                        'CustomTitle',
-                        parent=styles['Heading1'],
-                        fontSize=24,
-                        textColor=colors.black,
-                        alignment=1,
-                        spaceAfter=20,
-                        leading=28,  # Melhor espaçamento
-                        fontName='Helvetica-Bold'
-                    )
-                    
-                    # Adicionar título
-                    elements.append(Paragraph("TORP IND", title_style))
-                    elements.append(Paragraph("Relatório de Produtos", styles["Heading2"]))
-                    elements.append(Spacer(1, 15))
-                    
-                    # Ajustar larguras mantendo proporções em alta resolução
-                    page_width = A4[0] - 60
-                    col_widths = [
-                        page_width * 0.05,  # ID
-                        page_width * 0.20,  # Nome
-                        page_width * 0.10,  # Lote
-                        page_width * 0.07,  # CA
-                        page_width * 0.07,  # Qtd
-                        page_width * 0.11,  # Data Compra
-                        page_width * 0.11,  # Data Fab
-                        page_width * 0.09,  # Val. Dias
-                        page_width * 0.11,  # Data Val
-                        page_width * 0.08,  # Dias Rest
-                        page_width * 0.08   # Status
-                    ]
-                    
-                    # Criar tabela com alta qualidade
-                    t = Table([headers] + data, colWidths=col_widths, repeatRows=1)
-                    t.setStyle(TableStyle([
-                        # Estilo do cabeçalho em alta definição
-                        ('BACKGROUND', (0, 0), (-1, 0), colors.black),
-                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ('FONTSIZE', (0, 0), (-1, 0), 10),
-                        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-                        ('TOPPADDING', (0, 0), (-1, 0), 10),
-                        
-                        # Grid e bordas em alta definição
-                        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                        ('BOX', (0, 0), (-1, -1), 2, colors.black),
-                        ('LINEBEFORE', (0, 0), (0, -1), 1, colors.black),
-                        ('LINEAFTER', (-1, 0), (-1, -1), 1, colors.black),
-                        
-                        # Conteúdo com renderização aprimorada
-                        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                        ('FONTSIZE', (0, 1), (-1, -1), 9),  # Fonte um pouco maior
-                        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                        ('TOPPADDING', (0, 0), (-1, -1), 8),
-                        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-                        
-                        # Cores e alinhamentos específicos
-                        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-                        ('ALIGN', (1, 1), (1, -1), 'LEFT'),
-                        ('ALIGN', (3, 1), (3, -1), 'RIGHT'),
-                        ('ALIGN', (6, 1), (6, -1), 'RIGHT'),
-                        ('ALIGN', (8, 1), (8, -1), 'RIGHT'),
-                    ]))
-                    
-                    elements.append(t)
-                    
-                    # Rodapé em alta definição
-                    current_datetime = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-                    footer_style = ParagraphStyle(
-                        'Footer',
-                        parent=styles['Normal'],
-                        fontSize=9,
-                        textColor=colors.black,
-                        alignment=1,
-                        spaceBefore=20,
-                        leading=12
-                    )
-                    elements.append(Spacer(1, 15))
-                    elements.append(Paragraph(f"Relatório gerado em: {current_datetime}", footer_style))
-                    
-                    # Construir PDF com configurações de alta qualidade
-                    doc.build(elements, 
-                             onFirstPage=pdf.onFirstPage, 
-                             onLaterPages=pdf.onLaterPages)
-                    
-                elif format_type == "csv":
-                    df.to_csv(file_name, index=False)
-                else:
-                    df.to_excel(file_name, index=False)
-                
-                QMessageBox.information(self, "Sucesso", 
-                    f"Relatório exportado com sucesso para {file_name}")
-                self.accept()
+                # A gravação do arquivo roda na thread do banco de dados
+                self._definir_botoes_habilitados(False)
+                self.parent().exportar_relatorio(
+                    format_type, file_name,
+                    ao_concluir=self._relatorio_exportado,
+                    ao_falhar=self._falha_exportacao
+                )
                 
         except Exception as e:
             QMessageBox.critical(self, "Erro", f"Erro ao exportar relatório: {str(e)}")
 
+    def _definir_botoes_habilitados(self, habilitados):
+        for button in [self.pdf_button, self.csv_button, self.excel_button]:
+            button.setEnabled(habilitados)
+
+    def _relatorio_exportado(self, file_name):
+        self._definir_botoes_habilitados(True)
+        QMessageBox.information(self, "Sucesso", 
+            f"Relatório exportado com sucesso para {file_name}")
+        self.accept()
+
+    def _falha_exportacao(self, erro):
+        self._definir_botoes_habilitados(True)
+        QMessageBox.critical(self, "Erro", f"Erro ao exportar relatório: {str(erro)}")
+
 class OutraAbaDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
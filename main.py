@@ -1,10 +1,6 @@
 import sys
 import os
 import logging
-from PyQt5.QtWidgets import QApplication
-from PyQt5.QtGui import QColor
-from interface import MainWindow
-from database import db
 
 # Configuração do diretório de logs
 def setup_logging():
@@ -41,7 +37,21 @@ def resource_path(relative_path):
     
     return os.path.join(base_path, relative_path)
 
+def executar_linha_de_comando(argv):
+    """Modo sem interface: python main.py <comando> (ver cli.py); não importa o Qt"""
+    import cli
+    return cli.main(argv)
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # Comandos em lote (cron, servidores sem display)
+        sys.exit(executar_linha_de_comando(sys.argv[1:]))
+    
+    # Qt e a interface só são carregados no modo gráfico
+    from PyQt5.QtWidgets import QApplication
+    from interface import MainWindow
+    from database import get_db
+    
     try:
         if not setup_logging():
             sys.exit(1)
@@ -57,6 +67,7 @@ if __name__ == '__main__':
             os.chdir(executable_dir)
         
         logging.info('Criando banco de dados')
+        db = get_db()
         if not db.criar_banco_dados():
             logging.error("Erro ao criar banco de dados!")
             sys.exit(1)
@@ -64,6 +75,8 @@ if __name__ == '__main__':
         logging.info('Iniciando janela principal')
         window = MainWindow()
         window.show()
+        # Fecha as conexões persistentes (checkpoint do WAL) ao sair
+        app.aboutToQuit.connect(db.fechar)
         sys.exit(app.exec_())
     except Exception as e:
         logging.exception("Erro não tratado:")
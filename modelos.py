@@ -0,0 +1,418 @@
+import unicodedata
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QSortFilterProxyModel, Qt, pyqtSignal
+from PyQt5.QtGui import QBrush, QColor
+
+from database import STATUS_NORMAL, STATUS_PROXIMO_VENCIMENTO, STATUS_VENCIDO
+from relatorios import CABECALHOS, COLUNAS_DATA, formatar_celula
+
+# Colunas de vw_produtos usadas pelos filtros e pela ordenação
+COLUNA_NOME = 1
+COLUNA_LOTE = 2
+COLUNA_STATUS = 10
+
+# Ordenação por status: do mais urgente ao normal
+_GRAVIDADE_STATUS = {STATUS_VENCIDO: 0, STATUS_PROXIMO_VENCIMENTO: 1, STATUS_NORMAL: 2}
+
+# Por status de validade: (fundo da linha, cor do texto da coluna de status).
+# O status vem pronto da view quando a linha é carregada ou alterada e os
+# pincéis são criados uma única vez, então data() faz só uma consulta.
+ESTILOS_STATUS = {
+    STATUS_VENCIDO: (QBrush(QColor(255, 200, 200)), QBrush(QColor(192, 0, 0))),  # Vermelho
+    STATUS_PROXIMO_VENCIMENTO: (QBrush(QColor(255, 255, 200)), QBrush(QColor(204, 102, 0))),  # Laranja
+    STATUS_NORMAL: (None, QBrush(QColor(0, 128, 0))),  # Verde
+}
+_SEM_ESTILO = (None, None)
+
+def _tamanho_texto(valor):
+    return 0 if valor is None else len(str(valor))
+
+def normalizar_texto(texto):
+    """Texto em minúsculas e sem acentos, para comparar e ordenar"""
+    if not texto:
+        return ''
+    return unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii').lower()
+
+class ModeloProdutos(QAbstractTableModel):
+    """Produtos da tabela principal, lidos do banco página a página conforme a rolagem.
+
+    As linhas de vw_produtos ficam guardadas como vieram do banco (tuplas);
+    o texto de uma célula só é montado quando a view a pinta. Com a carga
+    paginada, canFetchMore/fetchMore pedem a próxima página por chave
+    (id > último id recebido) quando a rolagem chega ao fim da tabela.
+
+    buscar_pagina(apos_id, limite, ao_receber, ao_falhar) deve ler a página
+    de forma assíncrona e chamar ao_receber(linhas) na thread da interface;
+    limite -1 lê todas as linhas restantes.
+    """
+
+    # Erro ao ler uma página (a mesma exceção recebida por ao_falhar)
+    falha_carga = pyqtSignal(object)
+
+    def __init__(self, buscar_pagina, tamanho_pagina=1000, parent=None):
+        super().__init__(parent)
+        self._buscar_pagina = buscar_pagina
+        self.tamanho_pagina = tamanho_pagina
+        self._linhas = []
+        self._posicoes = None
+        self._ultimo_id = 0
+        self._completo = True
+        self._buscando = False
+        # Incrementada a cada nova carga: páginas pedidas antes são descartadas
+        self._geracao = 0
+        self._ao_completar = []
+        # (coluna, ordem) da ordenação pedida pela view; None = ordem de id
+        self._ordem = None
+        # id -> (nome, lote) normalizados, calculados uma vez por linha
+        self._chaves = {}
+        # Valor mais longo visto em cada coluna, para estimar larguras
+        self._maiores = [None] * len(CABECALHOS)
+
+    # --- interface do Qt
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._linhas)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(CABECALHOS)
+
+    def headerData(self, secao, orientacao, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientacao == Qt.Horizontal:
+            return CABECALHOS[secao]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        linha = self._linhas[index.row()]
+        if role == Qt.DisplayRole:
+            return formatar_celula(index.column(), linha[index.column()])
+        if role == Qt.BackgroundRole:
+            return ESTILOS_STATUS.get(linha[COLUNA_STATUS], _SEM_ESTILO)[0]
+        if role == Qt.ForegroundRole and index.column() == COLUNA_STATUS:
+            return ESTILOS_STATUS.get(linha[COLUNA_STATUS], _SEM_ESTILO)[1]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._completo and not self._buscando
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._pedir_pagina(self.tamanho_pagina)
+
+    def sort(self, coluna, ordem=Qt.AscendingOrder):
+        if coluna == 0 and ordem == Qt.AscendingOrder:
+            # Ordem natural das páginas: não precisa ler o restante
+            self._ordem = None
+            self._ordenar()
+            return
+        self._ordem = (coluna, ordem)
+        # As linhas ainda não lidas entram na ordenação: busca o restante antes
+        self.completar(self._ordenar)
+
+    # --- carga
+
+    def definir_linhas(self, linhas, paginado=False):
+        """Substitui todas as linhas; com paginado=True linhas é a primeira página"""
+        self.beginResetModel()
+        self._geracao += 1
+        self._linhas = list(linhas)
+        self._posicoes = None
+        self._chaves = {}
+        self._maiores = [None] * len(CABECALHOS)
+        self._acompanhar_maiores(self._linhas)
+        self._buscando = False
+        self._ultimo_id = self._linhas[-1][0] if self._linhas else 0
+        self._completo = not paginado or len(self._linhas) < self.tamanho_pagina
+        if self._ordem is not None and self._completo:
+            self._ordenar_linhas()
+        self.endResetModel()
+        if self._completo:
+            self._concluir_carga()
+        elif self._ordem is not None:
+            self.completar(self._ordenar)
+
+    def suspender_busca(self):
+        """Descarta as páginas pedidas até aqui (ex.: antes de recarregar a tabela)"""
+        self._geracao += 1
+        self._buscando = False
+        self._completo = True
+        pendentes, self._ao_completar = self._ao_completar, []
+        for _ao_concluir, ao_falhar in pendentes:
+            if ao_falhar:
+                ao_falhar(RuntimeError("Carga da tabela interrompida"))
+
+    def completar(self, ao_concluir=None, ao_falhar=None):
+        """Lê de uma vez as linhas que faltam; ao_concluir() roda com o modelo completo"""
+        if self._completo:
+            if ao_concluir:
+                ao_concluir()
+            return
+        self._ao_completar.append((ao_concluir, ao_falhar))
+        self._pedir_pagina(-1)
+
+    def completo(self):
+        return self._completo
+
+    def _pedir_pagina(self, limite):
+        self._buscando = True
+        geracao = self._geracao
+        self._buscar_pagina(
+            self._ultimo_id, limite,
+            lambda linhas: self._receber_pagina(linhas, limite, geracao),
+            lambda erro: self._falha_pagina(erro, geracao)
+        )
+
+    def _receber_pagina(self, linhas, limite, geracao):
+        if geracao != self._geracao:
+            return
+        self._buscando = False
+        if linhas:
+            inicio = len(self._linhas)
+            self.beginInsertRows(QModelIndex(), inicio, inicio + len(linhas) - 1)
+            self._linhas.extend(linhas)
+            if self._posicoes is not None:
+                for posicao, linha in enumerate(linhas, inicio):
+                    self._posicoes[linha[0]] = posicao
+            self._ultimo_id = linhas[-1][0]
+            self._acompanhar_maiores(linhas)
+            self.endInsertRows()
+        if limite < 0 or len(linhas) < limite:
+            self._completo = True
+            self._concluir_carga()
+
+    def _falha_pagina(self, erro, geracao):
+        if geracao != self._geracao:
+            return
+        self._buscando = False
+        pendentes, self._ao_completar = self._ao_completar, []
+        for _ao_concluir, ao_falhar in pendentes:
+            if ao_falhar:
+                ao_falhar(erro)
+        self.falha_carga.emit(erro)
+
+    def _concluir_carga(self):
+        pendentes, self._ao_completar = self._ao_completar, []
+        for ao_concluir, _ao_falhar in pendentes:
+            if ao_concluir:
+                ao_concluir()
+
+    # --- ordenação
+
+    def _chave_ordenacao(self, coluna):
+        # Chaves tipadas, calculadas uma vez por linha no sort() do Python
+        if coluna in (COLUNA_NOME, COLUNA_LOTE):
+            # Texto sem diferenciar maiúsculas e acentos
+            indice = 0 if coluna == COLUNA_NOME else 1
+            return lambda linha: self.chaves_texto(linha)[indice]
+        if coluna == COLUNA_STATUS:
+            return lambda linha: _GRAVIDADE_STATUS.get(linha[coluna], len(_GRAVIDADE_STATUS))
+        # Datas ISO e números já se comparam corretamente; nulos por último
+        return lambda linha: (linha[coluna] is None, linha[coluna])
+
+    def _ordenar_linhas(self):
+        coluna, ordem = self._ordem or (0, Qt.AscendingOrder)
+        self._linhas.sort(key=self._chave_ordenacao(coluna), reverse=ordem == Qt.DescendingOrder)
+        self._posicoes = None
+
+    def _ordenar(self):
+        self.layoutAboutToBeChanged.emit()
+        # Seleção e índice atual acompanham as linhas, pelo id
+        persistentes = self.persistentIndexList()
+        ids = [self._linhas[index.row()][0] for index in persistentes]
+        self._ordenar_linhas()
+        self.changePersistentIndexList(persistentes, [
+            self.index(self.posicao(produto_id), index.column())
+            for produto_id, index in zip(ids, persistentes)
+        ])
+        self.layoutChanged.emit()
+
+    # --- consulta e alterações
+
+    def posicao(self, produto_id):
+        """Linha do produto no modelo, ou None se não estiver carregado"""
+        if self._posicoes is None:
+            self._posicoes = {linha[0]: posicao for posicao, linha in enumerate(self._linhas)}
+        return self._posicoes.get(produto_id)
+
+    def produto(self, row):
+        """Linha de vw_produtos exibida na posição row"""
+        return self._linhas[row]
+
+    def chaves_texto(self, linha):
+        """(nome, lote) normalizados de uma linha (ver normalizar_texto)"""
+        chaves = self._chaves.get(linha[0])
+        if chaves is None:
+            chaves = (normalizar_texto(linha[COLUNA_NOME]), normalizar_texto(linha[COLUNA_LOTE]))
+            self._chaves[linha[0]] = chaves
+        return chaves
+
+    def _acompanhar_maiores(self, linhas):
+        # Datas têm sempre o mesmo tamanho; as demais colunas guardam o valor mais longo
+        for coluna in range(len(CABECALHOS)):
+            if coluna in COLUNAS_DATA or not linhas:
+                continue
+            maior = max((linha[coluna] for linha in linhas), key=_tamanho_texto)
+            if _tamanho_texto(maior) > _tamanho_texto(self._maiores[coluna]):
+                self._maiores[coluna] = maior
+
+    def maiores_textos(self):
+        """Texto mais longo de cada coluna entre as linhas carregadas até agora.
+
+        Datas ficam vazias (têm todas o mesmo tamanho). Linhas removidas ou
+        encurtadas só deixam de contar na próxima carga.
+        """
+        return [
+            '' if valor is None else formatar_celula(coluna, valor)
+            for coluna, valor in enumerate(self._maiores)
+        ]
+
+    def textos(self, row):
+        """Textos das células da linha, como exibidos"""
+        return [formatar_celula(coluna, valor) for coluna, valor in enumerate(self._linhas[row])]
+
+    def linhas(self):
+        """Cópia das linhas carregadas, na ordem exibida"""
+        return list(self._linhas)
+
+    def atualizar_linhas(self, produtos):
+        """Reescreve as linhas dos produtos informados que estiverem carregadas"""
+        for produto in produtos:
+            row = self.posicao(produto[0])
+            if row is not None:
+                self._linhas[row] = produto
+                self._chaves.pop(produto[0], None)
+                self._acompanhar_maiores([produto])
+                self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def gravar_produto(self, produto):
+        """Atualiza ou insere só a linha devolvida por uma gravação, sem recarregar"""
+        row = self.posicao(produto[0])
+        if row is not None:
+            # Continua onde está, mesmo com outra ordenação: não move a seleção
+            self.atualizar_linhas([produto])
+            return
+        if not self._completo and produto[0] > self._ultimo_id:
+            # Chega com as próximas páginas
+            return
+        row = self._posicao_insercao(produto)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._linhas.insert(row, produto)
+        self._acompanhar_maiores([produto])
+        if self._posicoes is not None and row == len(self._linhas) - 1:
+            self._posicoes[produto[0]] = row
+        else:
+            self._posicoes = None
+        self.endInsertRows()
+
+    def _posicao_insercao(self, produto):
+        # Busca binária pela chave da ordenação atual (na natural, o id)
+        coluna, ordem = self._ordem or (0, Qt.AscendingOrder)
+        chave = self._chave_ordenacao(coluna)
+        valor = chave(produto)
+        decrescente = ordem == Qt.DescendingOrder
+        inicio, fim = 0, len(self._linhas)
+        while inicio < fim:
+            meio = (inicio + fim) // 2
+            atual = chave(self._linhas[meio])
+            if (atual < valor) if decrescente else (valor < atual):
+                fim = meio
+            else:
+                inicio = meio + 1
+        return inicio
+
+    def aplicar_alteracoes(self, alteracoes):
+        """Aplica [(id, operacao, linha)] do log de alterações (get_changes_since)"""
+        removidas = []
+        novas = []
+        for produto_id, operacao, produto in alteracoes:
+            row = self.posicao(produto_id)
+            if operacao == 'D' or produto is None:
+                if row is not None:
+                    removidas.append(row)
+            elif row is not None:
+                self.atualizar_linhas([produto])
+            elif self._completo or produto_id <= self._ultimo_id:
+                novas.append(produto)
+            # Ids além da última página lida chegam com as próximas páginas
+
+        # De baixo para cima para não deslocar os índices pendentes
+        for row in sorted(removidas, reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self._chaves.pop(self._linhas[row][0], None)
+            del self._linhas[row]
+            self._posicoes = None
+            self.endRemoveRows()
+        if novas:
+            inicio = len(self._linhas)
+            self.beginInsertRows(QModelIndex(), inicio, inicio + len(novas) - 1)
+            self._linhas.extend(novas)
+            self._posicoes = None
+            self._acompanhar_maiores(novas)
+            self.endInsertRows()
+            if self._ordem is not None:
+                self._ordenar()
+
+class FiltroProdutos(QSortFilterProxyModel):
+    """Filtros de nome, lote, status e resultado de busca sobre o ModeloProdutos.
+
+    Nome e lote usam as chaves normalizadas do modelo (uma por linha), sem
+    reler o texto das células. A ordenação é repassada ao modelo de
+    origem, que ordena a lista inteira com chaves tipadas em vez de
+    comparar pares de linhas pelo lessThan do proxy.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._nome = ''
+        self._lote = ''
+        self._status = None
+        self._ids = None
+
+    def definir_filtros(self, nome='', lote='', status=None):
+        """Aplica os filtros (vazios ou status 'Todos' são ignorados); filtra uma única vez"""
+        filtros = (
+            normalizar_texto(nome),
+            normalizar_texto(lote),
+            status if status and status != 'Todos' else None,
+        )
+        if filtros != (self._nome, self._lote, self._status):
+            self._nome, self._lote, self._status = filtros
+            self.invalidateFilter()
+
+    def definir_ids(self, ids):
+        """Restringe às linhas com esses ids (resultado da busca); None remove a restrição"""
+        self._ids = set(ids) if ids is not None else None
+        self.invalidateFilter()
+
+    def filtros_ativos(self):
+        return bool(self._nome or self._lote or self._status or self._ids is not None)
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        modelo = self.sourceModel()
+        linha = modelo.produto(source_row)
+        if self._ids is not None and linha[0] not in self._ids:
+            return False
+        if self._status is not None and linha[COLUNA_STATUS] != self._status:
+            return False
+        if self._nome or self._lote:
+            nome, lote = modelo.chaves_texto(linha)
+            # O texto digitado pode estar em qualquer parte do nome ou do lote
+            if self._nome not in nome or self._lote not in lote:
+                return False
+        return True
+
+    def sort(self, coluna, ordem=Qt.AscendingOrder):
+        self.sourceModel().sort(coluna, ordem)
+
+    def linhas(self):
+        """Linhas de vw_produtos que passam pelos filtros, na ordem exibida"""
+        modelo = self.sourceModel()
+        return [
+            modelo.produto(self.mapToSource(self.index(row, 0)).row())
+            for row in range(self.rowCount())
+        ]
+
+    def produto(self, row):
+        """Linha de vw_produtos exibida na posição row do filtro"""
+        return self.sourceModel().produto(self.mapToSource(self.index(row, 0)).row())
@@ -0,0 +1,180 @@
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+# Um lote a ser avisado; agrupado com os demais do mesmo destinatário
+Aviso = namedtuple('Aviso', 'destinatario produto_id nome lote data_validade status')
+
+_FIM = object()
+
+def _formatar_data(data_iso):
+    try:
+        return date.fromisoformat(data_iso).strftime('%d/%m/%Y')
+    except (TypeError, ValueError):
+        return data_iso or ''
+
+def montar_resumo(avisos):
+    """(assunto, corpo) de um e-mail com todos os avisos de um destinatário"""
+    assunto = f"Aviso de validade: {len(avisos)} lote(s) de EPI"
+    linhas = ["Os seguintes lotes de EPI mudaram de status:", ""]
+    for status in sorted({aviso.status for aviso in avisos}):
+        linhas.append(f"{status}:")
+        for aviso in sorted((a for a in avisos if a.status == status), key=lambda a: (a.nome, a.lote)):
+            linhas.append(
+                f"  - {aviso.nome} (Lote: {aviso.lote}) - validade {_formatar_data(aviso.data_validade)}"
+            )
+        linhas.append("")
+    return assunto, "\n".join(linhas)
+
+class FilaNotificacoes:
+    """Fila de avisos por e-mail processada numa thread própria.
+
+    Os avisos que chegam juntos (até atraso_agrupamento segundos depois do
+    primeiro) formam um lote: um único e-mail por destinatário, enviados
+    numa só sessão SMTP (uma conexão, um STARTTLS, um login). Falhas de
+    rede ou do servidor são repetidas com espera exponencial.
+
+    smtp_factory permite trocar o servidor, por exemplo por um servidor
+    SMTP local de testes: é chamado sem argumentos e deve devolver um
+    objeto com a interface de smtplib.SMTP.
+    """
+
+    def __init__(self, remetente, senha=None, servidor='smtp.gmail.com', porta=587,
+                 usar_tls=True, smtp_factory=None, tentativas=4, espera_inicial=2.0,
+                 atraso_agrupamento=5.0, timeout=30):
+        self.remetente = remetente
+        self.senha = senha
+        self.servidor = servidor
+        self.porta = porta
+        self.usar_tls = usar_tls
+        self.smtp_factory = smtp_factory
+        self.tentativas = tentativas
+        self.espera_inicial = espera_inicial
+        self.atraso_agrupamento = atraso_agrupamento
+        self.timeout = timeout
+        self.enviados = 0
+        self.falhas = 0
+        self._fila = queue.Queue()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name='notificacoes', daemon=True)
+        self._thread.start()
+
+    def enfileirar(self, aviso):
+        """Agenda um Aviso; retorna imediatamente"""
+        self._fila.put(aviso)
+
+    def encerrar(self, timeout=10):
+        """Envia o que já está na fila (sem esperar o agrupamento) e para a thread"""
+        self._fila.put(_FIM)
+        self._thread.join(timeout)
+        # Se o prazo acabou no meio de uma espera entre tentativas, desiste dela
+        self._parar.set()
+
+    # --- thread de envio
+
+    def _executar(self):
+        fim = False
+        while not fim:
+            aviso = self._fila.get()
+            if aviso is _FIM:
+                break
+            lote = [aviso]
+            prazo = time.monotonic() + self.atraso_agrupamento
+            while True:
+                restante = prazo - time.monotonic()
+                try:
+                    aviso = self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if aviso is _FIM:
+                    fim = True
+                    break
+                lote.append(aviso)
+            try:
+                self._enviar_lote(lote)
+            except Exception:
+                self.falhas += len(lote)
+                logger.exception("Erro inesperado ao enviar avisos")
+
+    def _montar_mensagens(self, lote):
+        from email.message import EmailMessage
+
+        por_destinatario = {}
+        for aviso in lote:
+            por_destinatario.setdefault(aviso.destinatario, []).append(aviso)
+        mensagens = []
+        for destinatario, avisos in por_destinatario.items():
+            assunto, corpo = montar_resumo(avisos)
+            mensagem = EmailMessage()
+            mensagem['From'] = self.remetente
+            mensagem['To'] = destinatario
+            mensagem['Subject'] = assunto
+            mensagem.set_content(corpo)
+            mensagens.append((mensagem, len(avisos)))
+        return mensagens
+
+    def _abrir_sessao(self):
+        import smtplib
+        import ssl
+
+        if self.smtp_factory is not None:
+            smtp = self.smtp_factory()
+        else:
+            smtp = smtplib.SMTP(self.servidor, self.porta, timeout=self.timeout)
+        try:
+            if self.usar_tls:
+                smtp.starttls(context=ssl.create_default_context())
+            if self.senha:
+                smtp.login(self.remetente, self.senha)
+        except BaseException:
+            smtp.close()
+            raise
+        return smtp
+
+    def _enviar_lote(self, lote):
+        import smtplib
+
+        pendentes = self._montar_mensagens(lote)
+        for tentativa in range(self.tentativas):
+            smtp = None
+            try:
+                smtp = self._abrir_sessao()
+                while pendentes:
+                    mensagem, quantidade = pendentes[0]
+                    try:
+                        smtp.send_message(mensagem)
+                    except smtplib.SMTPRecipientsRefused:
+                        # Erro do endereço, não do servidor: repetir não adianta
+                        logger.error("Destinatário recusado: %s", mensagem['To'])
+                        self.falhas += quantidade
+                    else:
+                        self.enviados += quantidade
+                        logger.info("Aviso de %d lote(s) enviado para %s", quantidade, mensagem['To'])
+                    pendentes.pop(0)
+                return
+            except smtplib.SMTPAuthenticationError as e:
+                logger.error("Falha de autenticação no servidor de e-mail: %s", e)
+                break
+            except (smtplib.SMTPException, OSError) as e:
+                espera = self.espera_inicial * 2 ** tentativa
+                logger.warning(
+                    "Erro ao enviar avisos (tentativa %d de %d): %s",
+                    tentativa + 1, self.tentativas, e
+                )
+                if tentativa + 1 == self.tentativas or self._parar.wait(espera):
+                    break
+            finally:
+                if smtp is not None:
+                    try:
+                        smtp.quit()
+                    except (smtplib.SMTPException, OSError):
+                        smtp.close()
+
+        nao_enviados = sum(quantidade for _mensagem, quantidade in pendentes)
+        self.falhas += nao_enviados
+        logger.error("%d aviso(s) não enviados", nao_enviados)
@@ -0,0 +1,91 @@
+"""Mede o tempo de importação na inicialização (python -X importtime) e compara com um orçamento.
+
+Uso:
+    python orcamento_importacao.py                 # todos os perfis
+    python orcamento_importacao.py interface --orcamento-ms 800
+
+Sai com código 1 se algum perfil passar do orçamento ou carregar um
+módulo que deveria ser importado só no primeiro uso (ex.: pandas).
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+# perfil: (módulo importado, orçamento em ms, módulos que não podem ser carregados)
+PERFIS = {
+    # Janela principal: exportação e e-mail carregam suas dependências ao serem usados
+    'interface': ('interface', 1500, ('pandas', 'reportlab', 'smtplib', 'email.mime', 'tkinter', 'lzma')),
+    # Linha de comando: não pode depender do Qt
+    'cli': ('cli', 300, ('PyQt5', 'pandas', 'reportlab', 'smtplib', 'tkinter')),
+}
+
+_LINHA = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+def medir(modulo):
+    """Executa 'import modulo' num processo novo; retorna [(nivel, nome, proprio_us, acumulado_us)]"""
+    ambiente = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    resultado = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=DIRETORIO, env=ambiente, capture_output=True, text=True
+    )
+    if resultado.returncode != 0:
+        erro = [linha for linha in resultado.stderr.splitlines() if not linha.startswith('import time:')]
+        raise RuntimeError(f"Falha ao importar {modulo}:\n" + "\n".join(erro[-10:]))
+    entradas = []
+    for linha in resultado.stderr.splitlines():
+        encontrado = _LINHA.match(linha)
+        if encontrado:
+            proprio, acumulado, recuo, nome = encontrado.groups()
+            # Cada nível de importação aninhada acrescenta dois espaços
+            entradas.append(((len(recuo) - 1) // 2, nome, int(proprio), int(acumulado)))
+    return entradas
+
+def verificar_perfil(nome, modulo, orcamento_ms, proibidos, repeticoes=3, detalhes=10):
+    # O menor de alguns processos reduz o ruído do cache de disco e do sistema
+    medicoes = [medir(modulo) for _ in range(repeticoes)]
+    entradas = min(medicoes, key=lambda e: sum(a for nivel, _n, _p, a in e if nivel == 0))
+    total_ms = sum(acumulado for nivel, _n, _p, acumulado in entradas if nivel == 0) / 1000
+
+    carregados = {nome_modulo for _nivel, nome_modulo, _p, _a in entradas}
+    indevidos = sorted(
+        nome_modulo for nome_modulo in carregados
+        if any(nome_modulo == p or nome_modulo.startswith(p + '.') for p in proibidos)
+    )
+
+    ok = total_ms <= orcamento_ms and not indevidos
+    print(f"[{'ok' if ok else 'FALHOU'}] {nome}: {total_ms:.0f} ms (orçamento {orcamento_ms} ms)")
+    for nivel, nome_modulo, _proprio, acumulado in sorted(
+            (e for e in entradas if e[0] <= 1), key=lambda e: e[3], reverse=True)[:detalhes]:
+        print(f"    {acumulado / 1000:8.1f} ms  {'  ' * nivel}{nome_modulo}")
+    if indevidos:
+        print(f"    carregados na inicialização: {', '.join(indevidos)}")
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('perfis', nargs='*', help=f"padrão: todos ({', '.join(sorted(PERFIS))})")
+    parser.add_argument('--orcamento-ms', type=int, help="substitui o orçamento dos perfis")
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args(argv)
+    desconhecidos = set(args.perfis) - set(PERFIS)
+    if desconhecidos:
+        parser.error(f"perfil desconhecido: {', '.join(sorted(desconhecidos))}")
+
+    ok = True
+    for nome in args.perfis or sorted(PERFIS):
+        modulo, orcamento_ms, proibidos = PERFIS[nome]
+        try:
+            ok &= verificar_perfil(
+                nome, modulo, args.orcamento_ms or orcamento_ms, proibidos, args.repeticoes
+            )
+        except RuntimeError as e:
+            print(f"[FALHOU] {nome}: {e}")
+            ok = False
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import os
+from datetime import datetime
+
+# Cabeçalhos das colunas, na ordem de COLUNAS_PRODUTOS (os mesmos da tabela principal)
+CABECALHOS = ["ID", "Nome", "Lote", "CA", "Qtd.", "Data Compra",
+              "Data Fab.", "Val. Dias", "Data Val.", "Dias Rest.", "Status"]
+
+# Índices das colunas de data em COLUNAS_PRODUTOS
+COLUNAS_DATA = (5, 6, 8)
+
+def formatar_celula(coluna, valor):
+    """Texto de uma célula, como exibido na tabela (datas em dd/mm/aaaa)"""
+    if valor is None:
+        return ""
+    # Datas vêm do banco como YYYY-MM-DD: basta reordenar as partes, sem
+    # strptime (chamado a cada pintura da célula)
+    if coluna in COLUNAS_DATA and isinstance(valor, str) and len(valor) == 10 and valor[4] == valor[7] == '-':
+        return f'{valor[8:10]}/{valor[5:7]}/{valor[:4]}'
+    return str(valor)
+
+def formatar_linha(produto):
+    """Linha de texto de um produto, como exibida na tabela"""
+    return [formatar_celula(coluna, valor) for coluna, valor in enumerate(produto)]
+
+def gravar_relatorio(format_type, file_name, headers, data):
+    """Grava o relatório em pdf, csv ou xlsx (sem Qt; usado pela interface e pela linha de comando)"""
+    # pandas e reportlab só são carregados quando um relatório é gerado
+    import pandas as pd
+    
+    # Criar DataFrame
+    df = pd.DataFrame(data, columns=headers)
+    
+    # Exportar baseado no formato
+    if format_type == "pdf":
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        from reportlab.lib.utils import ImageReader
+
+        class PDFWithBackground:
+            def __init__(self, filename, pagesize=A4):
+                self.filename = filename
+                self.pagesize = pagesize
+                
+            def onFirstPage(self, canvas, doc):
+                canvas.saveState()
+                # Configurar alta resolução
+                canvas.setPageSize(self.pagesize)
+                canvas.setPageCompression(1)
+                
+                # Desenhar o fundo em alta qualidade
+                img_path = os.path.join(os.path.dirname(__file__), 'assets', 'torp_background.png')
+                img = ImageReader(img_path)
+                canvas.drawImage(img, 0, 0, 
+                              width=self.pagesize[0], 
+                              height=self.pagesize[1],
+                              preserveAspectRatio=True,
+                              anchor='c',
+                              mask='auto')
+                
+                # Configurar fonte para melhor renderização
+                canvas.setFont('Helvetica', 8)
+                canvas.setFillColor(colors.grey)
+                canvas.setStrokeColor(colors.grey)
+                canvas.setLineWidth(0.5)
+                
+                # Rodapé em alta qualidade
+                footer_text = "Rua Bernardo Mascarenhas, 675, Mariano Procópio, Juiz de Fora - MG"
+                footer_text2 = "(32) 2101-4700"
+                canvas.drawString(30, 30, footer_text)
+                canvas.drawString(30, 20, footer_text2)
+                canvas.restoreState()
+
+            def onLaterPages(self, canvas, doc):
+                self.onFirstPage(canvas, doc)
+
+        # Criar documento PDF em alta resolução
+        pdf = PDFWithBackground(file_name)
+        doc = SimpleDocTemplate(
+            file_name,
+            pagesize=A4,
+            rightMargin=30,
+            leftMargin=30,
+            topMargin=40,
+            bottomMargin=50,
+            initialFontName='Helvetica',
+            initialFontSize=10,
+            pageCompression=1
+        )
+        
+        elements = []
+        
+        # Estilo para o título em alta resolução
+        styles = getSampleStyleSheet()
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.black,
+            alignment=1,
+            spaceAfter=20,
+            leading=28,  # Melhor espaçamento
+            fontName='Helvetica-Bold'
+        )
+        
+        # Adicionar título
+        elements.append(Paragraph("TORP IND", title_style))
+        elements.append(Paragraph("Relatório de Produtos", styles["Heading2"]))
+        elements.append(Spacer(1, 15))
+        
+        # Ajustar larguras mantendo proporções em alta resolução
+        page_width = A4[0] - 60
+        col_widths = [
+            page_width * 0.05,  # ID
+            page_width * 0.20,  # Nome
+            page_width * 0.10,  # Lote
+            page_width * 0.07,  # CA
+            page_width * 0.07,  # Qtd
+            page_width * 0.11,  # Data Compra
+            page_width * 0.11,  # Data Fab
+            page_width * 0.09,  # Val. Dias
+            page_width * 0.11,  # Data Val
+            page_width * 0.08,  # Dias Rest
+            page_width * 0.08   # Status
+        ]
+        
+        # Criar tabela com alta qualidade
+        t = Table([headers] + data, colWidths=col_widths, repeatRows=1)
+        t.setStyle(TableStyle([
+            # Estilo do cabeçalho em alta definição
+            ('BACKGROUND', (0, 0), (-1, 0), colors.black),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+            ('TOPPADDING', (0, 0), (-1, 0), 10),
+            
+            # Grid e bordas em alta definição
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('BOX', (0, 0), (-1, -1), 2, colors.black),
+            ('LINEBEFORE', (0, 0), (0, -1), 1, colors.black),
+            ('LINEAFTER', (-1, 0), (-1, -1), 1, colors.black),
+            
+            # Conteúdo com renderização aprimorada
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),  # Fonte um pouco maior
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('TOPPADDING', (0, 0), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            
+            # Cores e alinhamentos específicos
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+            ('ALIGN', (1, 1), (1, -1), 'LEFT'),
+            ('ALIGN', (3, 1), (3, -1), 'RIGHT'),
+            ('ALIGN', (6, 1), (6, -1), 'RIGHT'),
+            ('ALIGN', (8, 1), (8, -1), 'RIGHT'),
+        ]))
+        
+        elements.append(t)
+        
+        # Rodapé em alta definição
+        current_datetime = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+        footer_style = ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=colors.black,
+            alignment=1,
+            spaceBefore=20,
+            leading=12
+        )
+        elements.append(Spacer(1, 15))
+        elements.append(Paragraph(f"Relatório gerado em: {current_datetime}", footer_style))
+        
+        # Construir PDF com configurações de alta qualidade
+        doc.build(elements, 
+                 onFirstPage=pdf.onFirstPage, 
+                 onLaterPages=pdf.onLaterPages)
+        
+    elif format_type == "csv":
+        df.to_csv(file_name, index=False)
+    else:
+        df.to_excel(file_name, index=False)
+    
+    return file_name
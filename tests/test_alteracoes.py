@@ -0,0 +1,138 @@
+"""Log de alterações: get_changes_since e aplicação do delta na tabela paginada.
+
+Uso: python -m pytest tests (ou python -m unittest discover tests)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRETORIO))
+
+from database import DatabaseManager
+
+try:
+    from modelos import ModeloProdutos
+except ImportError:  # PyQt5 ausente
+    ModeloProdutos = None
+
+def _produto(nome, lote='LT-1', validade='01/01/2030'):
+    return (nome, lote, 123, 1, '01/01/2024', '01/01/2024', validade)
+
+class BancoTemporario(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp(prefix='torp_teste_')
+        self.db = DatabaseManager(os.path.join(self.pasta, 'teste.db'))
+
+    def tearDown(self):
+        self.db.fechar()
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def inserir(self, *nomes):
+        return [self.db.adicionar_produto(*_produto(nome))[0] for nome in nomes]
+
+class TesteGetChangesSince(BancoTemporario):
+    def test_resume_uma_entrada_por_produto(self):
+        editado, excluido, intacto = self.inserir('A', 'B', 'C')
+        seq = self.db.ultima_alteracao()
+
+        novo, = self.inserir('D')
+        self.db.atualizar_produto(editado, 'A1', 'LT-1', 123, 1, None, None, None)
+        self.db.atualizar_produto(editado, 'A2', 'LT-1', 123, 1, None, None, None)
+        self.db.excluir_produto(excluido)
+        efemero, = self.inserir('E')
+        self.db.excluir_produto(efemero)
+
+        ultimo_seq, alteracoes = self.db.get_changes_since(seq)
+        self.assertEqual(ultimo_seq, self.db.ultima_alteracao())
+        por_id = {produto_id: (operacao, linha) for produto_id, operacao, linha in alteracoes}
+        self.assertEqual(len(por_id), len(alteracoes))
+
+        self.assertEqual(por_id[novo][0], 'I')
+        self.assertEqual(por_id[novo][1][1], 'D')
+        # Duas edições viram uma, com a linha atual
+        self.assertEqual(por_id[editado][0], 'U')
+        self.assertEqual(por_id[editado][1][1], 'A2')
+        self.assertEqual(por_id[excluido], ('D', None))
+        # Incluído e excluído no intervalo: não aparece
+        self.assertNotIn(efemero, por_id)
+        self.assertNotIn(intacto, por_id)
+
+    def test_sem_alteracoes(self):
+        self.inserir('A')
+        seq = self.db.ultima_alteracao()
+        self.assertEqual(self.db.get_changes_since(seq), (seq, []))
+
+    def test_intervalo_limpo_pede_recarga(self):
+        self.inserir('A', 'B')
+        antigo = self.db.ultima_alteracao()
+        self.inserir('C')
+        atual = self.db.ultima_alteracao()
+        self.inserir('D')
+
+        self.assertTrue(self.db.limpar_alteracoes(atual))
+        # Quem leu até 'atual' continua recebendo o delta
+        _ultimo, alteracoes = self.db.get_changes_since(atual)
+        self.assertEqual([linha[1] for _id, _op, linha in alteracoes], ['D'])
+        # Quem ficou antes do ponto limpo precisa recarregar
+        self.assertIsNone(self.db.get_changes_since(antigo)[1])
+
+@unittest.skipIf(ModeloProdutos is None, "PyQt5 não instalado")
+class TesteModeloAplicarAlteracoes(BancoTemporario):
+    TAMANHO_PAGINA = 2
+
+    def setUp(self):
+        super().setUp()
+        self.ids = self.inserir('A', 'B', 'C', 'D', 'E')
+        self.modelo = ModeloProdutos(self._buscar_pagina, self.TAMANHO_PAGINA)
+        # Primeira página e sequência lidas juntas, como em MainWindow.carregar_produtos
+        self.seq = self.db.ultima_alteracao()
+        self.modelo.definir_linhas(self.db.carregar_pagina(0, self.TAMANHO_PAGINA), paginado=True)
+
+    def _buscar_pagina(self, apos_id, limite, ao_receber, ao_falhar):
+        # Síncrono: a página chega antes de fetchMore/completar retornarem
+        ao_receber(self.db.carregar_pagina(apos_id, limite))
+
+    def aplicar_delta(self):
+        self.seq, alteracoes = self.db.get_changes_since(self.seq)
+        self.modelo.aplicar_alteracoes(alteracoes)
+
+    def nomes(self):
+        return [linha[1] for linha in self.modelo.linhas()]
+
+    def test_edicao_e_exclusao_na_pagina_carregada(self):
+        primeiro, segundo = self.ids[:2]
+        self.db.atualizar_produto(primeiro, 'A1', 'LT-1', 123, 1, None, None, None)
+        self.db.excluir_produto(segundo)
+        self.aplicar_delta()
+        self.assertEqual(self.nomes(), ['A1'])
+        self.assertEqual(self.modelo.posicao(primeiro), 0)
+        self.assertIsNone(self.modelo.posicao(segundo))
+
+    def test_alteracoes_alem_da_pagina_chegam_com_a_leitura(self):
+        self.db.atualizar_produto(self.ids[3], 'D1', 'LT-1', 123, 1, None, None, None)
+        self.db.excluir_produto(self.ids[4])
+        novo, = self.inserir('F')
+        self.aplicar_delta()
+        # Nada além do último id lido entra antes da próxima página
+        self.assertEqual(self.nomes(), ['A', 'B'])
+
+        self.modelo.completar()
+        self.assertTrue(self.modelo.completo())
+        self.assertEqual(self.nomes(), ['A', 'B', 'C', 'D1', 'F'])
+        self.assertEqual(self.modelo.posicao(novo), 4)
+        # Reaplicar o mesmo delta não duplica linhas
+        self.modelo.aplicar_alteracoes([(novo, 'I', self.db.get_produto(novo))])
+        self.assertEqual(self.modelo.rowCount(), 5)
+
+    def test_inclusao_com_tabela_completa(self):
+        self.modelo.completar()
+        novo, = self.inserir('F')
+        self.aplicar_delta()
+        self.assertEqual(self.nomes(), ['A', 'B', 'C', 'D', 'E', 'F'])
+        self.assertEqual(self.modelo.posicao(novo), 5)
+
+if __name__ == '__main__':
+    unittest.main()
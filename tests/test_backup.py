@@ -0,0 +1,149 @@
+"""Repositório de backups: criação, retenção com coleta de objetos e restauração.
+
+Uso: python -m pytest tests (ou python -m unittest discover tests)
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRETORIO))
+
+import backup
+from backup import ErroBackup, RepositorioBackup
+from database import DatabaseManager
+
+class _Relogio(datetime):
+    """datetime.now() que avança uma hora a cada chamada (ids e retenção distintos)"""
+    atual = datetime(2024, 1, 1, 8, 0, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        cls.atual += timedelta(hours=1)
+        return cls.atual
+
+class TesteRepositorioBackup(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp(prefix='torp_teste_')
+        self.db = DatabaseManager(os.path.join(self.pasta, 'teste.db'))
+        # Só os 2 backups mais recentes ficam
+        self.repositorio = RepositorioBackup(
+            os.path.join(self.pasta, 'repositorio'), ultimos=2, horarios=0, diarios=0, semanais=0)
+        relogio = mock.patch.object(backup, 'datetime', _Relogio)
+        relogio.start()
+        self.addCleanup(relogio.stop)
+
+    def tearDown(self):
+        self.db.fechar()
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def conteudo(self, db=None):
+        return (db or self.db).carregar_produtos()
+
+    def contar_objetos(self):
+        conn = sqlite3.connect(self.repositorio.caminho_objetos)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM objetos').fetchone()[0]
+        finally:
+            conn.close()
+
+    def fazer_backup(self, quantidade):
+        self.db.adicionar_produtos_em_lote(
+            [(f'PRODUTO {i}', f'LT-{i}', i, 1, None, None, '01/01/2030') for i in range(quantidade)])
+        entrada = self.db.backup_incremental(self.repositorio, tipo='teste')
+        return entrada, self.conteudo()
+
+    def restaurar(self, backup_id):
+        destino = os.path.join(self.pasta, f'{backup_id}.db')
+        self.repositorio.restaurar_para_arquivo(backup_id, destino)
+        restaurado = DatabaseManager(destino)
+        try:
+            return self.conteudo(restaurado)
+        finally:
+            restaurado.fechar()
+
+    def test_backup_incremental_grava_so_paginas_novas(self):
+        primeiro, _ = self.fazer_backup(200)
+        segundo, _ = self.fazer_backup(1)
+        self.assertEqual(primeiro['paginas_novas'], primeiro['paginas'])
+        self.assertLess(segundo['paginas_novas'], segundo['paginas'])
+        self.assertEqual(segundo['seq_alteracoes'], self.db.ultima_alteracao())
+
+    def test_retencao_coleta_objetos_e_preserva_restantes(self):
+        antigo, _ = self.fazer_backup(300)
+        medio, dados_medio = self.fazer_backup(300)
+        objetos_antes = self.contar_objetos()
+        # Exclui linhas do começo: páginas só do primeiro backup deixam de ser usadas
+        with self.db.transacao() as conn:
+            conn.execute('DELETE FROM produtos WHERE id <= 150')
+        novo, dados_novo = self.fazer_backup(0)
+
+        ids = [b['id'] for b in self.repositorio.listar_backups()]
+        self.assertEqual(ids, [novo['id'], medio['id']])
+        self.assertLess(self.contar_objetos(), objetos_antes + novo['paginas_novas'] + 1)
+        with self.assertRaises(ErroBackup):
+            self.repositorio.restaurar_para_arquivo(antigo['id'], os.path.join(self.pasta, 'x.db'))
+
+        # Páginas compartilhadas com o backup removido continuam disponíveis
+        self.assertEqual(self.restaurar(medio['id']), dados_medio)
+        self.assertEqual(self.restaurar(novo['id']), dados_novo)
+
+    def test_retencao_sem_remocao_nao_coleta(self):
+        self.fazer_backup(10)
+        with mock.patch.object(RepositorioBackup, '_coletar_objetos') as coletar:
+            self.fazer_backup(10)
+        coletar.assert_not_called()
+
+    def test_importados_continuam_registrados_apos_retencao(self):
+        antigos = []
+        for i in range(3):
+            caminho = os.path.join(self.pasta, f'antigo_{i}.db')
+            shutil.copyfile(self.db.db_path, caminho)
+            os.utime(caminho, (1_600_000_000 + i * 3600,) * 2)
+            self.repositorio.importar_arquivo(caminho, tipo='importado')
+            antigos.append(os.path.basename(caminho))
+        self.fazer_backup(1)
+        self.fazer_backup(1)
+
+        # Nenhum importado sobrou no manifesto, mas nenhum volta a ser importado
+        self.assertFalse(any('arquivo_origem' in b for b in self.repositorio.listar_backups()))
+        self.assertEqual(self.repositorio.arquivos_importados(), set(antigos))
+
+    def test_repositorio_travado_por_outro_processo(self):
+        entrada, _ = self.fazer_backup(10)
+        # Outro processo no meio de um backup ou de uma coleta
+        outro = sqlite3.connect(self.repositorio.caminho_trava, isolation_level=None)
+        outro.execute('BEGIN EXCLUSIVE')
+        self.addCleanup(outro.close)
+        self.repositorio.espera_trava = 0.1
+
+        with self.assertRaises(ErroBackup):
+            self.fazer_backup(1)
+        with self.assertRaises(ErroBackup):
+            self.repositorio.aplicar_retencao()
+        with self.assertRaises(ErroBackup):
+            self.repositorio.restaurar_para_arquivo(entrada['id'], os.path.join(self.pasta, 'x.db'))
+        self.assertEqual([b['id'] for b in self.repositorio.listar_backups()], [entrada['id']])
+        # Nenhum snapshot temporário ficou para trás
+        self.assertFalse([nome for nome in os.listdir(self.repositorio.raiz) if nome.startswith('snapshot')])
+
+        outro.rollback()
+        self.fazer_backup(1)
+        self.assertEqual(len(self.repositorio.listar_backups()), 2)
+
+    def test_restaurar_no_banco_em_uso(self):
+        entrada, dados = self.fazer_backup(100)
+        self.db.adicionar_produto('DEPOIS DO BACKUP', 'LT', 1, 1, None, None, None)
+
+        destino = os.path.join(self.pasta, 'restaurar.db')
+        self.repositorio.restaurar_para_arquivo(entrada['id'], destino)
+        self.db.restaurar(destino)
+        self.assertEqual(self.conteudo(), dados)
+
+if __name__ == '__main__':
+    unittest.main()
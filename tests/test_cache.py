@@ -0,0 +1,135 @@
+"""Cache de produtos: páginas, contagem por status e validação por PRAGMA data_version.
+
+Uso: python -m pytest tests (ou python -m unittest discover tests)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRETORIO))
+
+import database
+from database import DatabaseManager, STATUS_NORMAL, STATUS_VENCIDO
+
+def _produto(nome, validade='01/01/2030'):
+    return (nome, 'LT-1', 123, 1, None, None, validade)
+
+class TesteCacheProdutos(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp(prefix='torp_teste_')
+        self.caminho = os.path.join(self.pasta, 'teste.db')
+        self.db = DatabaseManager(self.caminho)
+        self.ids = [self.db.adicionar_produto(*_produto(nome))[0] for nome in 'ABCDE']
+
+    def tearDown(self):
+        self.db.fechar()
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def consultas(self, funcao, *argumentos):
+        """(resultado, consultas de produtos feitas ao banco) de funcao(*argumentos)"""
+        conn = self.db.conexao()
+        consultas = []
+        original = conn.execute
+
+        class Espiao:
+            def __getattr__(self, nome):
+                return getattr(conn, nome)
+
+            def execute(self, sql, *parametros):
+                if 'vw_produtos' in sql or 'FROM produtos' in sql:
+                    consultas.append(sql)
+                return original(sql, *parametros)
+
+        with mock.patch.object(self.db.conexoes, 'conexao', return_value=Espiao()):
+            resultado = funcao(*argumentos)
+        return resultado, consultas
+
+    def ler_sem_banco(self, funcao, *argumentos):
+        resultado, consultas = self.consultas(funcao, *argumentos)
+        self.assertEqual(consultas, [])
+        return resultado
+
+    def nomes(self, linhas):
+        return [linha[1] for linha in linhas]
+
+    def test_paginas_lidas_voltam_do_cache(self):
+        primeira = self.db.carregar_pagina(0, 2)
+        segunda = self.db.carregar_pagina(primeira[-1][0], 2)
+        self.assertEqual(self.ler_sem_banco(self.db.carregar_pagina, 0, 2), primeira)
+        self.assertEqual(self.ler_sem_banco(self.db.carregar_pagina, primeira[-1][0], 2), segunda)
+        self.assertEqual(self.nomes(self.ler_sem_banco(self.db.get_produtos, self.ids[:4])),
+                         ['A', 'B', 'C', 'D'])
+        # Fim da tabela: a página curta marca o cache como completo
+        self.db.carregar_pagina(segunda[-1][0], 2)
+        self.assertEqual(self.nomes(self.ler_sem_banco(self.db.carregar_pagina, self.ids[1], -1)),
+                         ['C', 'D', 'E'])
+        self.assertEqual(self.ler_sem_banco(self.db.get_produtos, [999]), [])
+
+        contagem = self.db.contar_por_status()
+        self.assertEqual(self.ler_sem_banco(self.db.contar_por_status), contagem)
+
+    def test_escritas_locais_atualizam_o_cache(self):
+        self.db.carregar_produtos()
+        self.db.contar_por_status()
+        self.db.atualizar_produto(self.ids[0], 'A1', 'LT-1', 123, 1, None, None, '01/01/2000')
+        self.db.excluir_produto(self.ids[1])
+        novo = self.db.adicionar_produto(*_produto('F'))[0]
+        self.db.adicionar_produtos_em_lote([_produto('G'), _produto('H')])
+
+        self.assertEqual(self.nomes(self.ler_sem_banco(self.db.carregar_pagina, 0, 10)),
+                         ['A1', 'C', 'D', 'E', 'F', 'G', 'H'])
+        self.assertEqual(self.ler_sem_banco(self.db.get_produto, novo)[1], 'F')
+        # A contagem é refeita depois de uma escrita
+        contagem = self.db.contar_por_status()
+        self.assertEqual(contagem[STATUS_VENCIDO], 1)
+        self.assertEqual(contagem[STATUS_NORMAL], 6)
+
+    def test_escrita_de_outro_processo_chega_pelo_log(self):
+        self.assertEqual(self.nomes(self.db.carregar_pagina(0, 10)), ['A', 'B', 'C', 'D', 'E'])
+        self.db.contar_por_status()
+
+        outro = DatabaseManager(self.caminho)
+        try:
+            outro.atualizar_produto(self.ids[2], 'C1', 'LT-1', 123, 1, None, None, '01/01/2000')
+            outro.excluir_produto(self.ids[3])
+            outro.adicionar_produto(*_produto('F'))
+        finally:
+            outro.fechar()
+
+        self.assertEqual(self.nomes(self.db.carregar_pagina(0, 10)), ['A', 'B', 'C1', 'E', 'F'])
+        self.assertEqual(self.db.contar_por_status()[STATUS_VENCIDO], 1)
+
+    def test_log_limpo_recomeca_o_cache(self):
+        self.db.carregar_pagina(0, 10)
+        outro = DatabaseManager(self.caminho)
+        try:
+            outro.atualizar_produto(self.ids[0], 'A1', 'LT-1', 123, 1, None, None, None)
+            outro.limpar_alteracoes(outro.ultima_alteracao())
+        finally:
+            outro.fechar()
+        self.assertEqual(self.nomes(self.db.carregar_pagina(0, 10)), ['A1', 'B', 'C', 'D', 'E'])
+
+    def test_virada_do_dia_recomeca_o_cache(self):
+        self.db.carregar_pagina(0, 10)
+        self.db.contar_por_status()
+
+        class Amanha(date):
+            @classmethod
+            def today(cls):
+                return date.today() + timedelta(days=1)
+
+        with mock.patch.object(database, 'date', Amanha):
+            pagina, consultas = self.consultas(self.db.carregar_pagina, 0, 10)
+            _contagem, consultas_contagem = self.consultas(self.db.contar_por_status)
+        # Status e dias restantes mudam com a data: tudo é lido de novo
+        self.assertEqual(self.nomes(pagina), ['A', 'B', 'C', 'D', 'E'])
+        self.assertTrue(consultas)
+        self.assertTrue(consultas_contagem)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Inclusão em lote: linhas inválidas são puladas sem abortar o lote.
+
+Uso: python -m pytest tests (ou python -m unittest discover tests)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRETORIO))
+
+from database import DatabaseManager
+
+class TesteInsercaoEmLote(unittest.TestCase):
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp(prefix='torp_teste_')
+        self.db = DatabaseManager(os.path.join(self.pasta, 'teste.db'))
+
+    def tearDown(self):
+        self.db.fechar()
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def test_linhas_invalidas_nao_abortam_o_lote(self):
+        inseridos, erros = self.db.adicionar_produtos_em_lote([
+            ('LUVA', 'LT-1', 123, 10, '01/02/2024', None, '01/02/2030'),
+            # Data como número de série de planilha
+            ('CAPACETE', 'LT-2', 123, 1, 45000, None, None),
+            ('', 'LT-3', 123, 1, None, None, None),
+            ('BOTA', 'LT-4', None, 'dez', None, None, None),
+            {'nome': 'ÓCULOS', 'lote': 'LT-5', 'ca': '', 'quantidade': 2,
+             'data_validade': date(2030, 5, 1)},
+        ])
+        self.assertEqual(inseridos, 2)
+        self.assertEqual([indice for indice, _mensagem in erros], [1, 2, 3])
+        produtos = self.db.carregar_produtos()
+        self.assertEqual([p[1] for p in produtos], ['LUVA', 'ÓCULOS'])
+        self.assertEqual(produtos[1][8], '2030-05-01')
+
+    def test_busca_textual_encontra_linhas_do_lote(self):
+        if not self.db.busca_textual_disponivel():
+            self.skipTest("SQLite sem FTS5")
+        self.db.adicionar_produto('LUVA NITRÍLICA', 'LT-0', 1, 1, None, None, None)
+        self.db.adicionar_produtos_em_lote(
+            [(f'LUVA {i}', f'LT-{i}', i, 1, None, None, None) for i in range(1, 51)]
+            + [('BOTA', 'LT-X', 1, 1, None, None, None)])
+        # Inclusão avulsa depois do lote: o trigger voltou a indexar
+        self.db.adicionar_produto('LUVA AVULSA', 'LT-99', 1, 1, None, None, None)
+
+        self.assertEqual(len(self.db.buscar_produtos('luva', limite=None)), 52)
+        bota, = self.db.buscar_produtos('bota')
+        self.assertEqual(self.db.get_produto(bota)[2], 'LT-X')
+        # Índice íntegro: nenhuma linha indexada duas vezes
+        conn = self.db.conexao()
+        conn.execute("INSERT INTO produtos_fts (produtos_fts) VALUES ('integrity-check')")
+
+if __name__ == '__main__':
+    unittest.main()
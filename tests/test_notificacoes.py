@@ -0,0 +1,150 @@
+"""Fila de avisos por e-mail: resumo por destinatário, sessão única e novas tentativas.
+
+Uso: python -m pytest tests (ou python -m unittest discover tests)
+"""
+import os
+import smtplib
+import sys
+import threading
+import unittest
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRETORIO))
+
+from notificacoes import Aviso, FilaNotificacoes
+
+class ServidorFalso:
+    """Registra sessões e mensagens; falhas_envio faz os próximos envios falharem"""
+
+    def __init__(self, falhas_envio=0):
+        self.falhas_envio = falhas_envio
+        self.sessoes = []
+        self.entregues = []
+
+    def __call__(self):
+        sessao = SessaoFalsa(self)
+        self.sessoes.append(sessao)
+        return sessao
+
+class SessaoFalsa:
+    def __init__(self, servidor):
+        self.servidor = servidor
+        self.tls = False
+        self.usuario = None
+        self.encerrada = False
+
+    def starttls(self, context=None):
+        self.tls = True
+
+    def login(self, usuario, senha):
+        self.usuario = usuario
+
+    def send_message(self, mensagem):
+        if self.servidor.falhas_envio:
+            self.servidor.falhas_envio -= 1
+            raise smtplib.SMTPServerDisconnected("conexão perdida")
+        self.servidor.entregues.append(mensagem)
+
+    def quit(self):
+        self.encerrada = True
+
+    def close(self):
+        self.encerrada = True
+
+class EsperaRegistrada(threading.Event):
+    """Event do encerramento que anota as esperas entre tentativas sem dormir"""
+
+    def __init__(self):
+        super().__init__()
+        self.esperas = []
+
+    def wait(self, timeout=None):
+        self.esperas.append(timeout)
+        return self.is_set()
+
+def _aviso(destinatario, nome, lote, status='Vencido'):
+    return Aviso(destinatario, 1, nome, lote, '2024-01-31', status)
+
+class TesteFilaNotificacoes(unittest.TestCase):
+    def criar_fila(self, servidor, **opcoes):
+        fila = FilaNotificacoes('remetente@torp.ind.br', 'senha', smtp_factory=servidor,
+                                espera_inicial=2.0, **opcoes)
+        fila._parar = EsperaRegistrada()
+        return fila
+
+    def enviar(self, fila, *avisos):
+        for aviso in avisos:
+            fila.enfileirar(aviso)
+        # encerrar() envia o que está na fila sem esperar o agrupamento
+        fila.encerrar()
+
+    def test_um_resumo_por_destinatario_numa_sessao(self):
+        servidor = ServidorFalso()
+        fila = self.criar_fila(servidor)
+        self.enviar(fila,
+                    _aviso('a@torp.ind.br', 'LUVA', 'LT-1'),
+                    _aviso('b@torp.ind.br', 'BOTA', 'LT-2'),
+                    _aviso('a@torp.ind.br', 'CAPACETE', 'LT-3', status='Próximo do vencimento'))
+
+        self.assertEqual(len(servidor.sessoes), 1)
+        sessao, = servidor.sessoes
+        self.assertTrue(sessao.tls)
+        self.assertEqual(sessao.usuario, 'remetente@torp.ind.br')
+        self.assertTrue(sessao.encerrada)
+
+        por_destinatario = {mensagem['To']: mensagem for mensagem in servidor.entregues}
+        self.assertEqual(sorted(por_destinatario), ['a@torp.ind.br', 'b@torp.ind.br'])
+        resumo = por_destinatario['a@torp.ind.br']
+        self.assertIn('2 lote(s)', resumo['Subject'])
+        corpo = resumo.get_content()
+        self.assertIn('CAPACETE (Lote: LT-3) - validade 31/01/2024', corpo)
+        self.assertIn('LUVA (Lote: LT-1)', corpo)
+        self.assertNotIn('BOTA', corpo)
+        self.assertEqual((fila.enviados, fila.falhas), (3, 0))
+
+    def test_falha_transitoria_repete_com_espera_exponencial(self):
+        servidor = ServidorFalso(falhas_envio=2)
+        fila = self.criar_fila(servidor)
+        self.enviar(fila, _aviso('a@torp.ind.br', 'LUVA', 'LT-1'))
+
+        # Uma sessão nova por tentativa, com espera dobrando entre elas
+        self.assertEqual(len(servidor.sessoes), 3)
+        self.assertEqual(fila._parar.esperas, [2.0, 4.0])
+        self.assertTrue(all(sessao.encerrada for sessao in servidor.sessoes))
+        # O aviso continua pendente até ser entregue, e é entregue uma vez só
+        self.assertEqual([mensagem['To'] for mensagem in servidor.entregues], ['a@torp.ind.br'])
+        self.assertEqual((fila.enviados, fila.falhas), (1, 0))
+
+    def test_tentativa_seguinte_nao_reenvia_o_que_ja_foi(self):
+        servidor = ServidorFalso()
+        fila = self.criar_fila(servidor)
+        original = SessaoFalsa.send_message
+
+        def falhar_no_segundo(sessao, mensagem):
+            if len(servidor.sessoes) == 1 and servidor.entregues:
+                raise smtplib.SMTPServerDisconnected("conexão perdida")
+            original(sessao, mensagem)
+
+        SessaoFalsa.send_message = falhar_no_segundo
+        self.addCleanup(setattr, SessaoFalsa, 'send_message', original)
+        self.enviar(fila,
+                    _aviso('a@torp.ind.br', 'LUVA', 'LT-1'),
+                    _aviso('b@torp.ind.br', 'BOTA', 'LT-2'))
+
+        self.assertEqual(len(servidor.sessoes), 2)
+        self.assertEqual(sorted(mensagem['To'] for mensagem in servidor.entregues),
+                         ['a@torp.ind.br', 'b@torp.ind.br'])
+        self.assertEqual((fila.enviados, fila.falhas), (2, 0))
+
+    def test_desiste_depois_das_tentativas(self):
+        servidor = ServidorFalso(falhas_envio=10)
+        fila = self.criar_fila(servidor, tentativas=3)
+        self.enviar(fila, _aviso('a@torp.ind.br', 'LUVA', 'LT-1'))
+
+        self.assertEqual(len(servidor.sessoes), 3)
+        self.assertEqual(fila._parar.esperas, [2.0, 4.0])
+        self.assertEqual(servidor.entregues, [])
+        self.assertEqual((fila.enviados, fila.falhas), (0, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import heapq
+import logging
+import threading
+from datetime import date, datetime, timedelta
+
+from database import (
+    STATUS_NORMAL, STATUS_PROXIMO_VENCIMENTO, STATUS_VENCIDO, DIAS_AVISO_VENCIMENTO
+)
+
+logger = logging.getLogger(__name__)
+
+def eventos_da_validade(data_validade, hoje):
+    """Mudanças de status ainda por vir para uma data de validade, como [(dia, status)].
+
+    Mesma regra da view vw_produtos: o lote fica "Próximo do Vencimento"
+    DIAS_AVISO_VENCIMENTO dias antes da validade e "Vencido" no dia seguinte a ela.
+    """
+    if not data_validade:
+        return []
+    validade = date.fromisoformat(data_validade)
+    eventos = [
+        (validade - timedelta(days=DIAS_AVISO_VENCIMENTO), STATUS_PROXIMO_VENCIMENTO),
+        (validade + timedelta(days=1), STATUS_VENCIDO),
+    ]
+    return [(dia, status) for dia, status in eventos if dia > hoje]
+
+def _status_antes(status_novo):
+    # Status de onde o lote sai ao cruzar o limite que leva a status_novo
+    if status_novo == STATUS_VENCIDO:
+        return STATUS_PROXIMO_VENCIMENTO
+    return STATUS_NORMAL
+
+class AgendadorValidade:
+    """Fila de prioridade (min-heap) das próximas mudanças de status dos lotes.
+
+    Cada entrada é (dia, id, data_validade, novo_status). Só entram lotes
+    ainda não vencidos, então a virada do dia consulta apenas o topo do heap
+    em vez de percorrer a tabela. Alterar ou excluir um lote não remove
+    suas entradas antigas: elas são descartadas ao sair do heap quando a
+    data_validade registrada não confere mais (remoção preguiçosa).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []
+        # data_validade atual de cada lote com eventos pendentes
+        self._validades = {}
+        self.hoje = None
+
+    def carregar(self, validades, hoje=None):
+        """Monta o heap a partir de [(id, data_validade), ...] dos lotes não vencidos"""
+        hoje = hoje or datetime.now().date()
+        heap = []
+        registradas = {}
+        for produto_id, data_validade in validades:
+            try:
+                eventos = eventos_da_validade(data_validade, hoje)
+            except ValueError:
+                logger.warning("Data de validade inválida no produto %s: %r", produto_id, data_validade)
+                continue
+            if eventos:
+                registradas[produto_id] = data_validade
+                heap.extend((dia, produto_id, data_validade, status) for dia, status in eventos)
+        # heapify é O(n), mais barato que n inserções
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+            self._validades = registradas
+            self.hoje = hoje
+
+    def atualizar(self, produto_id, data_validade):
+        """Registra a data_validade nova de um lote incluído ou alterado"""
+        with self._lock:
+            hoje = self.hoje or datetime.now().date()
+            if self._validades.get(produto_id) == data_validade:
+                return
+            try:
+                eventos = eventos_da_validade(data_validade, hoje)
+            except ValueError:
+                eventos = []
+            if not eventos:
+                self._validades.pop(produto_id, None)
+                return
+            self._validades[produto_id] = data_validade
+            for dia, status in eventos:
+                heapq.heappush(self._heap, (dia, produto_id, data_validade, status))
+
+    def remover(self, produto_id):
+        """Descarta os eventos de um lote excluído"""
+        with self._lock:
+            self._validades.pop(produto_id, None)
+
+    def _descartar_obsoletos(self):
+        while self._heap and self._validades.get(self._heap[0][1]) != self._heap[0][2]:
+            heapq.heappop(self._heap)
+
+    def proximo_dia(self):
+        """Dia do próximo evento válido, ou None"""
+        with self._lock:
+            self._descartar_obsoletos()
+            return self._heap[0][0] if self._heap else None
+
+    def avancar(self, hoje=None):
+        """Retira os eventos com dia <= hoje e devolve {id: (status_anterior, status_novo)}.
+
+        Se um lote cruzou os dois limites de uma vez (computador desligado
+        por vários dias), aparece uma única vez, de Normal para Vencido.
+        """
+        hoje = hoje or datetime.now().date()
+        mudancas = {}
+        with self._lock:
+            self.hoje = hoje
+            while True:
+                self._descartar_obsoletos()
+                if not self._heap or self._heap[0][0] > hoje:
+                    break
+                _dia, produto_id, data_validade, status = heapq.heappop(self._heap)
+                anterior = mudancas[produto_id][0] if produto_id in mudancas else _status_antes(status)
+                mudancas[produto_id] = (anterior, status)
+                if status == STATUS_VENCIDO:
+                    # Nenhum evento depois do vencimento
+                    self._validades.pop(produto_id, None)
+        return mudancas
+
+    def __len__(self):
+        return len(self._heap)
+
+def transferir_contagem(contagem, status_anterior, status_novo):
+    """Atualiza {status: quantidade} para um lote que mudou de status"""
+    if status_anterior == status_novo:
+        return
+    contagem[status_anterior] = contagem.get(status_anterior, 0) - 1
+    contagem[status_novo] = contagem.get(status_novo, 0) + 1
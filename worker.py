@@ -0,0 +1,116 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, pyqtSignal
+import instrumentacao
+
+logger = logging.getLogger(__name__)
+
+class Tarefa:
+    """Uma chamada enviada ao DatabaseWorker"""
+
+    def __init__(self, chave, ao_concluir, ao_falhar):
+        self.chave = chave
+        self.ao_concluir = ao_concluir
+        self.ao_falhar = ao_falhar
+        self.future = None
+        # Sinalizado em cancelar(); funções longas podem consultá-lo entre etapas
+        self.cancelamento = threading.Event()
+        self.enviada = instrumentacao.iniciar()
+
+    def cancelar(self):
+        """Cancela a tarefa: se ainda não começou não roda, se já começou o resultado é descartado"""
+        self.cancelamento.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def cancelada(self):
+        return self.cancelamento.is_set()
+
+class DatabaseWorker(QObject):
+    """Executa acesso ao banco e E/S de arquivos numa thread dedicada.
+
+    As tarefas rodam uma de cada vez, na ordem de envio, e os callbacks são
+    chamados na thread da interface, na mesma ordem. Uma tarefa enviada com
+    a mesma chave de outra ainda pendente cancela a anterior (útil para
+    filtros digitados e recargas da tabela).
+    """
+
+    _finalizada = pyqtSignal(object)
+    # (etapa, feito, total) emitido pela thread de trabalho
+    progresso = pyqtSignal(str, int, int)
+
+    def __init__(self, parent=None, nome='db-worker'):
+        super().__init__(parent)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=nome)
+        self._pendentes = {}
+        # O QObject vive na thread da interface: o sinal emitido pela thread
+        # de trabalho é entregue por fila no loop de eventos do Qt
+        self._finalizada.connect(self._entregar)
+
+    def executar(self, funcao, *args, ao_concluir=None, ao_falhar=None, chave=None,
+                 cancelavel=False, **kwargs):
+        """Agenda funcao(*args, **kwargs) e devolve a Tarefa.
+
+        Com cancelavel=True a função recebe o argumento cancelar (um
+        threading.Event) para interromper trabalhos longos.
+        """
+        tarefa = Tarefa(chave, ao_concluir, ao_falhar)
+        if cancelavel:
+            kwargs['cancelar'] = tarefa.cancelamento
+        if chave is not None:
+            anterior = self._pendentes.get(chave)
+            if anterior is not None:
+                anterior.cancelar()
+                instrumentacao.contar('worker.substituidas')
+            self._pendentes[chave] = tarefa
+
+        instrumentacao.contar('worker.tarefas')
+        tarefa.future = self._executor.submit(self._rodar, tarefa, funcao, args, kwargs)
+        tarefa.future.add_done_callback(lambda _future: self._finalizada.emit(tarefa))
+        return tarefa
+
+    def _rodar(self, tarefa, funcao, args, kwargs):
+        if tarefa.cancelada():
+            return None
+        if tarefa.enviada is None:
+            return funcao(*args, **kwargs)
+        # Instrumentação ligada: tempo na fila e tempo de execução por chave
+        instrumentacao.finalizar('worker.espera', tarefa.enviada)
+        inicio = instrumentacao.iniciar()
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            nome = tarefa.chave or getattr(funcao, '__name__', 'tarefa')
+            instrumentacao.finalizar(f'worker.{nome}', inicio)
+
+    def _entregar(self, tarefa):
+        if tarefa.chave is not None and self._pendentes.get(tarefa.chave) is tarefa:
+            del self._pendentes[tarefa.chave]
+        if tarefa.cancelada() or tarefa.future.cancelled():
+            return
+
+        erro = tarefa.future.exception()
+        if erro is not None:
+            instrumentacao.contar('worker.falhas')
+            if tarefa.ao_falhar:
+                tarefa.ao_falhar(erro)
+            else:
+                logger.error("Erro em tarefa do banco de dados", exc_info=erro)
+            return
+        if tarefa.ao_concluir:
+            tarefa.ao_concluir(tarefa.future.result())
+
+    def ocupado(self, chave):
+        """Indica se há tarefa pendente ou em execução com a chave"""
+        return chave in self._pendentes
+
+    def informar_progresso(self, etapa, feito, total):
+        """Pode ser chamado dentro de uma tarefa; o sinal chega na thread da interface"""
+        self.progresso.emit(etapa, feito, total)
+
+    def encerrar(self, esperar=True):
+        """Cancela as tarefas pendentes e aguarda a que está em execução"""
+        for tarefa in list(self._pendentes.values()):
+            tarefa.cancelar()
+        self._executor.shutdown(wait=esperar, cancel_futures=True)